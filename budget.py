@@ -0,0 +1,86 @@
+# budget.py
+# Daily water budget: scales the program volumes by an evapotranspiration
+# factor computed from weather observations pushed to the controller.
+
+import json
+import math
+import time
+
+from tz import localtime
+
+import config
+import store
+from utils import log
+
+
+factor = 1.0
+observation = {}    # last observation used for the factor
+updated = 0         # time.time() of the last observation
+
+
+def load():
+    global factor, observation, updated
+    buf = bytearray(256)
+    try:
+        n = store.get_blob("budget", buf)
+        d = json.loads(buf[:n])
+        factor, observation, updated = d["factor"], d["obs"], d["ts"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+
+def _ra_mm(yday):
+    """Extraterrestrial radiation for the configured latitude, in mm/day."""
+    phi = math.radians(config.BUDGET_LATITUDE)
+    x = 2 * math.pi * yday / 365
+    dr = 1 + 0.033 * math.cos(x)
+    decl = 0.409 * math.sin(x - 1.39)
+    ws = math.acos(max(-1.0, min(1.0, -math.tan(phi) * math.tan(decl))))
+    ra = 24 * 60 / math.pi * 0.082 * dr * (
+        ws * math.sin(phi) * math.sin(decl) + math.cos(phi) * math.cos(decl) * math.sin(ws))
+    return 0.408 * ra
+
+
+def et0(tmin, tmax, yday):
+    """Hargreaves reference evapotranspiration, mm/day."""
+    tmean = (tmin + tmax) / 2
+    return 0.0023 * (tmean + 17.8) * math.sqrt(max(0, tmax - tmin)) * _ra_mm(yday)
+
+
+def update(obs):
+    """Compute the factor from {"tmin", "tmax", "rain"} (C, C, mm).
+
+    "temp" from a local sensor, if given, replaces the missing tmin or tmax.
+    Raises ValueError on bad input.
+    """
+    global factor, observation, updated
+    try:
+        temp = obs.get("temp")
+        tmin = float(obs["tmin"] if "tmin" in obs else temp)
+        tmax = float(obs["tmax"] if "tmax" in obs else temp)
+        rain = float(obs.get("rain", 0))
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError
+    if tmin > tmax or rain < 0:
+        raise ValueError
+    et = et0(tmin, tmax, localtime()[7])
+    net = max(0, et - rain * config.BUDGET_RAIN_EFF)
+    factor = max(config.BUDGET_MIN, min(config.BUDGET_MAX, net / config.BUDGET_REF_ET_MM))
+    observation = {"tmin": tmin, "tmax": tmax, "rain": rain, "et0": round(et, 2)}
+    updated = time.time()
+    store.set_blob("budget", json.dumps({"factor": factor, "obs": observation, "ts": updated}))
+    log("INFO", f"Water budget: ET0={et:.2f}mm rain={rain}mm factor={factor:.2f}")
+
+
+def current():
+    """Factor to apply now; stale observations fall back to 1.0."""
+    if not updated or time.time() - updated > config.BUDGET_MAX_AGE_S:
+        return 1.0
+    return factor
+
+
+def scale(program):
+    f = current()
+    if f == 1.0:
+        return program
+    return {k: int(ml * f) if ml else ml for k, ml in program.items()}
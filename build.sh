@@ -0,0 +1,38 @@
+#!/bin/bash
+# Cross-compile the application to .mpy bytecode and upload it.
+#   ./build.sh          build into ./build
+#   ./build.sh deploy   build and upload with mpremote
+# main.py and config.py stay as source, so the config can still be edited on the device.
+
+set -e
+
+OUT=build
+MPY_CROSS=${MPY_CROSS:-mpy-cross}
+MPREMOTE=${MPREMOTE:-mpremote connect auto}
+APP="logic.py net.py utils.py webapp.py webadmin.py store.py tank.py budget.py moisture.py mqtt.py mem.py dispense.py selftest.py ota.py fleet.py valvebus.py meters.py calib.py netrepl.py indicator.py supervisor.py history.py"
+LIB="lib/aiorepl.py lib/tz.py lib/web.py"
+
+rm -rf "$OUT"
+mkdir -p "$OUT/lib" "$OUT/static"
+for f in $APP; do
+  $MPY_CROSS -O2 -o "$OUT/${f%.py}.mpy" "$f"
+done
+for f in $LIB; do
+  $MPY_CROSS -O2 -o "$OUT/${f%.py}.mpy" "$f"
+done
+cp main.py config.py "$OUT/"
+cp static/* "$OUT/static/"
+echo "Built into $OUT/"
+
+[ "$1" = "deploy" ] || exit 0
+
+# A .py file on the device shadows the .mpy of the same name
+for f in $APP $LIB; do
+  $MPREMOTE fs rm ":$f" 2>/dev/null || true
+done
+$MPREMOTE fs mkdir /lib 2>/dev/null || true
+$MPREMOTE fs mkdir /static 2>/dev/null || true
+$MPREMOTE fs cp "$OUT"/*.mpy "$OUT"/main.py "$OUT"/config.py :
+$MPREMOTE fs cp "$OUT"/lib/*.mpy :lib/
+$MPREMOTE fs cp "$OUT"/static/* :static/
+$MPREMOTE soft-reset
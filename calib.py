@@ -0,0 +1,179 @@
+# calib.py
+# Flow meter calibration curve. Hall-effect meters give more pulses per liter
+# at low flow, so pulses per liter is kept as a curve over the flow rate
+# (pulses/s). Calibration points are measured by dispensing into a container
+# and entering the collected volume; the curve is piecewise linear between
+# points and is expanded into a lookup table, so a zone target costs one
+# table read.
+
+import uasyncio as asyncio
+import json
+from array import array
+
+import config
+import dispense
+import logic
+import store
+from utils import log
+
+points = []         # (rate pulses/s, pulses per liter), sorted by rate
+lut = None          # pulses per liter by rate, see _build()
+rates = {}          # zone -> last seen flow rate, pulses/s
+pending = None      # last calibration run, waiting for the measured volume
+task = None
+
+
+def _build(points):
+    """Expand points into a lookup table, one entry per CALIB_RATE_STEP."""
+    t = array("H", bytes(2 * config.CALIB_LUT_SIZE))
+    for i in range(len(t)):
+        rate = i * config.CALIB_RATE_STEP + config.CALIB_RATE_STEP // 2
+        if not points:
+            ppl = config.PULSES_PER_LITER
+        elif rate <= points[0][0]:
+            ppl = points[0][1]
+        elif rate >= points[-1][0]:
+            ppl = points[-1][1]
+        else:
+            for (r0, p0), (r1, p1) in zip(points, points[1:]):
+                if rate <= r1:
+                    ppl = p0 + (p1 - p0) * (rate - r0) // (r1 - r0)
+                    break
+        t[i] = ppl
+    return t
+
+
+def load():
+    """Load the points from NVS and seed zone rates from the self-test baselines."""
+    global points, lut
+    buf = bytearray(4 * config.CALIB_POINTS)
+    try:
+        n = store.get_blob("calib", buf)
+        a = array("H", buf[:n])
+        points = [(a[i], a[i + 1]) for i in range(0, len(a), 2)]
+    except OSError:
+        points = []
+    lut = _build(points)
+    buf = store.zone_buf(logic.ZONES)
+    try:
+        n = store.get_blob("baseline", buf)
+        for z, r in json.loads(buf[:n]).items():
+            rates.setdefault(int(z), r)
+    except (OSError, ValueError):
+        pass
+
+
+def _save(points):
+    a = array("H")
+    for r, p in points:
+        a.append(r)
+        a.append(p)
+    store.set_blob("calib", bytes(a))
+
+
+def ppl(rate):
+    """Pulses per liter at rate pulses/s."""
+    return lut[min(rate // config.CALIB_RATE_STEP, len(lut) - 1)]
+
+
+def zone_ppl(zone):
+    """Pulses per liter for zone, from its last flow rate."""
+    rate = rates.get(zone)
+    return ppl(rate) if rate else config.PULSES_PER_LITER
+
+
+def zone_ml(zone, pulses):
+    """ml for pulses of the main meter on zone."""
+    return pulses * 1000 // zone_ppl(zone)
+
+
+def observe(zone, pulses, duration_ms):
+    if duration_ms > 0 and pulses > 0:
+        rates[zone] = pulses * 1000 // duration_ms
+
+
+def add_point(measured_ml):
+    """Turn the pending run into a calibration point.
+
+    Returns False without a pending run or with the curve full, raises
+    ValueError for a measured volume that gives an implausible pulses per
+    liter, e.g. liters entered instead of ml.
+    """
+    global pending, points, lut
+    if not pending:
+        return False
+    zone, power, pulses, duration = pending
+    if measured_ml <= 0:
+        raise ValueError("measured volume must be positive")
+    value = pulses * 1000 // measured_ml
+    lo = max(100, config.PULSES_PER_LITER // config.CALIB_MAX_RATIO)
+    hi = min(65535, config.PULSES_PER_LITER * config.CALIB_MAX_RATIO)
+    if not lo <= value <= hi:
+        raise ValueError(f"{value} pulses/l, expected {lo}..{hi}")
+    rate = pulses * 1000 // max(1, duration)
+    # a new point replaces one measured at about the same rate
+    keep = [p for p in points if abs(p[0] - rate) >= config.CALIB_RATE_STEP]
+    if len(keep) >= config.CALIB_POINTS:
+        return False
+    new = sorted(keep + [(rate, value)])
+    t = _build(new)
+    _save(new)
+    points, lut, pending = new, t, None
+    log("INFO", f"Calibration point: {rate} pulses/s, {value} pulses/l")
+    return True
+
+
+def clear():
+    global points, lut, pending
+    points, pending = [], None
+    lut = _build(points)
+    store.set_blob("calib", b"")
+
+
+async def run(zone, power, ml):
+    """Dispense ml (at the nominal PULSES_PER_LITER) from zone at pump power %."""
+    global pending
+    import logic
+    logic.current_state.set(logic.State.RUNNING)
+    log("INFO", f"--- Calibration run: zone {zone}, {ml}ml at {power}% ---")
+    try:
+        logic.set_valve(0)
+        logic.pump.duty(power * 1023 // 100)
+        await asyncio.sleep(config.PUMP_RAMP_UP_TIME_S)
+        dispense.start(zone, ml * config.PULSES_PER_LITER // 1000, ml * config.MIN_FLOW_S_PER_L)
+        while dispense.busy():
+            await asyncio.sleep_ms(10)
+        if dispense.st[dispense.RESULT] == dispense.DONE:
+            pending = (zone, power, dispense.st[dispense.PULSES], dispense.st[dispense.DURATION])
+            log("INFO", f"Calibration run done: {pending[2]} pulses in {pending[3]}ms, enter the measured volume")
+        else:
+            log("WARN", "Calibration run failed, no steady flow")
+    finally:
+        logic.open_valve(0)
+        await asyncio.sleep_ms(500)
+        logic.pump_stop()
+        logic.current_state.set(logic.State.IDLE)
+        logic._kick()
+
+
+def start(zone, power, ml):
+    global task
+    import logic
+    if logic.current_state.get() != logic.State.IDLE:
+        return False
+    task = asyncio.create_task(run(zone, power, ml))
+    return True
+
+
+def status():
+    return {
+        "points": [{"rate": r, "ppl": p} for r, p in points],
+        "pending": pending and {"zone": pending[0], "power": pending[1], "pulses": pending[2], "ms": pending[3]},
+        "lut": list(lut),
+        "rate-step": config.CALIB_RATE_STEP,
+    }
+
+
+# imported on first use (a dispense on the main meter, the tank level or
+# /calibrate), so the curve is loaded right away
+load()
@@ -6,6 +6,22 @@
 SSID = "SSID"
 WLAN_KEY = "PASSWORD"
 WIFI_TIMEOUT = 30000     # max connection time in ms
+WIFI_FAST_TIMEOUT = 5000 # connection time using the cached AP BSSID
+WIFI_CHECK_MS = 2000     # link state check interval
+WIFI_BACKOFF_MIN_MS = 1000
+WIFI_BACKOFF_MAX_MS = 60000
+WIFI_AP_SSID = ""             # fallback AP for config, e.g. "irrigation", "" to disable
+WIFI_AP_KEY = ""              # WPA2 key, at least 8 chars, the AP is not started without it
+WIFI_AP_FALLBACK_S = 300      # start the fallback AP after this long offline
+
+# --- NTP Configuration ---
+NTP_SERVERS = ("pool.ntp.org", "time.google.com")  # "host" or "host:port"
+NTP_TIMEOUT_MS = 2000    # per-server query timeout
+NTP_STEP_MS = 1000       # offsets above this step the RTC, smaller ones are slewed
+NTP_SLEW_MS = 200        # max correction applied per second while slewing
+NTP_MIN_INTERVAL = 900   # sync interval in sec, doubled while the clock stays stable
+NTP_MAX_INTERVAL = 14400
+NTP_DRIFT_MAX_MS = 250   # the interval is kept short enough that the measured drift stays below this
 
 # --- Hardware Pin Assignments ---
 # Define the GPIO pin numbers connected to your hardware.
@@ -15,18 +31,134 @@ RGB_PIN = 5
 PUMP_PIN = 4
 METER_PIN = 20
 # MONITOR_PIN = 0  # For monitoring meter IRQ with a logic analyzer/scope
-VALVE_BUS_PINS = (21, 20, 10, 7) # The 4 pins controlling the valve matrix
+VALVE_DRIVER = "matrix"     # "matrix", "gpio", "595" or "pcf8574"
+VALVE_BUS_PINS = (21, 20, 10, 7) # matrix pins, N pins drive N*(N-1) valves
+VALVE_PINS = ()             # "gpio": one pin per valve
+VALVE_ACTIVE = 1            # "gpio": level that opens a valve
+VALVE_595 = (0, 1, 2, 2)    # "595": data, clock, latch pin, number of chips
+VALVE_I2C = (6, 7, 0x20)    # "pcf8574": sda, scl pin, address
 
 # --- Operational Parameters ---
 # Fine-tune the system's behavior.
 PUMP_PWM_FREQ = 2000
 PUMP_RAMP_UP_TIME_S = 2.0   # Seconds to wait for pump to build pressure
 PULSES_PER_LITER = 1700     # Pulses from the flow meter that equal 1 liter
+BRANCH_METERS = {}          # branch meters, name: (pin, pulses per liter, zones), e.g. {"beds": (4, 1700, (1, 2, 3))}
+LEAK_TOLERANCE = 15         # % more water on the main meter than on a branch meter that is flagged as a leak
+CALIB_POINTS = 8            # max calibration points of the pulses per liter curve
+CALIB_RATE_STEP = 8         # flow rate step of the curve lookup table, pulses/s
+CALIB_LUT_SIZE = 32         # lookup table entries, covers up to CALIB_RATE_STEP * CALIB_LUT_SIZE pulses/s
+CALIB_MAX_RATIO = 2         # a calibration point must be within this factor of PULSES_PER_LITER
 MIN_FLOW_S_PER_L = 240      # Max seconds per liter before a timeout occurs
 TANK_SIZE = 85
+CYCLE_RESUME_S = 3600       # A run interrupted by a reset is resumed at boot within this window
+DISPENSE_MODE = "timer"     # valve timing executor: "timer", "thread" (dual-core ESP32) or "async"
+DISPENSE_TICK_MS = 5        # executor period
+INDICATOR_MS = 100          # LED update period
+TANK_RESERVE_L = 3          # Liters kept in the tank, programs that need more are adjusted
+TANK_LOW_ACTION = "scale"   # "scale" the program down or "skip" it when the tank is low
+DRY_RUN_MS = 800            # No meter pulse for this long with the pump on = running dry
+TANK_LEVEL_PIN = None       # Optional low-water float switch
+TANK_LEVEL_LOW = 0          # Pin value of TANK_LEVEL_PIN when the water is low
+TANK_REFILL_DEBOUNCE_S = 30 # Sensor must stay OK this long to detect a refill
+
+# --- Water budget ---
+# Program volumes are scaled by (ET0 - effective rain) / BUDGET_REF_ET_MM
+BUDGET_LATITUDE = 42.7      # degrees, for the Hargreaves ET0 model
+BUDGET_REF_ET_MM = 4.0      # daily ET0 at which the configured volumes are right
+BUDGET_RAIN_EFF = 0.8       # fraction of rain that reaches the roots
+BUDGET_MIN = 0.0
+BUDGET_MAX = 2.0
+BUDGET_MAX_AGE_S = 172800   # older observations are ignored (factor 1.0)
+
+# --- Valve self-test ---
+SELFTEST_PUMP_POWER = 20    # % pump power during the test
+SELFTEST_PULSES = 30        # flow is confirmed after this many pulses
+SELFTEST_ZONE_MS = 5000     # max time per valve
+SELFTEST_TOLERANCE = 25     # % deviation from the baseline flow rate
+
+# --- Soil moisture probes ---
+MOISTURE_PINS = {}          # zone -> ADC pin, e.g. {"1": 2, "2": 3}
+MOISTURE_PERIOD_S = 60      # sampling period
+MOISTURE_OVERSAMPLE = 16    # ADC reads averaged per sample
+MOISTURE_WINDOW = 5         # samples in the median filter
+MOISTURE_DRY = 52000        # raw read_u16() value in dry soil (0 %)
+MOISTURE_WET = 22000        # raw read_u16() value in water (100 %)
+MOISTURE_TRIM = 60          # % above which the zone volume is reduced
+MOISTURE_SKIP = 80          # % at which the zone is skipped
+
+# --- Persistence ---
+STORE_COMMIT_S = 5          # pending NVS writes are committed in batches this often
+STORE_CHECKPOINT_S = 60     # max rate of meter checkpoints during a cycle
+STORE_JOURNAL_SIZE = 1536   # bytes, read buffer for a journal without a stored length
+HISTORY_FILE = "/history.bin" # zone history, GET /export
+HISTORY_MAX_RECORDS = 4096  # records per history file, the previous file is kept too
+HISTORY_BLOCK = 128         # records per export block
+
+# --- Network REPL ---
+REPL_PORT = 8023            # TCP port of the network REPL (telnet/nc)
+REPL_PASSWORD = None        # None disables the network REPL
+REPL_MAX_SESSIONS = 2
+REPL_MAX_OUTPUT = 4096      # bytes of output kept per command, the rest is dropped
+REPL_CHUNK = 256            # output is sent in chunks of this size
+REPL_THROTTLE_MS = 20       # pause between output chunks
+
+# --- MQTT Configuration ---
+MQTT_BROKER = None          # broker host, None disables MQTT
+MQTT_PORT = 1883
+MQTT_USER = None
+MQTT_PASSWORD = None
+MQTT_CLIENT_ID = "irrigation"
+MQTT_PREFIX = "irrigation"  # topics: <prefix>/state, <prefix>/status, <prefix>/cmd/...
+MQTT_DISCOVERY_PREFIX = "homeassistant"
+MQTT_KEEPALIVE = 60         # sec
+MQTT_PUBLISH_MS = 1000      # state is checked for changes this often
+MQTT_ACK_MS = 2000          # QoS 1 PUBACK timeout, one retry
+MQTT_BACKOFF_MAX_S = 60
+
+# --- OTA update ---
+OTA_DIR = "/ota"            # staging and backup directory
+OTA_CHUNK = 4096            # upload buffer, bytes
+OTA_CONFIRM_S = 60          # the new build must run this long to be kept
+OTA_MAX_TRIES = 3           # boots without confirmation before rolling back
+
+# --- Memory / GC ---
+GC_THRESHOLD = 0            # bytes allocated before an automatic GC, 0 = firmware default
+GC_FREE_MIN = 32768         # collect at safe points when less heap is free
+GC_HOLD_PULSES = 100        # automatic GC is held off for the last pulses of a zone
+
+# --- Fleet (several controllers on one water source) ---
+FLEET_ROLE = None           # None, "coordinator" or "satellite"
+FLEET_NODE = "node1"        # unique name of this controller
+FLEET_COORDINATOR = "192.168.1.10:80"  # satellites: coordinator host[:port]
+FLEET_PUMP_SLOTS = 1        # pumps allowed to run at the same time
+FLEET_LEASE_S = 120         # pump lease duration, renewed while running
+FLEET_RETRY_S = 10          # retry interval while waiting for a slot
+FLEET_UNREACHABLE_S = 300   # run without a lease when the coordinator is gone this long
+FLEET_REPORT_S = 30         # satellite status report interval
+FLEET_TIMEOUT_S = 5         # timeout of a request to another node
+
+# --- Supervisor ---
+WDT_TIMEOUT_MS = 10000      # hardware watchdog, fed only while all supervised tasks are healthy
+SUPERVISOR_PERIOD_MS = 1000
+SUPERVISOR_DEADLINES = {"scheduler": 150, "wifi": 150, "cycle": 120}  # max sec between heartbeats
+SUPERVISOR_BACKOFF_MIN_MS = 1000    # first restart delay of a crashed task, doubles per failure
+SUPERVISOR_BACKOFF_MAX_MS = 60000
+SUPERVISOR_MAX_RESTARTS = 5 # failures in a row before the board is reset by the watchdog
+SUPERVISOR_STABLE_S = 300   # a task running this long without failure starts counting again
+SAFETY_TIMER = 1            # hardware timer of the safety check, timer 0 is used by dispense
+SAFETY_PUMP_MAX_S = 7200    # pump is switched off after running this long
+SAFETY_VALVE_MAX_S = 1800   # valves are closed after one was open this long
 
 # --- Web Server Configuration ---
 WEB_SERVER_PORT = 80
+WEB_AUTH_USER = "admin"     # HTTP Basic user
+WEB_AUTH_PASSWORD = None    # HTTP Basic password for POST/PUT/PATCH/DELETE, None disables
+WEB_AUTH_TOKEN = None       # accepted as "Authorization: Bearer <token>", also sent by fleet nodes
+WEB_RATE = 2                # requests/s per client, 0 disables rate limiting
+WEB_BURST = 20              # requests a client may send at once
+WEB_WRITE_COST = 5          # a POST/PUT/PATCH/DELETE counts as this many requests
+SETTINGS_MAX_BYTES = 4096   # largest settings JSON, in NVS and in a /config request
 
 # --- Default settings ---
 # This is used on first boot or when non-volatile storage is empty
@@ -0,0 +1,133 @@
+# dispense.py
+# Valve timing executor. Once a zone is started, closing the valve on the
+# target count, on a flow timeout or on a dry pump is done here, outside the
+# asyncio loop, so a slow web handler can not delay it.
+#
+# DISPENSE_MODE:
+#   "async"  - stepped from the cycle coroutine (no offload)
+#   "timer"  - stepped by a periodic machine.Timer
+#   "thread" - stepped by a _thread loop (second core on dual-core ESP32)
+#
+# The asyncio side and the executor share two small int arrays. cmd is only
+# written by the asyncio side, st only by the executor, and a new command is
+# published by bumping cmd[SEQ] last, so no lock is needed.
+
+import time
+from array import array
+
+import config
+
+# result codes in st[RESULT]
+BUSY, DONE, TIMEOUT, DRY, ABORTED = range(5)
+
+# cmd slots, METER indexes the meters passed to init()
+SEQ, VALVE, TARGET, TIMEOUT_MS, ABORT, METER = range(6)
+cmd = array("i", [0, 0, 0, 0, 0, 0])
+# st slots: acknowledged seq, result, pulses, duration ms
+ACK, RESULT, PULSES, DURATION = range(4)
+st = array("i", [0, DONE, 0, 0])
+
+mode = "async"
+_meters = ()
+_meter = None
+_set_valve = None
+_pump = None
+_timer = None
+_running = False
+_start_cnt = 0
+_start_ms = 0
+_last_cnt = 0
+_last_ms = 0
+
+
+def step(_=None):
+    """Advance the executor. Must not allocate, it may run from a timer callback."""
+    global _meter, _start_cnt, _start_ms, _last_cnt, _last_ms
+    seq = cmd[SEQ]
+    if seq != st[ACK]:
+        _meter = _meters[cmd[METER]]
+        _start_cnt = _last_cnt = _meter.value()
+        _start_ms = _last_ms = time.ticks_ms()
+        st[PULSES] = 0
+        st[RESULT] = BUSY
+        st[ACK] = seq
+        _set_valve(cmd[VALVE])
+        return
+    if st[RESULT] != BUSY:
+        return
+    now = time.ticks_ms()
+    cnt = _meter.value()
+    st[PULSES] = cnt - _start_cnt
+    if cnt != _last_cnt:
+        _last_cnt = cnt
+        _last_ms = now
+    if cnt - _start_cnt >= cmd[TARGET]:
+        res = DONE
+    elif cmd[ABORT] == seq:
+        res = ABORTED
+    elif time.ticks_diff(now, _last_ms) > config.DRY_RUN_MS:
+        # no pulse with the pump on: cut the pump right here
+        _pump.duty(0)
+        res = DRY
+    elif time.ticks_diff(now, _start_ms) > cmd[TIMEOUT_MS]:
+        res = TIMEOUT
+    else:
+        return
+    _set_valve(0)
+    st[DURATION] = time.ticks_diff(now, _start_ms)
+    st[RESULT] = res
+
+
+def _thread_loop():
+    while _running:
+        step()
+        time.sleep_ms(config.DISPENSE_TICK_MS)
+
+
+def init(meters, set_valve, pump):
+    """Start the executor in DISPENSE_MODE, falling back to "async".
+    meters[0] is the main meter, the others are branch meters."""
+    global mode, _meters, _set_valve, _pump, _timer, _running
+    _meters, _set_valve, _pump = tuple(meters), set_valve, pump
+    mode = config.DISPENSE_MODE
+    try:
+        if mode == "timer":
+            from machine import Timer
+            _timer = Timer(0)
+            _timer.init(period=config.DISPENSE_TICK_MS, mode=Timer.PERIODIC, callback=step)
+        elif mode == "thread":
+            import _thread
+            _running = True
+            _thread.start_new_thread(_thread_loop, ())
+    except (ImportError, OSError, ValueError):
+        mode = "async"
+    return mode
+
+
+def deinit():
+    global _running
+    _running = False
+    if _timer:
+        _timer.deinit()
+
+
+def start(valve, pulses, timeout_ms, meter=0):
+    cmd[VALVE] = valve
+    cmd[METER] = meter
+    cmd[TARGET] = pulses
+    cmd[TIMEOUT_MS] = timeout_ms
+    cmd[SEQ] = cmd[SEQ] + 1
+    if mode == "async":
+        step()
+
+
+def abort():
+    cmd[ABORT] = cmd[SEQ]
+    if mode == "async":
+        step()
+
+
+def busy():
+    if mode == "async":
+        step()
+    return st[ACK] != cmd[SEQ] or st[RESULT] == BUSY
@@ -0,0 +1,250 @@
+# fleet.py
+# Several controllers on one water source. The coordinator owns the schedule
+# and leases pump slots, satellites ask for a lease before starting their
+# pump and report their status to the coordinator.
+
+import uasyncio as asyncio
+import json
+import time
+
+from tz import localtime
+
+import config
+import history
+import web
+from utils import fmt_time, log
+
+
+role = config.FLEET_ROLE        # None, "coordinator" or "satellite"
+node = config.FLEET_NODE
+leases = {}     # coordinator: node -> expiry (time.ticks_ms)
+nodes = {}      # coordinator: node -> last report
+_holding = False
+_renew_task = None
+
+
+# --- Coordinator side ---
+
+def _expire():
+    now = time.ticks_ms()
+    for n in [n for n, t in leases.items() if time.ticks_diff(t, now) <= 0]:
+        log("WARN", f"Fleet: lease of {n} expired")
+        del leases[n]
+
+
+def grant(name):
+    """Grant or renew a pump slot for name. Returns True if it holds one."""
+    _expire()
+    if name not in leases and len(leases) >= config.FLEET_PUMP_SLOTS:
+        return False
+    leases[name] = time.ticks_add(time.ticks_ms(), config.FLEET_LEASE_S * 1000)
+    return True
+
+
+def release_slot(name):
+    leases.pop(name, None)
+
+
+def report(name, st, ip):
+    st["ip"] = ip
+    st["seen"] = fmt_time(localtime())
+    nodes[name] = st
+
+
+def status():
+    _expire()
+    return {"node": node, "leases": list(leases), "nodes": nodes}
+
+
+async def trigger_satellites():
+    """Global schedule: start the program on every known satellite."""
+    for name, st in nodes.items():
+        try:
+            code, _ = await asyncio.wait_for(
+                _request(st["ip"], st.get("port", 80), "POST", "/run"), config.FLEET_TIMEOUT_S)
+            if code == 200:
+                log("INFO", f"Fleet: started {name}")
+            else:
+                log("WARN", f"Fleet: {name} did not start, HTTP {code}")
+        except Exception as e:
+            log("WARN", f"Fleet: could not start {name}: {e}")
+
+
+async def relay_export(name, query, w):
+    """Stream GET /export of satellite name to w, status line and headers included."""
+    st = nodes[name]
+    sw = None
+    sent = False
+    try:
+        r, sw = await asyncio.wait_for(asyncio.open_connection(st["ip"], st.get("port", 80)),
+                                       config.FLEET_TIMEOUT_S)
+        q = "?" + query if query else ""
+        sw.write(f"GET /export{q} HTTP/1.0\r\nHost: {st['ip']}\r\n\r\n".encode())
+        await sw.drain()
+        while True:
+            b = await asyncio.wait_for(r.read(512), config.FLEET_TIMEOUT_S)
+            if not b:
+                break
+            await w.awrite(b)
+            sent = True
+    except Exception as e:
+        # a cut export is resumed by the client with ?from=
+        log("WARN", f"Fleet: history of {name} failed: {e}")
+        if not sent:
+            await w.awrite(b"HTTP/1.0 502 Bad Gateway\r\n\r\n")
+    finally:
+        if sw:
+            sw.close()
+
+
+# --- Satellite side ---
+
+async def _request(host, port, method, path, body=None):
+    """Minimal HTTP/1.0 client. Returns (status code, body bytes)."""
+    r, w = await asyncio.open_connection(host, port)
+    try:
+        data = json.dumps(body) if body is not None else ""
+        auth = f"Authorization: Bearer {config.WEB_AUTH_TOKEN}\r\n" if config.WEB_AUTH_TOKEN else ""
+        w.write(f"{method} {path} HTTP/1.0\r\nHost: {host}\r\n{auth}Content-Length: {len(data)}\r\n\r\n{data}".encode())
+        await w.drain()
+        code = int((await r.readline()).split()[1])
+        while (await r.readline()) not in (b"\r\n", b""):
+            pass
+        return code, await r.read(512)
+    finally:
+        w.close()
+
+
+def _coordinator():
+    host, _, port = config.FLEET_COORDINATOR.partition(":")
+    return host, int(port or 80)
+
+
+async def _lease(method):
+    """True on 200, False on 409 (no free slot). Any other answer raises
+    OSError, so it counts towards FLEET_UNREACHABLE_S like a network error."""
+    host, port = _coordinator()
+    code, _ = await asyncio.wait_for(_request(host, port, "POST", f"/fleet/{method}?node={node}"),
+                                     config.FLEET_TIMEOUT_S)
+    if code == 200:
+        return True
+    if code == 409:
+        return False
+    raise OSError(f"coordinator answered HTTP {code}")
+
+
+async def _renew():
+    while True:
+        await asyncio.sleep(config.FLEET_LEASE_S // 3)
+        try:
+            if role == "coordinator":
+                grant(node)
+            else:
+                await _lease("lease")
+        except Exception as e:
+            log("WARN", f"Fleet: lease renewal failed: {e}")
+
+
+async def acquire():
+    """Wait for a pump slot. Called before the pump starts."""
+    global _holding, _renew_task
+    if role is None:
+        return
+    unreachable = time.ticks_ms()
+    while True:
+        try:
+            if role == "coordinator":
+                ok = grant(node)
+            else:
+                ok = await _lease("lease")
+            if ok:
+                break
+            unreachable = time.ticks_ms()
+            log("INFO", "Fleet: pump slot busy, waiting")
+        except Exception as e:
+            log("WARN", f"Fleet: lease request failed: {e}")
+            # run anyway rather than leave the plants dry when the coordinator is gone
+            if time.ticks_diff(time.ticks_ms(), unreachable) > config.FLEET_UNREACHABLE_S * 1000:
+                log("WARN", f"Fleet: coordinator unreachable ({e}), running without a lease")
+                return
+        await asyncio.sleep(config.FLEET_RETRY_S)
+    _holding = True
+    _renew_task = asyncio.create_task(_renew())
+
+
+async def release():
+    """Give the pump slot back. Called after the pump stopped."""
+    global _holding, _renew_task
+    if not _holding:
+        return
+    _holding = False
+    if _renew_task:
+        _renew_task.cancel()
+        _renew_task = None
+    try:
+        if role == "coordinator":
+            release_slot(node)
+        else:
+            await _lease("release")
+    except Exception as e:
+        log("WARN", f"Fleet: release failed, the lease expires in {config.FLEET_LEASE_S}s: {e}")
+
+
+async def reporter(get_status):
+    """Satellite: push get_status() to the coordinator every FLEET_REPORT_S."""
+    host, port = _coordinator()
+    while True:
+        try:
+            st = get_status()
+            st["port"] = config.WEB_SERVER_PORT
+            st["history"] = history.next_seq
+            await asyncio.wait_for(_request(host, port, "POST", f"/fleet/report?node={node}", st),
+                                   config.FLEET_TIMEOUT_S)
+        except Exception as e:
+            log("DEBUG", f"Fleet: report failed: {e}")
+        await asyncio.sleep(config.FLEET_REPORT_S)
+
+
+# --- Coordinator endpoints ---
+
+def routes(app):
+    @app.route('/fleet', methods=['GET'])
+    async def get_fleet(r, w):
+        await web.send_json(w, status())
+
+    @app.route('/fleet/', methods=['GET'])
+    async def get_fleet_export(r, w):
+        """GET /fleet/<node>/export[?from=<n>][&fmt=csv], the history of a node."""
+        parts = r.path.split('/')
+        if len(parts) != 4 or parts[3] != 'export':
+            await w.awrite(b"HTTP/1.0 404 Not Found\r\n\r\n")
+        elif parts[2] == node:
+            q = "?" + r.query if r.query else ""
+            await w.awrite(f"HTTP/1.0 307 Temporary Redirect\r\nLocation: /export{q}\r\n\r\n".encode())
+        elif parts[2] not in nodes:
+            await w.awrite(b"HTTP/1.0 404 Not Found\r\n\r\nUnknown node")
+        else:
+            await relay_export(parts[2], r.query, w)
+
+    @app.route('/fleet/', methods=['POST'])
+    async def post_fleet(r, w):
+        action = r.path[len('/fleet/'):]
+        name = web.parse_qs(r.query or '').get('node')
+        # 409 only means "no free slot", a satellite treats anything else as an error
+        code = '200 OK'
+        if not name:
+            code = '400 Bad Request'
+        elif action == 'lease':
+            if not grant(name):
+                code = '409 Conflict'
+        elif action == 'release':
+            release_slot(name)
+        elif action == 'report':
+            n = int(r.headers.get('content-length', 0))
+            try:
+                report(name, json.loads(await r.read(n)), w.get_extra_info('peername')[0])
+            except ValueError:
+                code = '400 Bad Request'
+        else:
+            code = '404 Not Found'
+        await w.awrite(f"HTTP/1.0 {code}\r\n\r\n".encode())
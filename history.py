@@ -0,0 +1,173 @@
+# history.py
+# Zone history for offline analysis. Every dispensed zone adds one record.
+# Records are kept in RAM during a run and appended to a flash file
+# afterwards; when the file is full it becomes the previous file and a new
+# one is started, so the last 1-2 x HISTORY_MAX_RECORDS records are kept.
+#
+# Every record has a sequence number. A file starts with its first sequence
+# number, so a record is found by number even after rotation, and an export
+# can be resumed from any record.
+#
+# Export format (all integers are unsigned LEB128 varints):
+#   b"IRH1", ncols, ncols x (name length, name), first seq, next seq,
+#   epoch year of "t" (1970 or 2000)
+#   blocks: b"B", count, first seq, then per column: byte length, values
+#   b"E"
+# Each block stands alone: "t" and "run" are zigzag deltas from the previous
+# value of the block, starting at 0. A client that lost the connection
+# resumes with ?from=<first seq + count> of the last complete block.
+
+import os
+import struct
+import time
+
+import config
+
+COLUMNS = ("t", "run", "zone", "target_ml", "pulses", "ppl", "duration_ms", "result")
+_DELTA = (True, True, False, False, False, False, False, False)
+_REC = "<IIHHIHIB"
+_SIZE = struct.calcsize(_REC)
+_HEAD = "<4sI"
+_HEAD_SIZE = struct.calcsize(_HEAD)
+_FILE = config.HISTORY_FILE
+_OLD = config.HISTORY_FILE + ".1"
+
+pending = []        # records not yet on flash
+next_seq = 0
+
+
+def _first(path):
+    """First sequence number and record count of a history file, or None."""
+    try:
+        with open(path, "rb") as f:
+            magic, first = struct.unpack(_HEAD, f.read(_HEAD_SIZE))
+        if magic != b"IRH1":
+            return None
+        return first, (os.stat(path)[6] - _HEAD_SIZE) // _SIZE
+    except (OSError, ValueError):
+        return None
+
+
+def load():
+    global next_seq
+    for path in (_FILE, _OLD):
+        info = _first(path)
+        if info:
+            next_seq = info[0] + info[1]
+            return
+
+
+def add(run, zone, target_ml, pulses, ppl, duration_ms, result):
+    global next_seq
+    pending.append((time.time(), run, zone, target_ml, pulses, ppl, duration_ms, result))
+    next_seq += 1
+
+
+def flush():
+    """Append the pending records to flash. Call it outside of valve timing."""
+    if not pending:
+        return
+    info = _first(_FILE)
+    if info and info[1] + len(pending) > config.HISTORY_MAX_RECORDS:
+        try:
+            os.remove(_OLD)
+        except OSError:
+            pass
+        os.rename(_FILE, _OLD)
+        info = None
+    with open(_FILE, "ab") as f:
+        if not info:
+            f.write(struct.pack(_HEAD, b"IRH1", next_seq - len(pending)))
+        for rec in pending:
+            f.write(struct.pack(_REC, *rec))
+    pending.clear()
+
+
+def records(start=0):
+    """Yield (seq, record) from seq start on, oldest first."""
+    buf = bytearray(_SIZE)
+    for path in (_OLD, _FILE):
+        info = _first(path)
+        if not info:
+            continue
+        first, count = info
+        if first + count <= start:
+            continue
+        with open(path, "rb") as f:
+            skip = max(0, start - first)
+            f.seek(_HEAD_SIZE + skip * _SIZE)
+            for i in range(skip, count):
+                f.readinto(buf)
+                yield first + i, struct.unpack(_REC, buf)
+    seq = next_seq - len(pending)
+    for rec in pending:
+        if seq >= start:
+            yield seq, rec
+        seq += 1
+
+
+def oldest():
+    for path in (_OLD, _FILE):
+        info = _first(path)
+        if info:
+            return info[0]
+    return next_seq - len(pending)
+
+
+def _varint(buf, n):
+    while n > 0x7F:
+        buf.append(0x80 | (n & 0x7F))
+        n >>= 7
+    buf.append(n)
+
+
+def _block(first, recs):
+    out = bytearray(b"B")
+    _varint(out, len(recs))
+    _varint(out, first)
+    col = bytearray()
+    for c, delta in enumerate(_DELTA):
+        col[:] = b""
+        prev = 0
+        for rec in recs:
+            v = rec[c]
+            if delta:
+                v, prev = v - prev, v
+                v = v << 1 if v >= 0 else (-v << 1) - 1
+            _varint(col, v)
+        _varint(out, len(col))
+        out.extend(col)
+    return out
+
+
+def header(start):
+    out = bytearray(b"IRH1")
+    _varint(out, len(COLUMNS))
+    for name in COLUMNS:
+        _varint(out, len(name))
+        out.extend(name.encode())
+    _varint(out, max(start, oldest()))
+    _varint(out, next_seq)
+    _varint(out, time.gmtime(0)[0])
+    return out
+
+
+def blocks(start):
+    """Yield the encoded blocks of the records from seq start on."""
+    recs = []
+    first = start
+    for seq, rec in records(start):
+        if not recs:
+            first = seq
+        recs.append(rec)
+        if len(recs) == config.HISTORY_BLOCK:
+            yield _block(first, recs)
+            recs = []
+    if recs:
+        yield _block(first, recs)
+
+
+def csv_lines(start):
+    yield "seq," + ",".join(COLUMNS) + "\n"
+    for seq, rec in records(start):
+        yield f"{seq}," + ",".join(str(v) for v in rec) + "\n"
@@ -0,0 +1,119 @@
+# indicator.py
+# Status LEDs. One long-lived task renders the RGB LED and the blinking
+# status LED from a pattern table; the rest of the code only sets the
+# values below. The status LED blinks from a hardware PWM channel where
+# the frequency allows it, otherwise the task toggles it.
+
+import uasyncio as asyncio
+from machine import Pin, PWM
+from neopixel import NeoPixel
+
+import config
+
+# pattern -> (RGB color, status LED blink Hz)
+PATTERNS = {
+    "BOOTING": ((0, 64, 128), 10),
+    "CONNECTING": ((128, 128, 0), 3),
+    "IDLE": ((0, 0, 128), 1),
+    "RUNNING": ((0, 128, 0), 2),
+    "ERROR": ((128, 0, 0), 5),
+    "LOW_TANK": ((128, 48, 0), 4),
+    "NO_WIFI": ((96, 0, 96), 1),
+    "OFF": ((0, 0, 0), 0),
+}
+
+# set by the rest of the code
+state = "BOOTING"   # State.text() of logic.current_state
+progress = -1       # % of the zone in progress, -1 when no zone runs
+low_tank = False
+wifi = False       # follows net.on_wifi
+
+_rgb = NeoPixel(Pin(config.RGB_PIN), 1)
+_led = Pin(config.LED_PIN, Pin.OUT, value=0)
+_pwm = None
+_shown = None
+_soft_hz = 0        # blink frequency when the task toggles the LED
+
+
+def set_wifi(connected):
+    global wifi
+    wifi = connected
+
+
+def pattern():
+    """Pattern name for the current values, faults first."""
+    if state in ("ERROR", "OFF", "BOOTING"):
+        return state
+    if low_tank:
+        return "LOW_TANK"
+    if state == "IDLE" and not wifi:
+        return "NO_WIFI"
+    return state if state in PATTERNS else "IDLE"
+
+
+def _color(name):
+    color = PATTERNS[name][0]
+    if name == "RUNNING" and progress >= 0:
+        # zone progress: from yellow at the start to green at the end
+        return (128 * (100 - min(progress, 100)) // 100, 128, 0)
+    return color
+
+
+def _blink(hz):
+    """Blink the status LED at hz from hardware PWM, returns False if not possible."""
+    global _pwm
+    if not hz:
+        if _pwm:
+            _pwm.deinit()
+            _pwm = None
+        _led.init(Pin.OUT, value=0)
+        return True
+    try:
+        if _pwm:
+            _pwm.freq(hz)
+        else:
+            _pwm = PWM(_led, freq=hz, duty_u16=32768)
+        return True
+    except ValueError:
+        # frequency out of range for this LEDC timer
+        if _pwm:
+            _pwm.deinit()
+            _pwm = None
+        _led.init(Pin.OUT)
+        return False
+
+
+def render():
+    """Show the current pattern now, returns its blink frequency if the
+    status LED must be toggled in software, else 0."""
+    global _shown, _soft_hz
+    name = pattern()
+    color = _color(name)
+    hz = PATTERNS[name][1]
+    key = (name, color)
+    if key != _shown:
+        _rgb[0] = color
+        _rgb.write()
+        if _shown is None or name != _shown[0]:
+            _soft_hz = 0 if _blink(hz) else hz
+        _shown = key
+    return _soft_hz
+
+
+async def task():
+    toggle_ms = 0
+    while True:
+        hz = render()
+        if hz:
+            toggle_ms += config.INDICATOR_MS
+            if toggle_ms >= 500 // hz:
+                toggle_ms = 0
+                _led.value(not _led.value())
+        await asyncio.sleep_ms(config.INDICATOR_MS)
+
+
+def off():
+    """Call this when the main loop exits."""
+    global state
+    state = "OFF"
+    render()
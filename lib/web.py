@@ -1,10 +1,9 @@
 # Based on https://github.com/wybiral/micropython-aioweb
 
 import uasyncio as asyncio
-from hashlib import sha1
-from binascii import b2a_base64
 import struct
 import time
+import json
 
 def unquote_plus(s):
     out = []
@@ -65,6 +64,172 @@ def path_matches_pattern(path, pattern):
     return path == pattern
 
 
+def json_chunks(obj):
+    """Yield the JSON text for obj piece by piece.
+
+    Lists, tuples and any other iterable (e.g. a generator) are encoded as
+    arrays, so large responses can be produced lazily.
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        sep = ''
+        for k, v in obj.items():
+            yield sep
+            yield json.dumps(str(k))
+            yield ':'
+            yield from json_chunks(v)
+            sep = ','
+        yield '}'
+    elif obj is None or isinstance(obj, (str, int, float, bool)):
+        yield json.dumps(obj)
+    else:
+        yield '['
+        sep = ''
+        for v in obj:
+            yield sep
+            yield from json_chunks(v)
+            sep = ','
+        yield ']'
+
+
+async def write_json(w, obj, chunk=256):
+    """Stream obj as JSON to w in chunks of at most `chunk` bytes."""
+    buf = bytearray(chunk)
+    mv = memoryview(buf)
+    n = 0
+    for s in json_chunks(obj):
+        b = s.encode()
+        i = 0
+        while i < len(b):
+            k = min(chunk - n, len(b) - i)
+            mv[n:n + k] = b[i:i + k] if i or k < len(b) else b
+            n += k
+            i += k
+            if n == chunk:
+                await w.awrite(buf)
+                n = 0
+    if n:
+        await w.awrite(mv[:n])
+
+
+async def send_json(w, obj, status='200 OK'):
+    await w.awrite(f'HTTP/1.0 {status}\r\nContent-Type: application/json\r\n\r\n'.encode())
+    await write_json(w, obj)
+
+
+def compare_digest(a, b):
+    """Constant-time comparison of two bytes objects."""
+    diff = len(a) ^ len(b)
+    if len(a) != len(b):
+        b = a
+    for x, y in zip(a, b):
+        diff |= x ^ y
+    return diff == 0
+
+
+class Auth:
+    """Bearer token and/or HTTP Basic authentication.
+
+    Verified Authorization headers are kept for `ttl` seconds, so a client
+    that sends the same header again costs one dict lookup.
+    """
+
+    def __init__(self, user=None, password=None, token=None, realm='device', ttl=300, size=8):
+        self.basic = None
+        if password:
+            from binascii import b2a_base64
+            self.basic = b2a_base64(f'{user}:{password}'.encode()).strip()
+        self.token = token.encode() if token else None
+        self.realm = realm
+        self.ttl = ttl * 1000
+        self.size = size
+        self.sessions = {}  # Authorization header -> expiry ticks_ms
+
+    def verify(self, header):
+        if not header:
+            return False
+        now = time.ticks_ms()
+        exp = self.sessions.get(header)
+        if exp is not None:
+            if time.ticks_diff(exp, now) > 0:
+                return True
+            del self.sessions[header]
+        scheme, _, cred = header.partition(' ')
+        scheme = scheme.lower()
+        cred = cred.strip().encode()
+        if scheme == 'bearer' and self.token:
+            ok = compare_digest(cred, self.token)
+        elif scheme == 'basic' and self.basic:
+            ok = compare_digest(cred, self.basic)
+        else:
+            ok = False
+        if ok:
+            if len(self.sessions) >= self.size:
+                self.sessions.clear()
+            self.sessions[header] = time.ticks_add(now, self.ttl)
+        return ok
+
+
+class RateLimit:
+    """Token bucket per client address: `rate` requests/s, bursts of `burst`.
+
+    Tokens are kept in thousandths to stay in small ints. The table holds at
+    most `size` clients, the one idle longest is dropped.
+    """
+
+    def __init__(self, rate=2, burst=20, size=16):
+        self.rate = rate
+        self.cap = burst * 1000
+        self.size = size
+        self.buckets = {}   # address -> [tokens, last ticks_ms]
+
+    def allow(self, addr, cost=1):
+        now = time.ticks_ms()
+        b = self.buckets.get(addr)
+        if b is None:
+            if len(self.buckets) >= self.size:
+                old = min(self.buckets, key=lambda k: self.buckets[k][1])
+                del self.buckets[old]
+            b = self.buckets[addr] = [self.cap, now]
+        else:
+            b[0] = min(self.cap, b[0] + time.ticks_diff(now, b[1]) * self.rate)
+            b[1] = now
+        if b[0] < cost * 1000:
+            return False
+        b[0] -= cost * 1000
+        return True
+
+
+async def read_body(r, limit=4096, chunk=512):
+    """Read the request body by its Content-Length, in chunks of at most `chunk`
+    bytes. Raises ValueError if the length is missing or above `limit`."""
+    n = int(r.headers.get('content-length', -1))
+    if n < 0 or n > limit:
+        raise ValueError('content-length')
+    buf = bytearray(n)
+    mv = memoryview(buf)
+    i = 0
+    while i < n:
+        b = await r.read(min(chunk, n - i))
+        if not b:
+            raise ValueError('truncated body')
+        mv[i:i + len(b)] = b
+        i += len(b)
+    return buf
+
+
+def merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7386) to the dict target in place."""
+    for k, v in patch.items():
+        if v is None:
+            target.pop(k, None)
+        elif isinstance(v, dict) and isinstance(target.get(k), dict):
+            merge_patch(target[k], v)
+        else:
+            target[k] = v
+    return target
+
+
 async def _parse_request(r, w):
     line = await r.readline()
     if not line:
@@ -103,6 +268,12 @@ class App:
         self.port = port
         self.handlers = []
         self.buffer = bytearray(1024)
+        self.before_request = None  # called with the request before dispatch
+        self.after_request = None   # called with the request after each response
+        self.auth = None            # Auth, checked for the methods in auth_methods
+        self.auth_methods = ('POST', 'PUT', 'PATCH', 'DELETE')
+        self.limiter = None         # RateLimit, checked for every request
+        self.write_cost = 5         # tokens taken by a request in auth_methods
 
     def route(self, path, methods=['GET']):
         def wrapper(handler):
@@ -110,6 +281,16 @@ class App:
             return handler
         return wrapper
 
+    def lazy(self, path, module, name, methods=['GET']):
+        """Route to module.name, importing the module on the first request."""
+        def lazy_handler(request, writer):
+            handler = getattr(__import__(module), name)
+            for i, h in enumerate(self.handlers):
+                if h[2] is lazy_handler:
+                    self.handlers[i] = (path, methods, handler)
+            return handler(request, writer)
+        self.handlers.append((path, methods, lazy_handler))
+
     def static(self, url_path, directory):
         def static_handler(request, writer):
             return self._serve_static_file(request, writer, url_path, directory)
@@ -149,8 +330,19 @@ class App:
             await writer.awrite(b'HTTP/1.0 500 Internal Server Error\r\n\r\nInternal Server Error')
 
     async def _dispatch(self, r, w):
+        if self.before_request:
+            self.before_request(r)
         try:
             await _parse_request(r, w)
+            write = r.method in self.auth_methods
+            if self.limiter:
+                addr = w.get_extra_info('peername')[0]
+                if not self.limiter.allow(addr, self.write_cost if write else 1):
+                    await w.awrite(b'HTTP/1.0 429 Too Many Requests\r\nRetry-After: 1\r\n\r\n')
+                    return
+            if write and self.auth and not self.auth.verify(r.headers.get('authorization')):
+                await w.awrite(f'HTTP/1.0 401 Unauthorized\r\nWWW-Authenticate: Basic realm="{self.auth.realm}"\r\n\r\n'.encode())
+                return
             for path, methods, handler in self.handlers:
                 if path_matches_pattern(r.path, path) and r.method in methods:
                     await handler(r, w)
@@ -160,9 +352,13 @@ class App:
             print(e)
         finally:
             await w.wait_closed()
+            if self.after_request:
+                self.after_request(r)
 
     async def serve(self):
-        await asyncio.start_server(self._dispatch, self.host, self.port)
+        """Serve until the listening socket fails."""
+        srv = await asyncio.start_server(self._dispatch, self.host, self.port)
+        await srv.wait_closed()
 
 
 class WebSocket:
@@ -180,6 +376,8 @@ class WebSocket:
 
     @classmethod
     async def upgrade(cls, r, w):
+        from hashlib import sha1
+        from binascii import b2a_base64
         key = r.headers['sec-websocket-key'].encode()
         key += WebSocket.HANDSHAKE_KEY
         x = b2a_base64(sha1(key).digest()).strip()
@@ -1,11 +1,9 @@
 import sys
 import uasyncio as asyncio
 import time
-from machine import Pin, PWM, WDT
+from machine import Pin, PWM
 import micropython
-from esp32 import NVS
 import json
-from neopixel import NeoPixel
 
 # --- Third-party libraries ---
 from tz import localtime, mktime
@@ -13,6 +11,17 @@ from utils import fmt_time, log
 
 # --- Project modules ---
 import config
+import store
+import tank
+import budget
+import moisture
+import mem
+import dispense
+import valvebus
+import indicator
+import supervisor
+import history
+import meters
 
 # Allocate buffer for micropython to handle exceptions in IRQs
 micropython.alloc_emergency_exception_buf(100)
@@ -41,32 +50,6 @@ status_message = ""
 log_msg = ""
 
 
-class AsyncBlink:
-    """Manages the status LED using an asyncio task."""
-    def __init__(self, pin):
-        self.led = Pin(pin, Pin.OUT, value=0)
-        self.task = None
-        self.val = True
-
-    async def _run(self, period_ms):
-        while True:
-            self.led.value(self.val)
-            self.val = not self.val
-            await asyncio.sleep_ms(period_ms)
-
-    def freq(self, f):
-        self.stop()
-        if f is not None and f > 0:
-            period_ms = int(1000 // (f * 2))
-            self.task = asyncio.create_task(self._run(period_ms))
-
-    def stop(self):
-        if self.task:
-            self.task.cancel()
-            self.task = None
-        self.led.off()
-
-
 class State:
     (
         BOOTING,
@@ -83,31 +66,15 @@ class State:
         RUNNING: "RUNNING",
         ERROR: "ERROR",
     }
-    _COLORS = {
-        BOOTING: (0, 64, 128),
-        CONNECTING: (128, 128, 0),
-        IDLE: (0, 0, 128),
-        RUNNING: (0, 128, 0),
-        ERROR: (128, 0, 0),
-    }
-    _BLINK_FREQ = {
-        BOOTING: 10,
-        CONNECTING: 3,
-        IDLE: 1,
-        RUNNING: 2,
-        ERROR: 5,
-    }
 
     def __init__(self, state=BOOTING):
-        self.led = NeoPixel(Pin(config.RGB_PIN), 1)
-        self.led2 = AsyncBlink(config.LED_PIN)
         self.set(state)
+        indicator.render()
 
     def set(self, state):
+        """Only records the state, the LEDs follow from indicator.task."""
         self.state = state
-        self.led[0] = self._COLORS.get(state, (32, 32, 32))
-        self.led.write()
-        self.led2.freq(self._BLINK_FREQ.get(state, 0.5))
+        indicator.state = self.text()
         log("DEBUG", f"State = {self.text()}")
 
     def get(self):
@@ -119,37 +86,20 @@ class State:
     def off(self):
         """call this when main loop exits"""
         self.state = None
-        self.led[0] = (0, 0, 0)
-        self.led.write()
-        self.led2.stop()
-
-
-# --- Valve Matrix Definition ---
-valves = (
-    (None, None, None, None),  # 0, All valves are closed
-    (1, 0, None, None),  # 1
-    (1, None, 0, None),  # 2
-    (1, None, None, 0),  # 3
-    (0, 1, None, None),  # 4
-    (None, 1, 0, None),  # 5
-    (None, 1, None, 0),  # 6
-    (0, None, 1, None),  # 7
-    (None, 0, 1, None),  # 8
-    (None, None, 1, 0),  # 9
-    (0, None, None, 1),  # 10
-    (None, 0, None, 1),  # 11
-    (None, None, 0, 1),  # 12
-)
+        indicator.off()
 
 
 # --- Global Object Instantiation ---
 pump = PWM(Pin(config.PUMP_PIN), freq=config.PUMP_PWM_FREQ, duty=0)
 meter = Counter(0, Pin(config.METER_PIN, Pin.IN), filter_ns=1_000_000)
-valve_bus_pins = [Pin(x, Pin.IN) for x in config.VALVE_BUS_PINS]
+branch_meters = meters.init(Counter)
+valve_driver = valvebus.create()
+ZONES = valve_driver.zones
 task_cycle = None
-nvs = NVS("ic")
+zone_progress = 0   # % of the current zone volume dispensed
+_abort_valve = False
+time_changed = asyncio.Event()  # set by net when the RTC is stepped
 settings = config.DEFAULT_SETTINGS
-rgb = NeoPixel(Pin(config.RGB_PIN), 1)
 current_state = State()
 
 
@@ -158,10 +108,10 @@ current_state = State()
 def load_settings():
     """Load settings from NVS, or from config file"""
     global settings
-    buf = bytearray(1024)
+    buf = bytearray(config.SETTINGS_MAX_BYTES)
     try:
-        nvs.get_blob('settings', buf)
-        settings = json.loads(buf)
+        n = store.get_blob('settings', buf)
+        settings = json.loads(buf[:n])
         log("INFO", "Settings loaded from NVS")
     except OSError:
         settings = config.DEFAULT_SETTINGS
@@ -172,29 +122,55 @@ def save_settings():
     """Save settings into NVS"""
     global settings
     buf = json.dumps(settings).encode()
-    nvs.set_blob("settings", buf)
-    nvs.commit()
-    log("INFO", f"Settings stored into NVS, {len(buf)} bytes")
+    store.set_blob("settings", buf)
+    log("INFO", f"Settings queued for NVS, {len(buf)} bytes")
+
+
+def settings_error(s):
+    """Check settings, returns (field, message) for the first bad field or None."""
+    def num(v):
+        return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+    if not isinstance(s.get("volumes"), dict):
+        return "volumes", "missing"
+    for k, v in s["volumes"].items():
+        field = "volumes." + k
+        try:
+            if not 1 <= int(k) <= ZONES:
+                return field, f"zone must be 1..{ZONES}"
+        except ValueError:
+            return field, "zone must be a number"
+        if v is None or v == 0:
+            continue
+        if not num(v) or not 50 <= v <= 3000:
+            return field, "must be 50..3000 ml, 0 or null"
+    p = s.get("pumpPower")
+    if not num(p) or not 10 <= p <= 100:
+        return "pumpPower", "must be 10..100"
+    sched = s.get("schedule")
+    if not isinstance(sched, dict):
+        return "schedule", "missing"
+    for key, hi in (("hour", 23), ("minute", 59)):
+        v = sched.get(key)
+        if not num(v) or not 0 <= v <= hi:
+            return "schedule." + key, f"must be 0..{hi}"
+    if not isinstance(s.get("autorun", True), bool):
+        return "autorun", "must be true or false"
+    return None
 
 
 def validate_settings(s):
-    try:
-        for k, v in s["volumes"].items():
-            k = int(k)
-            if k < 1 or k > 12:
-                return False
-            if v is None or v == 0:
-                continue
-            if v < 50 or v > 3000:
-                return False
-        if s["pumpPower"] < 10 or s["pumpPower"] > 100:
-            return False
-        hh = s["schedule"]["hour"]
-        mm = s["schedule"]["minute"]
-        if hh < 0 or hh > 23 or mm < 0 or mm > 59:
-            return False
-    except KeyError:
+    return settings_error(s) is None
+
+
+def update_settings(s):
+    """Replace the settings with s, saving only if something changed."""
+    if s == settings:
         return False
+    # mutate settings in-place to keep references
+    settings.clear()
+    settings.update(s)
+    save_settings()
     return True
 
 
@@ -202,7 +178,7 @@ def load_last_message():
     global last_run_msg
     buf = bytearray(254)
     try:
-        n = nvs.get_blob('last_msg', buf)
+        n = store.get_blob('last_msg', buf)
         last_run_msg = buf[:n].decode()
     except OSError:
         log("INFO", "No last run message saved")
@@ -211,26 +187,31 @@ def load_last_message():
 def restore_persistent_data():
     """Restore meter count and last_run from NVS."""
     global last_run
+    store.recover()
     try:
-        stored_counter = nvs.get_i32("cnt")
+        stored_counter = store.get_i32("cnt")
         meter.value(stored_counter)
         log("INFO", f"Water meter restored to {stored_counter}")
-        last_run = nvs.get_i32("last_run")
+        last_run = store.get_i32("last_run")
         log("INFO", f"last_run loaded: {last_run}")
     except OSError:
         log("WARNING", "Stored value for meter not found!")
+    # checkpoint the meter during long cycles, so a reset loses few pulses
+    store.watch("cnt", meter.value)
+    store.watch("run_p", _item_pulses)
+    meters.restore()
 
 
 # --- Core Logic Functions ---
+def set_valve(valve_id):
+    """Open a specific valve, 0 closes all. No logging, used by dispense."""
+    supervisor.valve(valve_id)
+    valve_driver.set(valve_id)
+
+
 def open_valve(valve_id):
-    """Sets the valve bus pins to open a specific valve."""
     log("DEBUG", f"Setting valve matrix for valve_id: {valve_id}")
-    for i, pin in enumerate(valve_bus_pins):
-        lvl = valves[valve_id][i]
-        if lvl is not None:
-            pin.init(mode=Pin.OUT, value=lvl)
-        else:
-            pin.init(mode=Pin.IN)
+    set_valve(valve_id)
 
 
 def pump_start():
@@ -244,90 +225,331 @@ def pump_stop():
 
 
 async def valve_ml(valve, ml):
-    global error_message, status_message
+    """Dispense ml through valve and return the ml seen by the main meter.
+    The valve is closed by the dispense executor."""
+    global error_message, status_message, _abort_valve, zone_progress
 
     if ml is None or ml == 0:
         log("INFO", f"Zero amount for valve {valve}")
-        return
+        return 0
 
     timeout_ms = ml * config.MIN_FLOW_S_PER_L
-    pulses_needed = int(ml * config.PULSES_PER_LITER / 1000)
+    # a zone on a branch is counted on the branch meter, the main meter
+    # follows its calibration curve at the zone's flow rate
+    meter_id, ppl = meters.meter_for(valve)
+    if not meter_id:
+        import calib
+        ppl = calib.zone_ppl(valve)
+    pulses_needed = int(ml * ppl / 1000)
     status_message = f"Dispensing {ml}ml from valve {valve} ({pulses_needed} pulses)"
     log("INFO", status_message)
 
-    start_cnt = meter.value()
-    start_time = time.ticks_ms()
-    open_valve(valve)
+    _abort_valve = False
+    zone_progress = 0
+    low_water = False
+    main_start = meter.value()
+    dispense.start(valve, pulses_needed, timeout_ms, meter_id)
+    try:
+        while dispense.busy():
+            await asyncio.sleep_ms(10)
+            supervisor.beat("cycle")
+            pulses = dispense.st[dispense.PULSES]
+            zone_progress = indicator.progress = pulses * 100 // max(1, pulses_needed)
+            if dispense.mode == "async" and pulses_needed - pulses <= config.GC_HOLD_PULSES:
+                mem.hold()
+            if tank.sensor_low():
+                low_water = True
+                dispense.abort()
+            elif _abort_valve:
+                dispense.abort()
+    finally:
+        if dispense.busy():
+            dispense.abort()
+        mem.release()
+        indicator.progress = -1
+        main_pulses = meter.value() - main_start
+        tank.record(valve, main_pulses)
+        import calib
+        main_ml = calib.zone_ml(valve, main_pulses)
+        if meter_id:
+            meters.check(valve, main_pulses, dispense.st[dispense.PULSES])
+        elif dispense.st[dispense.RESULT] == dispense.DONE:
+            calib.observe(valve, main_pulses, dispense.st[dispense.DURATION])
+
+    result = dispense.st[dispense.RESULT]
+    history.add(_run_id, valve, ml, dispense.st[dispense.PULSES], ppl, dispense.st[dispense.DURATION], result)
+    if result == dispense.DRY or low_water:
+        tank.set_dry()
+        raise tank.TankEmpty(f"no flow from valve {valve}, tank empty")
+    if result == dispense.TIMEOUT:
+        log("WARN", f"  Timeout dispensing from valve {valve}")
+    elif result == dispense.ABORTED:
+        log("WARN", f"  Valve {valve} canceled")
+    duration = dispense.st[dispense.DURATION]
+    log("INFO", f"  -> Closed valve {valve}. Dispensed {dispense.st[dispense.PULSES]} pulses in {duration/1000:.1f}s.")
+    return main_ml
+
+
+# --- Run queue ---
+# Every dispensing request (scheduler, web UI, automation) is queued here and
+# served by a single runner task, so the pump and the meter are never shared.
+PRIO_LOW, PRIO_NORMAL, PRIO_HIGH = range(3)
+queue = []          # pending items, highest priority first
+current_item = None
+_item_start = 0     # meter count when current_item started
+_run_id = 0         # start time of the run, groups the zones in the history
+_next_id = 1
+
+
+class Phase:
+    (
+        IDLE,
+        WAIT_PUMP,
+        RAMP_UP,
+        DISPENSE,
+        SHUTDOWN,
+    ) = range(5)
+
+    NAMES = ("IDLE", "WAIT_PUMP", "RAMP_UP", "DISPENSE", "SHUTDOWN")
+
 
-    while meter.value() < start_cnt + pulses_needed:
-        if time.ticks_diff(time.ticks_ms(), start_time) > timeout_ms:
-            log("WARN", f"  Timeout dispensing from valve {valve}")
-            break
-        await asyncio.sleep_ms(10)
+cycle_phase = Phase.IDLE
 
-    duration = time.ticks_diff(time.ticks_ms(), start_time)
-    pulses_dispensed = meter.value() - start_cnt
-    log("INFO", f"  -> Closed valve {valve}. Dispensed {pulses_dispensed} pulses in {duration/1000:.1f}s.")
 
+def _set_phase(phase):
+    global cycle_phase
+    cycle_phase = phase
+    log("DEBUG", f"Cycle phase = {Phase.NAMES[phase]}")
 
-async def run_cycle(program):
-    """Runs a full irrigation cycle based on the 'program' dictionary."""
-    global error_message, last_run_msg, last_run, status_message
-    if current_state.get() != State.IDLE:
-        log("WARN", "Cannot start cycle, system is not idle.")
+
+def _item_pulses():
+    return meter.value() - _item_start if current_item else 0
+
+
+def _checkpoint():
+    """Persist the unfinished part of the run, see resume_cycle().
+
+    The item list is written when it changes, the pulses of the current item
+    are checkpointed by store at a bounded rate.
+    """
+    items = ([current_item] if current_item else []) + queue
+    if not items:
+        store.set_blob("run", "{}")
         return
+    store.set_blob("run", json.dumps({
+        "ts": time.time(),
+        "cur": current_item is not None,
+        "items": [(i["zone"], i["ml"], i["prio"], i["source"][:16]) for i in items],
+    }))
+
+
+def _sort_queue():
+    queue.sort(key=lambda x: (-x["prio"], x["id"]))
+
+
+def check_request(zone, ml, prio=PRIO_NORMAL):
+    """Raise ValueError unless a manual zone request is in range.
+
+    Shared by POST /zone and the MQTT zone command.
+    """
+    if not 1 <= zone <= ZONES or not 10 <= ml <= 3000 or not PRIO_LOW <= prio <= PRIO_HIGH:
+        raise ValueError(f"zone 1..{ZONES}, 10..3000 ml, prio 0..2")
+
+
+def enqueue(zone, ml, prio=PRIO_NORMAL, source="api"):
+    """Queue ml for a zone and return the item id, or None if rejected.
+
+    A zone that is already waiting is coalesced into the pending item (the
+    larger volume and the higher priority win), so repeated requests do not
+    water twice.
+    """
+    global _next_id
+    if not ml or current_state.get() == State.ERROR:
+        return None
+    zone = int(zone)
+    for item in queue:
+        if item["zone"] == zone:
+            item["ml"] = max(item["ml"], ml)
+            if prio > item["prio"]:
+                item["prio"] = prio
+                _sort_queue()
+            _checkpoint()
+            return item["id"]
+    item = {"id": _next_id, "zone": zone, "ml": ml, "prio": prio, "source": source}
+    _next_id += 1
+    queue.append(item)
+    _sort_queue()
+    _checkpoint()
+    _kick()
+    return item["id"]
+
+
+def cancel(item_id):
+    """Drop a queued item, or stop the zone being dispensed now."""
+    global _abort_valve
+    for item in queue:
+        if item["id"] == item_id:
+            queue.remove(item)
+            _checkpoint()
+            return True
+    if current_item and current_item["id"] == item_id:
+        _abort_valve = True
+        return True
+    return False
+
+
+def _kick():
+    global task_cycle
+    if task_cycle is None and current_state.get() == State.IDLE:
+        task_cycle = asyncio.create_task(run_queue())
+
+
+async def run_queue():
+    """Run the pump until the queue is empty."""
+    global error_message, last_run_msg, status_message, current_item, task_cycle, _item_start, _run_id
 
     current_state.set(State.RUNNING)
+    _run_id = time.time()
     log("INFO", "--- Starting Irrigation Cycle ---")
-    last_run = time.time()
-    nvs.set_i32("last_run", last_run)
-    nvs.commit()
-
-    open_valve(0)
-    pump_start()
-    await asyncio.sleep(config.PUMP_RAMP_UP_TIME_S)
 
-    start_cnt = meter.value()
     start_time = time.ticks_ms()
+    zones = 0
+    total_ml = 0
     try:
-        for v, ml in sorted(program.items(), key=lambda x: int(x[0])):
-            v = int(v)
-            await valve_ml(v, ml)
+        # in a fleet, wait until the shared water source is free
+        if config.FLEET_ROLE:
+            import fleet
+            _set_phase(Phase.WAIT_PUMP)
+            await fleet.acquire()
+
+        # the pump slot may take long, deadlines count from here
+        supervisor.arm("cycle")
+        _set_phase(Phase.RAMP_UP)
+        open_valve(0)
+        pump_start()
+        await asyncio.sleep(config.PUMP_RAMP_UP_TIME_S)
+        start_time = time.ticks_ms()
+
+        _set_phase(Phase.DISPENSE)
+        while queue:
+            current_item = queue.pop(0)
+            _item_start = meter.value()
+            store.set_i32("run_p", 0)
+            _checkpoint()
+            program, msg = tank.fit({current_item["zone"]: current_item["ml"]}, meter.value())
+            if msg:
+                log("WARN", msg)
+            for v, ml in program.items():
+                with mem.section("cycle"):
+                    total_ml += await valve_ml(v, ml)
+                zones += 1
+            mem.safe_point("zone")
+            supervisor.beat("cycle")
 
-        end_cnt = meter.value()
         end_time = time.ticks_ms()
         duration = time.ticks_diff(end_time, start_time)
-        total_water = (end_cnt - start_cnt) / config.PULSES_PER_LITER
+        total_water = total_ml / 1000
         lt = fmt_time(localtime())
-        last_run_msg = f"Cycle completed successfully at [{lt}]. Total Time: {duration / 1000:.2f}s Total Water: {total_water:.3f}L"
+        last_run_msg = f"Cycle completed successfully at [{lt}]. Zones: {zones} Total Time: {duration / 1000:.2f}s Total Water: {total_water:.3f}L"
         status_message = ""
         log("INFO", last_run_msg)
+    except tank.TankEmpty as e:
+        queue.clear()
+        last_run_msg = f"Cycle aborted: {e}"
+        log("ERROR", last_run_msg)
     except Exception as e:
+        queue.clear()
         last_run_msg = f"Cycle failed: {e}"
         log("ERROR", last_run_msg)
         current_state.set(State.ERROR)
     finally:
-        log("INFO", "Cycle cleanup: closing all valves and stopping pump.")
-        open_valve(0)
-        await asyncio.sleep_ms(500)
-        pump_stop()
-        nvs.set_i32("cnt", meter.value())
-        nvs.set_blob("last_msg", last_run_msg)
-        nvs.commit()
-        log("INFO", "Water meter saved in NVS.")
-        if current_state.get() != State.ERROR:
-            current_state.set(State.IDLE)
-
-
-async def watchdog():
-    wdt = WDT(timeout=10000)
-    while True:
-        wdt.feed()
-        await asyncio.sleep(1)
+        try:
+            _set_phase(Phase.SHUTDOWN)
+            current_item = None
+            _checkpoint()
+            log("INFO", "Cycle cleanup: closing all valves and stopping pump.")
+            open_valve(0)
+            await asyncio.sleep_ms(500)
+            pump_stop()
+            store.set_i32("cnt", meter.value())
+            meters.save()
+            store.set_blob("last_msg", last_run_msg)
+            log("INFO", "Water meter queued for NVS.")
+            try:
+                history.flush()
+            except Exception as e:
+                log("ERROR", f"History write failed: {e}")
+            # release before going IDLE: a run started by an enqueue during
+            # the await would ask for a lease the late release then drops
+            if config.FLEET_ROLE:
+                try:
+                    import fleet
+                    await fleet.release()
+                except Exception as e:
+                    log("ERROR", f"Fleet: pump slot release failed: {e}")
+        finally:
+            # the run is over, a failure above must not leave it looking busy
+            if current_state.get() != State.ERROR:
+                current_state.set(State.IDLE)
+            _set_phase(Phase.IDLE)
+            supervisor.disarm("cycle")
+            task_cycle = None
+        # items queued during the cleanup start a new run
+        if queue:
+            _kick()
+
+
+async def resume_cycle():
+    """Re-queue the zones of a run that was interrupted by a reset.
+
+    Runs once at boot. The run is resumed only if its last checkpoint is at
+    most CYCLE_RESUME_S old, so a long outage does not water at a random time.
+    """
+    # up to every zone queued plus the current item, see _checkpoint()
+    buf = store.zone_buf(ZONES + 1, 48)
+    try:
+        n = store.get_blob("run", buf)
+        cp = json.loads(buf[:n])
+    except (OSError, ValueError):
+        return
+    items = cp.get("items")
+    if not items:
+        return
+    # the RTC survives a reset but not a power loss, give NTP a chance first
+    if localtime()[0] < 2025:
+        try:
+            await asyncio.wait_for(time_changed.wait(), 120)
+        except asyncio.TimeoutError:
+            pass
+    age = time.time() - cp["ts"]
+    if localtime()[0] < 2025 or age < 0 or age > config.CYCLE_RESUME_S:
+        log("WARN", f"Interrupted run not resumed, {len(items)} zones dropped")
+        store.set_blob("run", "{}")
+        return
+    if cp["cur"]:
+        import calib
+        try:
+            done_ml = calib.zone_ml(items[0][0], store.get_i32("run_p"))
+        except OSError:
+            done_ml = 0
+        items[0] = (items[0][0], items[0][1] - done_ml, items[0][2], items[0][3])
+    log("INFO", f"Resuming interrupted run: {len(items)} zones, interrupted {age} s ago")
+    for zone, ml, prio, source in items:
+        if ml >= 10:
+            enqueue(zone, ml, prio, source)
+
+
+def safety_trip():
+    """Called by the supervisor after its safety timer switched the pump off."""
+    global error_message
+    error_message = "Safety timeout: pump or valve on for too long"
+    log("CRITICAL", error_message)
+    stop_cycle_task()
+    current_state.set(State.ERROR)
 
 
 async def scheduler():
-    global last_run, task_cycle
+    global last_run
 
     def should_run(hr, min_, window=1800, min_period=12 * 60 * 60):
         now = time.time()
@@ -346,41 +568,74 @@ async def scheduler():
 
     log("INFO", "Scheduler started")
     while True:
+        supervisor.beat("scheduler")
         hour = settings["schedule"]["hour"]
         minute = settings["schedule"]["minute"]
         now = time.time()
         lt = localtime(now)
 
         try:
-            if settings.get("autorun", True) and should_run(hour, minute):
+            # satellites are started by the fleet coordinator
+            if settings.get("autorun", True) and config.FLEET_ROLE != "satellite" and should_run(hour, minute):
                 log("INFO", "Scheduler: ready to run taks")
-                if current_state.get() == State.IDLE:
-                    program = settings["volumes"]
-                    task_cycle = asyncio.create_task(run_cycle(program))
-                    log("INFO", f"Scheduler: task started at {fmt_time(lt)}")
+                if config.FLEET_ROLE == "coordinator":
+                    import fleet
+                    asyncio.create_task(fleet.trigger_satellites())
+                if start_cycle_task(PRIO_LOW, "schedule"):
+                    log("INFO", f"Scheduler: program queued at {fmt_time(lt)}")
                 else:
-                    log("WARNING", f"Scheduler: not IDLE: {current_state.text()}")
+                    log("WARNING", f"Scheduler: program not queued: {current_state.text()}")
         except Exception as e:
             sys.print_exception(e)
 
-        await asyncio.sleep(60 - lt[5])
+        # Wake up early if the clock was stepped, the target may have moved
+        try:
+            await asyncio.wait_for(time_changed.wait(), 60 - lt[5])
+        except asyncio.TimeoutError:
+            pass
+        time_changed.clear()
+
+def summary():
+    """Compact status for MQTT and fleet reports."""
+    item = current_item
+    return {
+        "state": current_state.text(),
+        "tank": round(tank.level_l(meter.value()), 1),
+        "tank_empty": tank.dry or tank.sensor_low(),
+        "leaks": meters.leaks(),
+        "zone": item["zone"] if item else 0,
+        "progress": zone_progress if item else 0,
+        "queued": len(queue),
+        "last_run": last_run,
+        "last_msg": last_run_msg,
+    }
 
-def start_cycle_task():
-    global task_cycle
-    if current_state.get() == State.IDLE:
-        program = settings["volumes"]
-        task_cycle = asyncio.create_task(run_cycle(program))
-        return True
-    return False
+
+def start_cycle_task(prio=PRIO_NORMAL, source="cycle"):
+    """Queue the full settings["volumes"] program, adjusted by the water budget
+    and the soil moisture."""
+    global last_run, last_run_msg
+    if current_state.get() == State.ERROR:
+        return False
+    program = moisture.adjust(budget.scale(settings["volumes"]))
+    program, msg = tank.fit(program, meter.value())
+    if msg:
+        log("WARN", msg)
+        last_run_msg = msg
+        store.set_blob("last_msg", msg)
+    if not any(program.values()):
+        return False
+    last_run = time.time()
+    store.set_i32("last_run", last_run)
+    for v, ml in sorted(program.items(), key=lambda x: int(x[0])):
+        enqueue(v, ml, prio, source)
+    return True
 
 
 def stop_cycle_task():
-    global task_cycle
+    """Cancel the running cycle and everything still queued."""
     if current_state.get() == State.RUNNING and isinstance(task_cycle, asyncio.Task):
+        queue.clear()
         task_cycle.cancel()
         return True
     return False
-
-
-
-
@@ -1,14 +1,59 @@
 # main.py
 import sys
+import select
+import time
 import uasyncio as asyncio
+import machine
 from machine import Pin
-import aiorepl
 
 import config
-import utils
-import logic
-import webapp
-import net
+import ota
+# swap in a staged update (or roll back a failed one) before loading the app
+ota.apply()
+try:
+    import utils
+    # logic puts the pump and valve pins into a safe state on import, so it
+    # comes before the rest of the app; only the OTA swap above runs earlier
+    import logic
+    boot_times = [("outputs safe", time.ticks_ms())]
+
+    import webapp
+    import net
+    import store
+    import tank
+    import budget
+    import moisture
+    import mem
+    import dispense
+    import indicator
+    import supervisor
+    import history
+    boot_times.append(("imports", time.ticks_ms()))
+except Exception as e:
+    # a broken update must not leave the board sitting in the REPL: reset, so
+    # ota.apply() counts the boot and rolls back after OTA_MAX_TRIES. The
+    # pause leaves time for Ctrl-C on the serial console.
+    sys.print_exception(e)
+    print("Import failed, reset in 5 sec")
+    time.sleep(5)
+    machine.reset()
+
+
+async def confirm_update():
+    await asyncio.sleep(config.OTA_CONFIRM_S)
+    if logic.current_state.get() != logic.State.ERROR and ota.confirm():
+        utils.log("INFO", "OTA update confirmed")
+
+
+async def repl():
+    # the REPL is rarely used, import it on the first key press
+    poll = select.poll()
+    poll.register(sys.stdin, select.POLLIN)
+    while not poll.poll(0):
+        await asyncio.sleep_ms(200)
+    import aiorepl
+    utils.log("INFO", "asyncio REPL started")
+    await aiorepl.task()
 
 
 def main():
@@ -21,19 +66,47 @@ def main():
     logic.restore_persistent_data()
     logic.load_settings()
     logic.load_last_message()
+    tank.load(logic.ZONES)
+    budget.load()
+    history.load()
+    moisture.init()
+    mem.init()
+    mode = dispense.init([logic.meter] + logic.branch_meters, logic.set_valve, logic.pump)
+    utils.log("INFO", f"Dispense executor: {mode}")
     logic.current_state.set(logic.State.IDLE)
+    boot_times.append(("restore", time.ticks_ms()))
 
-    # Start background tasks
-    asyncio.create_task(aiorepl.task())
-    utils.log("INFO", "asyncio REPL started")
-
-    asyncio.create_task(webapp.app.serve())
+    # Start background tasks, the critical ones under the supervisor
+    supervisor.safety(logic.pump, logic.set_valve)
+    deadlines = config.SUPERVISOR_DEADLINES
+    supervisor.spawn("web", webapp.app.serve)
     utils.log("INFO", f"Web server started on port {config.WEB_SERVER_PORT}.")
 
-    asyncio.create_task(logic.watchdog())
-    asyncio.create_task(net.connect_wifi())
+    asyncio.create_task(store.commit_task())
+    asyncio.create_task(indicator.task())
+    net.on_wifi(indicator.set_wifi)
+    asyncio.create_task(supervisor.run(logic.safety_trip))
+    supervisor.spawn("wifi", net.connect_wifi, deadlines["wifi"])
     asyncio.create_task(net.sync_time())
-    asyncio.create_task(logic.scheduler())
+    supervisor.spawn("scheduler", logic.scheduler, deadlines["scheduler"])
+    supervisor.watch("cycle", deadlines["cycle"], logic.stop_cycle_task)
+    asyncio.create_task(logic.resume_cycle())
+    asyncio.create_task(tank.monitor(logic.meter))
+    if moisture.probes:
+        asyncio.create_task(moisture.sampler())
+    if config.FLEET_ROLE == "satellite":
+        import fleet
+        asyncio.create_task(fleet.reporter(logic.summary))
+    if config.MQTT_BROKER:
+        import mqtt
+        asyncio.create_task(mqtt.client())
+    asyncio.create_task(repl())
+    if config.REPL_PASSWORD:
+        import netrepl
+        asyncio.create_task(netrepl.serve())
+    asyncio.create_task(confirm_update())
+    boot_times.append(("tasks", time.ticks_ms()))
+    utils.log("INFO", "Boot timing (ms since reset): " + ", ".join(f"{n} {t}" for n, t in boot_times))
 
     asyncio.run_until_complete()
 
@@ -47,9 +120,12 @@ if __name__ == "__main__":
         utils.log("CRITICAL", f"A critical error occurred in main: {e}")
         sys.print_exception(e)
     finally:
+        dispense.deinit()
         logic.pump_stop()
         logic.open_valve(0)
         logic.current_state.off()
+        store.flush()
+        history.flush()
         utils.log("INFO", "System halted. Cleanup complete. Watchdog will restart in 10 secs.")
 
 
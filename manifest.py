@@ -0,0 +1,12 @@
+# manifest.py
+# Freeze the application into a custom firmware build:
+#   make -C ports/esp32 BOARD=ESP32_GENERIC_C6 FROZEN_MANIFEST=/path/to/manifest.py
+# main.py and config.py are not frozen, they stay editable on the filesystem.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+for m in ("logic", "net", "utils", "webapp", "webadmin", "store", "tank", "budget", "moisture", "mqtt", "mem", "dispense", "selftest", "ota", "fleet", "valvebus", "meters", "calib", "netrepl", "indicator", "supervisor", "history"):
+    module(m + ".py")
+
+for m in ("aiorepl", "tz", "web"):
+    module(m + ".py", base_path="lib")
@@ -0,0 +1,114 @@
+# mem.py
+# Heap accounting and GC control. Collections are done at safe points (between
+# zones, after HTTP responses) so the automatic GC rarely fires in the middle
+# of dispensing, and is held off entirely while a valve is about to close.
+
+import gc
+import time
+
+import config
+from utils import log
+
+
+stats = {"collections": 0, "last_us": 0, "max_us": 0, "total_us": 0}
+alloc = {}          # subsystem -> bytes allocated (approximate)
+_held = False
+
+
+def init():
+    gc.collect()
+    if config.GC_THRESHOLD:
+        gc.threshold(config.GC_THRESHOLD)
+
+
+def collect(where=""):
+    """Run gc.collect() and record the pause."""
+    t = time.ticks_us()
+    gc.collect()
+    us = time.ticks_diff(time.ticks_us(), t)
+    stats["collections"] += 1
+    stats["last_us"] = us
+    stats["total_us"] += us
+    if us > stats["max_us"]:
+        stats["max_us"] = us
+        log("DEBUG", f"GC pause {us}us at {where}")
+
+
+def safe_point(where=""):
+    """Collect now if free heap is below GC_FREE_MIN."""
+    if not _held and gc.mem_free() < config.GC_FREE_MIN:
+        collect(where)
+
+
+def hold():
+    """Keep the automatic GC out of a timing critical window."""
+    global _held
+    if not _held:
+        _held = True
+        gc.disable()
+
+
+def release():
+    global _held
+    if _held:
+        _held = False
+        gc.enable()
+
+
+class section:
+    """Context manager that charges heap allocations to a subsystem.
+
+    Approximate: blocks that await may include other tasks' allocations,
+    and blocks where a collection happened are not counted.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def begin(self):
+        self.start = gc.mem_alloc()
+        return self
+
+    def end(self):
+        n = gc.mem_alloc() - self.start
+        if n > 0:
+            alloc[self.name] = alloc.get(self.name, 0) + n
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, *args):
+        self.end()
+
+
+def largest_free():
+    """Largest allocatable block in bytes, by binary search over bytearray sizes.
+
+    Slow: every failed allocation runs a full collection first, so one call
+    costs about log2(free) / 2 collections (8 or so). Only call it when the
+    controller is idle.
+    """
+    lo, hi = 0, gc.mem_free()
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        try:
+            b = bytearray(mid)
+            del b
+            lo = mid
+        except MemoryError:
+            hi = mid - 1
+    return lo
+
+
+def report(probe=False):
+    """Heap report. probe adds the largest free block and the fragmentation,
+    see largest_free() for the cost, otherwise they are None."""
+    free = gc.mem_free()
+    big = largest_free() if probe else None
+    return {
+        "free": free,
+        "alloc": gc.mem_alloc(),
+        "largest-free": big,
+        "fragmentation": (100 - big * 100 // free if free else 0) if probe else None,
+        "gc": stats,
+        "subsystems": alloc,
+    }
@@ -0,0 +1,86 @@
+# meters.py
+# Branch flow meters. The main meter (logic.meter) measures everything that
+# leaves the tank; a branch meter measures only its own zones. A zone on a
+# branch is dispensed by its branch count, and the two volumes are compared
+# after each zone: more water through the main meter than through the branch
+# means a leak between them.
+
+from machine import Pin
+
+import config
+import store
+from utils import log
+
+
+class Branch:
+    def __init__(self, name, counter, ppl, zones):
+        self.name = name
+        self.counter = counter
+        self.ppl = ppl
+        self.zones = zones
+        self.leak = ""
+
+    def liters(self):
+        return self.counter.value() / self.ppl
+
+
+branches = []
+_by_zone = {}   # zone -> index into dispense meters, 1-based
+
+
+def init(counter_cls):
+    """Create a pulse counter unit per BRANCH_METERS entry, unit 0 is the main meter."""
+    for i, (name, (pin, ppl, zones)) in enumerate(sorted(config.BRANCH_METERS.items())):
+        cnt = counter_cls(i + 1, Pin(pin, Pin.IN), filter_ns=1_000_000)
+        branches.append(Branch(name, cnt, ppl, zones))
+        for z in zones:
+            _by_zone[z] = len(branches)
+    return [b.counter for b in branches]
+
+
+def restore():
+    """Restore the branch totals and keep checkpointing them with the main meter."""
+    for b in branches:
+        key = "m_" + b.name[:13]
+        try:
+            b.counter.value(store.get_i32(key))
+        except OSError:
+            pass
+        store.watch(key, b.counter.value)
+
+
+def save():
+    for b in branches:
+        store.set_i32("m_" + b.name[:13], b.counter.value())
+
+
+def meter_for(zone):
+    """Dispense meter index and pulses per liter for zone, 0 is the main meter."""
+    i = _by_zone.get(zone, 0)
+    return i, branches[i - 1].ppl if i else config.PULSES_PER_LITER
+
+
+def check(zone, main_pulses, branch_pulses):
+    """Compare main and branch volume of one zone, flag a leak on mismatch."""
+    i = _by_zone.get(zone)
+    if not i:
+        return
+    b = branches[i - 1]
+    main_ml = main_pulses * 1000 // config.PULSES_PER_LITER
+    branch_ml = branch_pulses * 1000 // b.ppl
+    if main_ml - branch_ml > max(main_ml, 100) * config.LEAK_TOLERANCE // 100:
+        b.leak = f"zone {zone}: {main_ml} ml main, {branch_ml} ml branch"
+        log("WARN", f"Leak on branch {b.name}, {b.leak}")
+    else:
+        b.leak = ""
+
+
+def leaks():
+    return [b.name for b in branches if b.leak]
+
+
+def status():
+    return {
+        b.name: {"liters": round(b.liters(), 2), "zones": b.zones, "leak": b.leak}
+        for b in branches
+    }
@@ -0,0 +1,92 @@
+# moisture.py
+# Soil moisture probes: low-duty background sampling with oversampling and
+# a median filter over a small ring buffer per zone.
+
+import uasyncio as asyncio
+from array import array
+from machine import ADC, Pin
+
+import config
+from utils import log
+
+
+class _Probe:
+    def __init__(self, adc):
+        self.adc = adc
+        self.window = array("H", [0] * config.MOISTURE_WINDOW)
+        self.n = 0      # number of samples taken, capped at the window size
+        self.i = 0
+
+    def sample(self):
+        acc = 0
+        for _ in range(config.MOISTURE_OVERSAMPLE):
+            acc += self.adc.read_u16()
+        self.window[self.i] = acc // config.MOISTURE_OVERSAMPLE
+        self.i = (self.i + 1) % len(self.window)
+        self.n = min(self.n + 1, len(self.window))
+
+    def raw(self):
+        if not self.n:
+            return None
+        w = sorted(self.window[:self.n])
+        return w[self.n // 2]
+
+
+probes = {}     # zone (str) -> _Probe
+
+
+def init(adcs=None):
+    """Create the probes from MOISTURE_PINS.
+
+    adcs can map zones to any object with read_u16(), e.g. a simulated ADC.
+    """
+    if adcs is None:
+        adcs = {}
+        for zone, pin in config.MOISTURE_PINS.items():
+            adc = ADC(Pin(pin))
+            adc.atten(ADC.ATTN_11DB)
+            adcs[zone] = adc
+    for zone, adc in adcs.items():
+        probes[str(zone)] = _Probe(adc)
+
+
+def percent(zone):
+    """Moisture in %, 0 = MOISTURE_DRY reading, 100 = MOISTURE_WET. None without a probe."""
+    p = probes.get(str(zone))
+    raw = p.raw() if p else None
+    if raw is None:
+        return None
+    pct = (config.MOISTURE_DRY - raw) * 100 // (config.MOISTURE_DRY - config.MOISTURE_WET)
+    return max(0, min(100, pct))
+
+
+def adjust(program):
+    """Skip zones at or above MOISTURE_SKIP %, trim linearly above MOISTURE_TRIM %."""
+    out = {}
+    for zone, ml in program.items():
+        pct = percent(zone)
+        if ml and pct is not None and pct > config.MOISTURE_TRIM:
+            if pct >= config.MOISTURE_SKIP:
+                log("INFO", f"Zone {zone} skipped, moisture {pct}%")
+                ml = 0
+            else:
+                ml = ml * (config.MOISTURE_SKIP - pct) // (config.MOISTURE_SKIP - config.MOISTURE_TRIM)
+                log("INFO", f"Zone {zone} trimmed to {ml}ml, moisture {pct}%")
+        out[zone] = ml
+    return out
+
+
+def status():
+    return {zone: percent(zone) for zone in probes}
+
+
+async def sampler():
+    """Sample every probe once per MOISTURE_PERIOD_S, yielding between probes."""
+    while True:
+        for p in probes.values():
+            try:
+                p.sample()
+            except OSError as e:
+                log("ERROR", f"Moisture probe read failed: {e}")
+            await asyncio.sleep_ms(0)
+        await asyncio.sleep(config.MOISTURE_PERIOD_S)
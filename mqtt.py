@@ -0,0 +1,228 @@
+# mqtt.py
+# Minimal asyncio MQTT 3.1.1 client: publishes state on change, accepts
+# run/stop/zone commands and announces itself to Home Assistant.
+
+import uasyncio as asyncio
+import json
+import struct
+import time
+
+import config
+import logic
+import net
+from utils import log
+
+
+connected = False
+_w = None
+_pid = 0
+_unacked = set()        # QoS 1 packet ids waiting for PUBACK
+_last = None            # last published state payload
+_wake = asyncio.Event()
+
+T_STATE = config.MQTT_PREFIX + "/state"
+T_AVAIL = config.MQTT_PREFIX + "/status"
+T_CMD = config.MQTT_PREFIX + "/cmd/"
+
+
+def _on_wifi(up):
+    if up:
+        _wake.set()
+
+
+net.on_wifi(_on_wifi)
+
+
+def _str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def _packet(ptype, body):
+    n = len(body)
+    hdr = bytearray([ptype])
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        hdr.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(hdr) + body
+
+
+async def _read_packet(r):
+    hdr = await r.readexactly(1)
+    n = shift = 0
+    while True:
+        b = (await r.readexactly(1))[0]
+        n |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            break
+    return hdr[0], (await r.readexactly(n) if n else b"")
+
+
+async def publish(topic, msg, retain=False, qos=0):
+    global _pid
+    if not connected:
+        return False
+    if not isinstance(msg, bytes):
+        msg = msg.encode()
+    flags = 0x30 | (qos << 1) | (1 if retain else 0)
+    body = _str(topic)
+    if qos:
+        _pid = _pid % 0xFFFF + 1
+        pid = _pid
+        body += struct.pack("!H", pid)
+        _unacked.add(pid)
+    for attempt in range(2 if qos else 1):
+        _w.write(_packet(flags | (0x08 if attempt else 0), body + msg))
+        await _w.drain()
+        if not qos:
+            return True
+        start = time.ticks_ms()
+        while pid in _unacked and time.ticks_diff(time.ticks_ms(), start) < config.MQTT_ACK_MS:
+            await asyncio.sleep_ms(20)
+        if pid not in _unacked:
+            return True
+    _unacked.discard(pid)
+    return False
+
+
+def _command(topic, payload):
+    cmd = topic[len(T_CMD):]
+    log("INFO", f"MQTT command {cmd}: {payload}")
+    if cmd == "run":
+        logic.start_cycle_task(source="mqtt")
+    elif cmd == "stop":
+        logic.stop_cycle_task()
+    elif cmd.startswith("zone/"):
+        # <prefix>/cmd/zone/<n>, payload = ml
+        try:
+            zone, ml = int(cmd[5:]), int(payload)
+            logic.check_request(zone, ml)
+        except ValueError as e:
+            log("WARN", f"MQTT zone command rejected: {cmd} {payload}: {e}")
+            return
+        logic.enqueue(zone, ml, logic.PRIO_HIGH, "mqtt")
+
+
+async def _reader(r):
+    while True:
+        ptype, body = await _read_packet(r)
+        kind = ptype & 0xF0
+        if kind == 0x30:
+            qos = (ptype >> 1) & 3
+            n = struct.unpack_from("!H", body)[0]
+            topic = body[2:2 + n].decode()
+            ofs = 2 + n
+            if qos:
+                _w.write(_packet(0x40, body[ofs:ofs + 2]))
+                await _w.drain()
+                ofs += 2
+            try:
+                _command(topic, body[ofs:].decode())
+            except Exception as e:
+                log("ERROR", f"MQTT command {topic} failed: {e}")
+        elif kind == 0x40:
+            _unacked.discard(struct.unpack("!H", body)[0])
+
+
+async def _discovery():
+    node = config.MQTT_CLIENT_ID
+    dev = {"identifiers": [node], "name": "Irrigation Controller", "manufacturer": "DIY"}
+    base = {"state_topic": T_STATE, "availability_topic": T_AVAIL, "device": dev}
+    entities = (
+        ("sensor", "state", {"name": "State", "value_template": "{{ value_json.state }}"}),
+        ("sensor", "tank", {"name": "Tank", "unit_of_measurement": "L",
+                            "value_template": "{{ value_json.tank }}"}),
+        ("binary_sensor", "tank_empty", {"name": "Tank empty", "device_class": "problem",
+                                         "value_template": "{{ 'ON' if value_json.tank_empty else 'OFF' }}"}),
+        ("sensor", "zone", {"name": "Zone", "value_template": "{{ value_json.zone }}"}),
+        ("sensor", "progress", {"name": "Zone progress", "unit_of_measurement": "%",
+                                "value_template": "{{ value_json.progress }}"}),
+        ("sensor", "last_msg", {"name": "Last message", "value_template": "{{ value_json.last_msg }}"}),
+        ("button", "run", {"name": "Run", "command_topic": T_CMD + "run"}),
+        ("button", "stop", {"name": "Stop", "command_topic": T_CMD + "stop"}),
+    )
+    for comp, obj, cfg in entities:
+        cfg.update(base)
+        cfg["unique_id"] = f"{node}_{obj}"
+        topic = f"{config.MQTT_DISCOVERY_PREFIX}/{comp}/{node}/{obj}/config"
+        await publish(topic, json.dumps(cfg), retain=True, qos=1)
+
+
+async def _connect():
+    global _w, connected
+    r, w = await asyncio.open_connection(config.MQTT_BROKER, config.MQTT_PORT)
+    flags = 0x02 | 0x04 | 0x20      # clean session, retained will
+    payload = _str(config.MQTT_CLIENT_ID) + _str(T_AVAIL) + _str("offline")
+    if config.MQTT_USER:
+        flags |= 0xC0
+        payload += _str(config.MQTT_USER) + _str(config.MQTT_PASSWORD)
+    body = _str("MQTT") + bytes([4, flags]) + struct.pack("!H", config.MQTT_KEEPALIVE) + payload
+    ok = False
+    try:
+        w.write(_packet(0x10, body))
+        await w.drain()
+        ptype, ack = await asyncio.wait_for(_read_packet(r), 10)
+        if ptype != 0x20 or ack[1] != 0:
+            raise OSError(f"CONNACK {ack[1] if len(ack) > 1 else '?'}")
+        w.write(_packet(0x82, struct.pack("!H", 1) + _str(T_CMD + "#") + b"\x01"))
+        await w.drain()
+        ok = True
+    finally:
+        # a refused or timed out handshake must not leak the socket
+        if not ok:
+            w.close()
+    _w = w
+    connected = True
+    return r
+
+
+async def _publisher():
+    """Send the state when it changed, at most every MQTT_PUBLISH_MS."""
+    global _last
+    ping = time.ticks_ms()
+    while True:
+        st = json.dumps(logic.summary())
+        if st != _last:
+            await publish(T_STATE, st, retain=True)
+            _last = st
+            ping = time.ticks_ms()
+        elif time.ticks_diff(time.ticks_ms(), ping) > config.MQTT_KEEPALIVE * 500:
+            _w.write(b"\xc0\x00")
+            await _w.drain()
+            ping = time.ticks_ms()
+        await asyncio.sleep_ms(config.MQTT_PUBLISH_MS)
+
+
+async def client():
+    global connected, _last
+    backoff = 1
+    while True:
+        if not net.wifi_connected:
+            await _wake.wait()
+        _wake.clear()
+        tasks = ()
+        try:
+            r = await _connect()
+            log("INFO", f"MQTT connected to {config.MQTT_BROKER}")
+            backoff = 1
+            _last = None
+            # the reader must run first, it collects the PUBACKs
+            tasks = (asyncio.create_task(_reader(r)),)
+            await publish(T_AVAIL, "online", retain=True, qos=1)
+            await _discovery()
+            tasks += (asyncio.create_task(_publisher()),)
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            log("WARN", f"MQTT connection lost: {e}. Retry in {backoff} sec")
+        for t in tasks:
+            t.cancel()
+        connected = False
+        _unacked.clear()
+        if _w:
+            _w.close()
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, config.MQTT_BACKOFF_MAX_S)
@@ -1,51 +1,307 @@
 import uasyncio as asyncio
 import network
+import socket
+import struct
+import time
+import machine
 
 from tz import localtime
 
 import config
 from utils import log
 import logic
+import store
+import supervisor
+
+
+# --- Wi-Fi supervisor ---
+wifi_connected = False
+wifi_ap_active = False
+_ap_refused = False     # logged once that the AP has no usable key
+wifi_stats = {"reconnects": 0, "last_outage_ms": 0, "last_connect_ms": 0}
+_wifi_listeners = []
+_bssid = None           # BSSID of the last AP we associated with, skips the scan
+
+
+def on_wifi(cb):
+    """Register cb(connected) to be called on every link up/down transition."""
+    _wifi_listeners.append(cb)
+
+
+def _publish(connected):
+    global wifi_connected
+    wifi_connected = connected
+    for cb in _wifi_listeners:
+        try:
+            cb(connected)
+        except Exception as e:
+            log("ERROR", f"WiFi listener failed: {e}")
+
+
+def _load_bssid():
+    global _bssid
+    buf = bytearray(6)
+    try:
+        if store.get_blob("bssid", buf) == 6:
+            _bssid = bytes(buf)
+    except OSError:
+        pass
+
+
+def _cache_bssid(wlan):
+    """Remember the strongest AP for our SSID. The scan blocks, so run it only once."""
+    global _bssid
+    try:
+        aps = [ap for ap in wlan.scan() if ap[0] == config.SSID.encode()]
+    except OSError:
+        return
+    if aps:
+        ap = max(aps, key=lambda x: x[3])
+        _bssid = ap[1]
+        store.set_blob("bssid", _bssid)
+        log("INFO", f"WiFi AP cached: channel {ap[2]}, RSSI {ap[3]}")
+
+
+async def _associate(wlan, timeout_ms, bssid=None):
+    try:
+        wlan.disconnect()
+    except OSError:
+        pass
+    if bssid:
+        wlan.connect(config.SSID, config.WLAN_KEY, bssid=bssid)
+    else:
+        wlan.connect(config.SSID, config.WLAN_KEY)
+    start = time.ticks_ms()
+    while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+        if wlan.isconnected():
+            return True
+        await asyncio.sleep_ms(100)
+    return False
+
+
+def _set_ap(active):
+    """Fallback access point, so the config UI stays reachable without the home network."""
+    global wifi_ap_active
+    global _ap_refused
+    if active == wifi_ap_active or not config.WIFI_AP_SSID:
+        return
+    if active and len(config.WIFI_AP_KEY) < 8:
+        # an open AP would hand /run, /ota and /restart to anyone nearby
+        if not _ap_refused:
+            log("ERROR", "WiFi fallback AP not started, WIFI_AP_KEY needs at least 8 chars")
+            _ap_refused = True
+        return
+    ap = network.WLAN(network.AP_IF)
+    if active:
+        ap.active(True)
+        ap.config(essid=config.WIFI_AP_SSID, key=config.WIFI_AP_KEY, security=3)
+        log("WARN", f"WiFi fallback AP '{config.WIFI_AP_SSID}' started. IP: {ap.ifconfig()[0]}")
+    else:
+        ap.active(False)
+        log("INFO", "WiFi fallback AP stopped")
+    wifi_ap_active = active
 
 
 async def connect_wifi():
-    wlan = network.WLAN()
+    """Watch the link every WIFI_CHECK_MS and reconnect with exponential backoff."""
+    wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
+    _load_bssid()
+    backoff = config.WIFI_BACKOFF_MIN_MS
+    down_since = time.ticks_ms()
     while True:
-        log("DEBUG", "connect_wifi()")
+        supervisor.beat("wifi")
         try:
-            if not wlan.isconnected():
-                log("INFO", f"Connecting to network: {config.SSID}")
-                wlan.connect(config.SSID, config.WLAN_KEY)
-                # Poll for connection with sleep intervals
-                for _ in range(int(config.WIFI_TIMEOUT / 100)):
-                    if wlan.isconnected():
-                        break
-                    await asyncio.sleep_ms(100)
             if wlan.isconnected():
-                log("INFO", f"WiFi connected. IP: {wlan.ifconfig()[0]}")
-                await asyncio.sleep(600)
-            else:
-                log("ERROR", "WiFi connection timed out. Retry in 15 sec")
-                wlan.active(False)
-                await asyncio.sleep(15)
-                wlan.active(True)
+                if not wifi_connected:
+                    wifi_stats["last_connect_ms"] = time.ticks_diff(time.ticks_ms(), down_since)
+                    log("INFO", f"WiFi connected in {wifi_stats['last_connect_ms']}ms. IP: {wlan.ifconfig()[0]}")
+                    backoff = config.WIFI_BACKOFF_MIN_MS
+                    _set_ap(False)
+                    _publish(True)
+                    if _bssid is None and logic.current_state.get() == logic.State.IDLE:
+                        _cache_bssid(wlan)
+                await asyncio.sleep_ms(config.WIFI_CHECK_MS)
+                continue
+
+            if wifi_connected:
+                log("WARN", "WiFi link lost")
+                wifi_stats["reconnects"] += 1
+                down_since = time.ticks_ms()
+                _publish(False)
+
+            log("INFO", f"Connecting to network: {config.SSID}")
+            if _bssid and await _associate(wlan, config.WIFI_FAST_TIMEOUT, _bssid):
+                continue
+            if await _associate(wlan, config.WIFI_TIMEOUT):
+                continue
+
+            down_ms = time.ticks_diff(time.ticks_ms(), down_since)
+            wifi_stats["last_outage_ms"] = down_ms
+            if down_ms > config.WIFI_AP_FALLBACK_S * 1000:
+                _set_ap(True)
+            log("ERROR", f"WiFi connection timed out. Retry in {backoff}ms")
+            await asyncio.sleep_ms(backoff)
+            backoff = min(backoff * 2, config.WIFI_BACKOFF_MAX_MS)
         except Exception as e:
             log("ERROR", f"connect_wifi() Exception {e}. Restarting")
             await asyncio.sleep(3)
 
 
+# --- SNTP client ---
+# Seconds between the NTP era (1900) and the MicroPython epoch (1970 or 2000)
+NTP_DELTA = 2208988800 if time.gmtime(0)[0] == 1970 else 3155673600
+
+ntp_offset_ms = 0       # offset measured at the last successful sync
+ntp_drift_ppm = 0       # estimated RTC drift
+ntp_interval = config.NTP_MIN_INTERVAL
+ntp_last_sync = 0       # time.time() of the last successful sync
+_ntp_addrs = {}         # resolved server addresses, DNS lookups are blocking
+_ntp_wake = asyncio.Event()
+
+
+def _ntp_on_wifi(connected):
+    if connected:
+        _ntp_wake.set()
+
+
+on_wifi(_ntp_on_wifi)
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def _ntp_addr(server):
+    """Resolve "host" or "host:port", cached until a query fails."""
+    addr = _ntp_addrs.get(server)
+    if addr is None:
+        host, _, port = server.partition(":")
+        addr = socket.getaddrinfo(host, int(port or 123), 0, socket.SOCK_DGRAM)[0][-1]
+        _ntp_addrs[server] = addr
+    return addr
+
+
+def _ntp_ts(buf, ofs):
+    """Convert the 64-bit NTP timestamp at buf[ofs] to epoch milliseconds."""
+    sec, frac = struct.unpack_from("!II", buf, ofs)
+    return (sec - NTP_DELTA) * 1000 + (frac * 1000 >> 32)
+
+
+async def ntp_query(server, timeout_ms=config.NTP_TIMEOUT_MS):
+    """Query one server without blocking the loop. Returns (offset_ms, delay_ms)."""
+    pkt = bytearray(48)
+    pkt[0] = 0x1B  # LI=0, VN=3, Mode=3 (client)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        addr = _ntp_addr(server)
+        t1 = _now_ms()
+        start = time.ticks_ms()
+        s.sendto(pkt, addr)
+        while True:
+            # recv raises EAGAIN on a non-blocking socket, readinto would return None
+            try:
+                reply = s.recv(48)
+                break
+            except OSError:
+                pass
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                _ntp_addrs.pop(server, None)
+                raise OSError(f"timeout from {server}")
+            await asyncio.sleep_ms(20)
+        t4 = t1 + time.ticks_diff(time.ticks_ms(), start)
+    finally:
+        s.close()
+    if len(reply) < 48 or reply[1] == 0 or reply[1] > 15 or (reply[0] & 0x07) != 4:
+        raise ValueError(f"bad reply from {server}")
+    t2 = _ntp_ts(reply, 32)
+    t3 = _ntp_ts(reply, 40)
+    offset = ((t2 - t1) + (t3 - t4)) // 2
+    delay = (t4 - t1) - (t3 - t2)
+    return offset, delay
+
+
+def _set_rtc(ms):
+    tm = time.gmtime(ms // 1000)
+    machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], (ms % 1000) * 1000))
+
+
+async def _slew(offset_ms):
+    """Apply a small offset in bounded steps so no single jump is noticeable."""
+    while offset_ms:
+        step = max(-config.NTP_SLEW_MS, min(config.NTP_SLEW_MS, offset_ms))
+        _set_rtc(_now_ms() + step)
+        offset_ms -= step
+        await asyncio.sleep(1)
+
+
+async def ntp_sync():
+    """Query all servers and apply the offset from the one with the lowest RTT."""
+    global ntp_offset_ms, ntp_drift_ppm, ntp_last_sync
+    best = None
+    for server in config.NTP_SERVERS:
+        try:
+            offset, delay = await ntp_query(server)
+            log("DEBUG", f"NTP {server}: offset={offset}ms, delay={delay}ms")
+            if best is None or delay < best[1]:
+                best = (offset, delay)
+        except Exception as e:
+            log("WARN", f"NTP {server} failed: {e}")
+    if best is None:
+        return False
+
+    offset = best[0]
+    now = time.time()
+    if ntp_last_sync:
+        ntp_drift_ppm = offset * 1000 // max(1, now - ntp_last_sync)
+    if abs(offset) >= config.NTP_STEP_MS:
+        _set_rtc(_now_ms() + offset)
+        log("INFO", f"Time stepped by {offset}ms via NTP: {localtime()}")
+        logic.time_changed.set()
+    elif abs(offset) > best[1]:  # smaller offsets are within measurement error
+        asyncio.create_task(_slew(offset))
+    ntp_offset_ms = offset
+    ntp_last_sync = time.time()
+    return True
+
+
+def next_interval(interval, offset_ms, drift_ppm):
+    """Sync interval in sec after a sync that measured offset_ms and drift_ppm."""
+    if abs(offset_ms) >= config.NTP_STEP_MS // 4:
+        return config.NTP_MIN_INTERVAL
+    interval = min(interval * 2, config.NTP_MAX_INTERVAL)
+    if drift_ppm:
+        # ppm is us per sec, so this is how long the drift takes to reach the limit
+        interval = min(interval, config.NTP_DRIFT_MAX_MS * 1000 // abs(drift_ppm))
+    return max(interval, config.NTP_MIN_INTERVAL)
+
+
 async def sync_time():
-    import ntptime
+    """Keep the RTC in sync. The interval doubles while the offset stays small,
+    but not beyond the time in which the measured drift adds up to
+    NTP_DRIFT_MAX_MS."""
+    global ntp_interval
     while True:
+        if not wifi_connected:
+            await _ntp_wake.wait()
+        _ntp_wake.clear()
         log("DEBUG", "sync_time()")
         try:
-            if logic.current_state.get() == logic.State.IDLE:
-                ntptime.settime()
-                log("INFO", f"Time set via NTP: {localtime()}. Next sync after 900 sec")
-                await asyncio.sleep(900)
+            if await ntp_sync():
+                ntp_interval = next_interval(ntp_interval, ntp_offset_ms, ntp_drift_ppm)
+                log("INFO", f"NTP offset {ntp_offset_ms}ms, drift {ntp_drift_ppm}ppm. Next sync after {ntp_interval} sec")
+                await _ntp_sleep(ntp_interval)
+                continue
         except Exception as e:
-            log("WARN", f"Could not set time via NTP: {e}. Retry in 10 sec")
-        await asyncio.sleep(10)
+            log("WARN", f"Could not set time via NTP: {e}")
+        log("WARN", "NTP sync failed. Retry in 10 sec")
+        await _ntp_sleep(10)
 
 
+async def _ntp_sleep(sec):
+    """Sleep, but resync right away when the link comes back."""
+    try:
+        await asyncio.wait_for(_ntp_wake.wait(), sec)
+    except asyncio.TimeoutError:
+        pass
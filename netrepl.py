@@ -0,0 +1,146 @@
+# netrepl.py
+# asyncio REPL over TCP. Each session reads whole lines from the socket, so
+# a slow or idle client never blocks the event loop. print() in a session
+# goes to a bounded buffer that is sent in small chunks with a pause in
+# between; a runaway print can fill the buffer but not the loop.
+# Raw REPL and paste mode are not offered, use the serial REPL for mpremote.
+
+import uasyncio as asyncio
+
+import config
+import web
+from utils import log
+
+sessions = []
+_LOGIN_MAX = 128    # bytes of a password line, longer input closes the connection
+
+
+async def _readline(reader, limit):
+    """readline() that gives up after limit bytes, returns None then."""
+    line = b""
+    while len(line) < limit:
+        c = await reader.read(1)
+        if not c:
+            return line
+        line += c
+        if c == b"\n":
+            return line
+    return None
+
+
+class Session:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.out = []
+        self.size = 0
+        self.dropped = 0
+        # session globals: the main module names, with print bound to the socket
+        self.g = dict(__import__("__main__").__dict__)
+        self.g["print"] = self.print
+
+    def print(self, *args, sep=" ", end="\n"):
+        self.write(sep.join(str(a) for a in args) + end)
+
+    def write(self, s):
+        if self.size + len(s) > config.REPL_MAX_OUTPUT:
+            self.dropped += len(s)
+            return
+        self.out.append(s)
+        self.size += len(s)
+
+    async def flush(self):
+        if self.dropped:
+            self.out.append(f"[{self.dropped} bytes of output dropped]\n")
+        data = "".join(self.out).encode()
+        self.out.clear()
+        self.size = self.dropped = 0
+        for i in range(0, len(data), config.REPL_CHUNK):
+            self.writer.write(data[i:i + config.REPL_CHUNK])
+            await self.writer.drain()
+            await asyncio.sleep_ms(config.REPL_THROTTLE_MS)
+
+    async def execute(self, code):
+        g = self.g
+        try:
+            if "await " in code:
+                # same wrapping as aiorepl.execute, loaded on the first await
+                import aiorepl
+                if m := aiorepl._RE_IMPORT.match(code) or aiorepl._RE_FROM_IMPORT.match(code):
+                    code = "global {}\n    {}".format(m.group(3) or m.group(1), code)
+                elif m := aiorepl._RE_GLOBAL.match(code):
+                    code = "global {}\n    {}".format(m.group(1), code)
+                elif not aiorepl._RE_ASSIGN.search(code):
+                    code = "return {}".format(code)
+                exec("async def __code():\n    {}\n".format(code), g)
+                result = await g["__code"]()
+            else:
+                try:
+                    result = eval(code, g)
+                except SyntaxError:
+                    result = exec(code, g)
+            if result is not None:
+                self.write(repr(result) + "\n")
+        except Exception as e:
+            self.write("{}: {}\n".format(type(e).__name__, e))
+
+    async def login(self):
+        for _ in range(3):
+            self.writer.write(b"Password: ")
+            await self.writer.drain()
+            # read byte by byte, an unauthenticated client can not fill the heap
+            line = await _readline(self.reader, _LOGIN_MAX)
+            if line is None:
+                log("WARN", "REPL password line too long, connection closed")
+                return False
+            if not line:
+                return False
+            if web.compare_digest(line.strip(), config.REPL_PASSWORD.encode()):
+                return True
+            await asyncio.sleep(1)
+        return False
+
+    async def run(self):
+        if not await self.login():
+            return
+        self.writer.write(b"asyncio REPL, Ctrl-D or EOF to close\r\n")
+        while True:
+            self.writer.write(b">>> ")
+            await self.writer.drain()
+            line = await self.reader.readline()
+            if not line or line[:1] == b"\x04":
+                return
+            code = line.decode().strip()
+            if code:
+                await self.execute(code)
+                await self.flush()
+
+
+async def _serve(reader, writer):
+    peer = writer.get_extra_info("peername")
+    if len(sessions) >= config.REPL_MAX_SESSIONS:
+        writer.write(b"Too many sessions\r\n")
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+        return
+    s = Session(reader, writer)
+    sessions.append(s)
+    log("INFO", f"REPL session from {peer[0]}")
+    try:
+        await s.run()
+    except Exception as e:
+        log("WARN", f"REPL session from {peer[0]} failed: {e}")
+    finally:
+        sessions.remove(s)
+        writer.close()
+        await writer.wait_closed()
+        log("INFO", f"REPL session from {peer[0]} closed")
+
+
+async def serve():
+    if not config.REPL_PASSWORD:
+        log("WARN", "Network REPL disabled, REPL_PASSWORD is not set")
+        return
+    await asyncio.start_server(_serve, "0.0.0.0", config.REPL_PORT)
+    log("INFO", f"Network REPL on port {config.REPL_PORT}")
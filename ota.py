@@ -0,0 +1,187 @@
+# ota.py
+# Over-the-air update of the application files.
+#
+# Files are uploaded one by one into a staging directory, each verified with
+# SHA-256 while it streams in. apply() swaps them in at the next boot, keeping
+# the replaced files as a backup. If the new build does not stay up for
+# OTA_CONFIRM_S within OTA_MAX_TRIES boots, the backup is restored.
+#
+# Imported by main.py before the application modules, keep it small.
+
+import os
+
+import config
+
+STAGE = config.OTA_DIR + "/new"
+BACKUP = config.OTA_DIR + "/old"
+LIST = config.OTA_DIR + "/files"        # paths of the update, one per line
+PENDING = config.OTA_DIR + "/pending"   # boots since the swap, until confirmed
+READY = STAGE + "/.ready"
+# imported by main.py outside its reset-on-failure guard, a broken copy
+# would never reach the rollback
+BOOT_FILES = ("boot.py", "main.py", "config.py", "ota.py")
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _makedirs(path):
+    p = ""
+    for part in path.split("/")[:-1]:
+        if part:
+            p += "/" + part
+            try:
+                os.mkdir(p)
+            except OSError:
+                pass
+
+
+def _rmtree(path):
+    try:
+        for name, kind, *_ in os.ilistdir(path):
+            if kind == 0x4000:
+                _rmtree(path + "/" + name)
+            else:
+                os.remove(path + "/" + name)
+        os.rmdir(path)
+    except OSError:
+        pass
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path, data):
+    _makedirs(path)
+    with open(path, "w") as f:
+        f.write(data)
+
+
+def _files():
+    return [p for p in _read(LIST).split("\n") if p]
+
+
+def check_path(path):
+    """Target path relative to the root, e.g. "logic.py" or "lib/web.py"."""
+    if not path or ".." in path or path.startswith("/") or path.split("/")[0] == config.OTA_DIR[1:]:
+        raise ValueError("bad path")
+    if path in BOOT_FILES:
+        raise ValueError("boot file, update over USB")
+    return path
+
+
+async def receive(r, path, size, sha256):
+    """Stream size bytes from r into the staging directory, verifying the hash."""
+    from hashlib import sha256 as _sha256
+    from binascii import hexlify
+    target = STAGE + "/" + check_path(path)
+    _makedirs(target)
+    h = _sha256()
+    buf = bytearray(config.OTA_CHUNK)
+    mv = memoryview(buf)
+    left = size
+    try:
+        with open(target, "wb") as f:
+            while left:
+                n = await r.readinto(mv[:min(left, len(buf))])
+                if not n:
+                    raise ValueError("short body")
+                h.update(mv[:n])
+                f.write(mv[:n])
+                left -= n
+        if hexlify(h.digest()).decode() != sha256.lower():
+            raise ValueError("sha256 mismatch")
+    except Exception:
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        raise
+
+
+def staged():
+    out = []
+
+    def walk(d, rel):
+        for name, kind, *_ in os.ilistdir(d):
+            if kind == 0x4000:
+                walk(d + "/" + name, rel + name + "/")
+            elif name != ".ready":
+                out.append(rel + name)
+    if _exists(STAGE):
+        walk(STAGE, "")
+    return out
+
+
+def prepare():
+    """Mark the staged files to be swapped in at the next boot."""
+    files = staged()
+    if not files:
+        raise ValueError("nothing staged")
+    _write(LIST, "\n".join(files))
+    _write(READY, "")
+    return files
+
+
+def discard():
+    _rmtree(STAGE)
+
+
+def _swap():
+    # idempotent, a power loss halfway is completed at the next boot
+    _write(PENDING, "0")
+    for p in _files():
+        new = STAGE + "/" + p
+        if not _exists(new):
+            continue
+        old = BACKUP + "/" + p
+        if _exists("/" + p) and not _exists(old):
+            _makedirs(old)
+            os.rename("/" + p, old)
+        _makedirs("/" + p)
+        os.rename(new, "/" + p)
+    _rmtree(STAGE)
+
+
+def _rollback():
+    for p in _files():
+        old = BACKUP + "/" + p
+        if _exists(old):
+            os.rename(old, "/" + p)
+        elif _exists("/" + p):
+            os.remove("/" + p)
+    _rmtree(BACKUP)
+    os.remove(PENDING)
+    print("OTA: update rolled back")
+
+
+def apply():
+    """Call at boot before importing the application."""
+    try:
+        if _exists(READY):
+            _swap()
+            print("OTA: update installed")
+        if _exists(PENDING):
+            tries = int(_read(PENDING)) + 1
+            if tries > config.OTA_MAX_TRIES:
+                _rollback()
+            else:
+                _write(PENDING, str(tries))
+    except Exception as e:
+        print("OTA: apply failed:", e)
+
+
+def confirm():
+    """The new build runs fine, drop the backup."""
+    if _exists(PENDING):
+        _rmtree(BACKUP)
+        os.remove(PENDING)
+        return True
+    return False
@@ -0,0 +1,114 @@
+# selftest.py
+# Valve matrix self-test. Opens every valve briefly at low pump power and
+# compares the measured flow rate with stored baselines.
+
+import uasyncio as asyncio
+import json
+import time
+
+from tz import localtime
+
+import config
+import logic
+import dispense
+import store
+from utils import fmt_time, log
+
+
+report = {}         # last result, served by GET /selftest
+baselines = {}      # zone -> pulses/s measured on a known good system
+task = None
+
+
+def load():
+    global baselines
+    buf = store.zone_buf(logic.ZONES)
+    try:
+        n = store.get_blob("baseline", buf)
+        baselines = json.loads(buf[:n])
+    except (OSError, ValueError):
+        baselines = {}
+
+
+async def _probe(valve, timeout_ms):
+    """Open valve until SELFTEST_PULSES are seen or timeout_ms passes.
+
+    Returns (pulses, pulses/s). A timeout still gives the rate of the pulses
+    seen so far, a dry pump gives rate 0.
+    """
+    if not logic.pump.duty():
+        # the executor cuts the pump when it sees no flow, ramp it up again
+        logic.pump.duty(config.SELFTEST_PUMP_POWER * 1023 // 100)
+        await asyncio.sleep(config.PUMP_RAMP_UP_TIME_S)
+    dispense.start(valve, config.SELFTEST_PULSES, timeout_ms)
+    while dispense.busy():
+        await asyncio.sleep_ms(10)
+    pulses = dispense.st[dispense.PULSES]
+    if dispense.st[dispense.RESULT] not in (dispense.DONE, dispense.TIMEOUT):
+        return pulses, 0
+    return pulses, pulses * 1000 // max(1, dispense.st[dispense.DURATION])
+
+
+def _classify(zone, rate, rates):
+    if not rate:
+        return "blocked"
+    base = baselines.get(zone)
+    if not base:
+        return "ok (no baseline)"
+    tol = config.SELFTEST_TOLERANCE
+    if abs(rate - base) * 100 <= base * tol:
+        return "ok"
+    # the signature of another zone suggests swapped wires
+    for other, b in baselines.items():
+        if other != zone and abs(rate - b) * 100 <= b * tol and abs(rates.get(other, 0) - base) * 100 <= base * tol:
+            return f"miswired (swapped with {other}?)"
+    return "low flow" if rate < base else "high flow (leak?)"
+
+
+async def run(save=False):
+    """Test all valves. With save=True the measured rates become the baselines."""
+    global report, baselines
+    start = time.ticks_ms()
+    logic.current_state.set(logic.State.RUNNING)
+    log("INFO", "--- Valve self-test ---")
+    rates = {}
+    stuck = False
+    try:
+        logic.set_valve(0)
+        # any flow with every valve closed means one of them is stuck open
+        stuck = (await _probe(0, config.DRY_RUN_MS))[0] > 0
+        for zone in range(1, logic.ZONES + 1):
+            rates[str(zone)] = (await _probe(zone, config.SELFTEST_ZONE_MS))[1]
+    finally:
+        logic.open_valve(0)
+        await asyncio.sleep_ms(500)
+        logic.pump_stop()
+        logic.current_state.set(logic.State.IDLE)
+
+    if save:
+        baselines = {z: r for z, r in rates.items() if r}
+        store.set_blob("baseline", json.dumps(baselines))
+    zones = {z: {"rate": r, "baseline": baselines.get(z), "result": _classify(z, r, rates)}
+             for z, r in rates.items()}
+    report = {
+        "time": fmt_time(localtime()),
+        "duration-ms": time.ticks_diff(time.ticks_ms(), start),
+        "stuck-open": stuck,
+        "no-flow": not any(rates.values()),
+        "zones": zones,
+    }
+    bad = [z for z, v in zones.items() if not v["result"].startswith("ok")]
+    log("INFO", f"Self-test done in {report['duration-ms']}ms, stuck={stuck}, faults: {bad or 'none'}")
+    # requests queued during the test
+    logic._kick()
+
+
+def start(save=False):
+    global task
+    if logic.current_state.get() != logic.State.IDLE:
+        return False
+    task = asyncio.create_task(run(save))
+    return True
+
+
+load()
@@ -0,0 +1,165 @@
+# store.py
+# Write-behind cache in front of NVS. Writes are collected in RAM and
+# committed in batches by a background task, so the cycle and the web
+# handlers never wait for a flash erase.
+
+import uasyncio as asyncio
+import json
+import time
+from binascii import hexlify, unhexlify
+from esp32 import NVS
+
+import config
+from utils import log
+
+
+nvs = NVS("ic")
+_pending = {}       # key -> int (i32) or str/bytes (blob), not yet in flash
+_watched = {}       # key -> [getter, last stored value]
+_last_checkpoint = 0
+_NOT_FOUND = -4354  # ESP_ERR_NVS_NOT_FOUND
+commits = 0         # number of flash commits since boot
+
+
+def set_i32(key, value):
+    _pending[key] = int(value)
+    w = _watched.get(key)
+    if w:
+        w[1] = _pending[key]
+
+
+def set_blob(key, value):
+    _pending[key] = value
+
+
+def zone_buf(zones, per_zone=20):
+    """Read buffer for a JSON blob with one entry of at most per_zone bytes
+    per zone, so it grows with ZONES."""
+    return bytearray(32 + per_zone * zones)
+
+
+def get_i32(key):
+    v = _pending.get(key)
+    if v is not None:
+        return v
+    return nvs.get_i32(key)
+
+
+def get_blob(key, buf):
+    """Same as NVS.get_blob, but sees values that are not committed yet."""
+    v = _pending.get(key)
+    if v is None:
+        return nvs.get_blob(key, buf)
+    if isinstance(v, str):
+        v = v.encode()
+    buf[:len(v)] = v
+    return len(v)
+
+
+def watch(key, getter):
+    """Checkpoint getter() into an i32 key at most every STORE_CHECKPOINT_S."""
+    _watched[key] = [getter, getter()]
+
+
+def _checkpoint():
+    for key, w in _watched.items():
+        v = w[0]()
+        if v != w[1]:
+            _pending[key] = v
+            w[1] = v
+
+
+def _write(key, value):
+    if isinstance(value, int):
+        nvs.set_i32(key, value)
+    else:
+        nvs.set_blob(key, value)
+
+
+def _jenc(v):
+    # text blobs go in as strings, only raw ones (e.g. a BSSID) are wrapped as [hex]
+    if isinstance(v, (bytes, bytearray)):
+        try:
+            return bytes(v).decode()
+        except UnicodeError:
+            return [hexlify(v).decode()]
+    return v
+
+
+def flush():
+    """Commit all pending writes now.
+
+    A single key is atomic in NVS. For more keys the batch is first written
+    as one journal blob, so a power loss between the keys is repaired by
+    recover() on the next boot. Its length goes to jrnl_n, so recover()
+    can size the buffer.
+    """
+    global commits
+    if not _pending:
+        return
+    batch = dict(_pending)
+    _pending.clear()
+    try:
+        if len(batch) > 1:
+            j = json.dumps({k: _jenc(v) for k, v in batch.items()})
+            nvs.set_blob("jrnl", j)
+            nvs.set_i32("jrnl_n", len(j.encode()))
+            nvs.commit()
+        for k, v in batch.items():
+            _write(k, v)
+        if len(batch) > 1:
+            nvs.erase_key("jrnl")
+            nvs.erase_key("jrnl_n")
+        nvs.commit()
+    except Exception:
+        # keep newer values written in the meantime, retry on the next tick
+        for k, v in batch.items():
+            if k not in _pending:
+                _pending[k] = v
+        raise
+    commits += 1
+    log("DEBUG", f"NVS commit: {', '.join(batch)}")
+
+
+def recover():
+    """Replay a journal left behind by an interrupted flush()."""
+    try:
+        size = nvs.get_i32("jrnl_n")
+    except OSError:
+        size = config.STORE_JOURNAL_SIZE
+    buf = bytearray(size)
+    try:
+        n = nvs.get_blob("jrnl", buf)
+    except OSError as e:
+        if e.args[0] == _NOT_FOUND:
+            return
+        # unreadable (e.g. larger than the buffer), don't leave it for every boot
+        log("ERROR", f"NVS journal unreadable, dropped: {e}")
+        n = None
+    if n is not None:
+        try:
+            for k, v in json.loads(buf[:n]).items():
+                _write(k, unhexlify(v[0]) if isinstance(v, list) else v)
+            log("WARN", "NVS journal replayed after an interrupted commit")
+        except ValueError:
+            log("ERROR", "NVS journal is corrupt, dropped")
+    for k in ("jrnl", "jrnl_n"):
+        try:
+            nvs.erase_key(k)
+        except OSError:
+            pass
+    nvs.commit()
+
+
+async def commit_task():
+    global _last_checkpoint
+    while True:
+        await asyncio.sleep(config.STORE_COMMIT_S)
+        try:
+            now = time.ticks_ms()
+            if time.ticks_diff(now, _last_checkpoint) >= config.STORE_CHECKPOINT_S * 1000:
+                _checkpoint()
+                _last_checkpoint = now
+            flush()
+        except Exception as e:
+            log("ERROR", f"NVS commit failed: {e}")
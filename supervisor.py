@@ -0,0 +1,194 @@
+# supervisor.py
+# Task supervisor and hardware watchdog. Critical tasks report heartbeats
+# with beat(); a task that crashes is restarted with exponential backoff,
+# one that misses its deadline is cancelled and restarted. The hardware WDT
+# is only fed while every task is healthy or recovering, so a task that
+# can not be brought back resets the board.
+#
+# Independent of all of that, a hardware timer cuts the pump and closes the
+# valves when either has been on longer than the safety limits.
+
+import uasyncio as asyncio
+import time
+from machine import WDT
+
+import config
+from utils import log
+
+
+class _Watch:
+    def __init__(self, name, factory, deadline_s, on_hang):
+        self.name = name
+        self.factory = factory      # coroutine function, None for tasks started elsewhere
+        self.deadline = deadline_s * 1000 if deadline_s else 0
+        self.on_hang = on_hang      # called instead of a restart if there is no factory
+        self.armed = factory is not None
+        self.last = time.ticks_ms()
+        self.started = self.last
+        self.task = None
+        self.fails = 0
+        self.hung = False
+        self.waiting = False        # in backoff
+        self.dead = False
+
+
+watches = {}
+
+
+def beat(name):
+    w = watches.get(name)
+    if w:
+        w.last = time.ticks_ms()
+
+
+def arm(name):
+    """Start deadline checks for a task started elsewhere, e.g. a cycle run."""
+    w = watches.get(name)
+    if w:
+        w.armed, w.hung, w.last = True, False, time.ticks_ms()
+
+
+def disarm(name):
+    w = watches.get(name)
+    if w:
+        w.armed = False
+
+
+def watch(name, deadline_s, on_hang):
+    """Check the heartbeat of a task started elsewhere, call on_hang when it misses the deadline."""
+    watches[name] = _Watch(name, None, deadline_s, on_hang)
+
+
+def spawn(name, factory, deadline_s=None):
+    """Run factory() as a supervised task. Without deadline only crashes are detected."""
+    w = watches[name] = _Watch(name, factory, deadline_s, None)
+    w.task = asyncio.create_task(_guard(w))
+
+
+async def _guard(w):
+    while True:
+        w.started = w.last = time.ticks_ms()
+        try:
+            await w.factory()
+            log("INFO", f"Supervisor: {w.name} finished")
+            w.armed = False
+            return
+        except asyncio.CancelledError:
+            if not w.hung:
+                raise
+            log("ERROR", f"Supervisor: {w.name} missed its deadline")
+        except Exception as e:
+            log("ERROR", f"Supervisor: {w.name} crashed: {e}")
+        w.hung = False
+        w.fails += 1
+        if w.fails > config.SUPERVISOR_MAX_RESTARTS:
+            log("CRITICAL", f"Supervisor: {w.name} keeps failing, giving up")
+            w.dead = True
+            return
+        delay = min(config.SUPERVISOR_BACKOFF_MIN_MS << (w.fails - 1), config.SUPERVISOR_BACKOFF_MAX_MS)
+        log("INFO", f"Supervisor: restarting {w.name} in {delay}ms")
+        w.waiting = True
+        await asyncio.sleep_ms(delay)
+        w.waiting = False
+
+
+def _healthy(w, now):
+    if w.dead:
+        return False
+    if not w.armed or not w.deadline or w.waiting:
+        return True
+    late = time.ticks_diff(now, w.last)
+    if late > 2 * w.deadline:
+        # already acted on the first miss, it did not recover
+        return False
+    if late > w.deadline and not w.hung:
+        w.hung = True
+        if w.task:
+            w.task.cancel()
+        elif w.on_hang:
+            log("ERROR", f"Supervisor: {w.name} missed its deadline")
+            w.on_hang()
+    return True
+
+
+def status():
+    now = time.ticks_ms()
+    return {
+        w.name: {
+            "armed": w.armed,
+            "age-ms": time.ticks_diff(now, w.last),
+            "restarts": w.fails,
+            "dead": w.dead,
+        }
+        for w in watches.values()
+    }
+
+
+# --- Safety timer ---
+_pump = None
+_set_valve = None
+_pump_on = 0        # ticks_ms when the pump was seen on, 0 when off
+_valve_on = 0       # ticks_ms when a valve was opened, 0 when all closed
+tripped = False
+_soft_safety = False
+
+
+def valve(valve_id):
+    """Record a valve change, called from logic.set_valve. Must not allocate."""
+    global _valve_on
+    if not valve_id:
+        _valve_on = 0
+    elif not _valve_on:
+        _valve_on = time.ticks_ms() or 1
+
+
+def _safety(_=None):
+    """Timer callback. Must not allocate."""
+    global _pump_on, _valve_on, tripped
+    now = time.ticks_ms()
+    if not _pump.duty():
+        _pump_on = 0
+    elif not _pump_on:
+        _pump_on = now or 1
+    if (_pump_on and time.ticks_diff(now, _pump_on) > config.SAFETY_PUMP_MAX_S * 1000) or \
+            (_valve_on and time.ticks_diff(now, _valve_on) > config.SAFETY_VALVE_MAX_S * 1000):
+        _pump.duty(0)
+        _set_valve(0)
+        _pump_on = _valve_on = 0
+        tripped = True
+
+
+def safety(pump, set_valve):
+    """Start the safety timer, falls back to a check from run()."""
+    global _pump, _set_valve, _soft_safety
+    _pump, _set_valve = pump, set_valve
+    try:
+        from machine import Timer
+        Timer(config.SAFETY_TIMER).init(period=1000, mode=Timer.PERIODIC, callback=_safety)
+        _soft_safety = False
+    except (ImportError, OSError, ValueError):
+        _soft_safety = True
+    return not _soft_safety
+
+
+async def run(on_trip):
+    """Feed the WDT while all watched tasks are healthy."""
+    global tripped
+    wdt = WDT(timeout=config.WDT_TIMEOUT_MS)
+    while True:
+        if _soft_safety:
+            _safety()
+        if tripped:
+            tripped = False
+            log("CRITICAL", "Safety timeout: pump and valves switched off")
+            on_trip()
+        now = time.ticks_ms()
+        ok = True
+        for w in watches.values():
+            if not _healthy(w, now):
+                ok = False
+            elif w.fails and time.ticks_diff(now, w.started) > config.SUPERVISOR_STABLE_S * 1000:
+                w.fails = 0
+        if ok:
+            wdt.feed()
+        await asyncio.sleep_ms(config.SUPERVISOR_PERIOD_MS)
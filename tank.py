@@ -0,0 +1,120 @@
+# tank.py
+# Water tank model: remaining volume, per-zone consumption, dry-run and
+# low-water protection.
+
+import uasyncio as asyncio
+import json
+from machine import Pin
+
+import config
+import store
+import indicator
+from utils import log
+
+
+class TankEmpty(Exception):
+    pass
+
+
+zone_pulses = {}    # zone -> pulses dispensed since the last refill
+dry = False         # set when the pump ran dry, cleared by a refill
+_sensor = None
+if config.TANK_LEVEL_PIN is not None:
+    _sensor = Pin(config.TANK_LEVEL_PIN, Pin.IN, Pin.PULL_UP)
+
+
+def load(zones):
+    global zone_pulses
+    buf = store.zone_buf(zones)
+    try:
+        n = store.get_blob("zone_use", buf)
+        zone_pulses = json.loads(buf[:n])
+    except (OSError, ValueError):
+        zone_pulses = {}
+
+
+def _used_ml(count):
+    # recorded zones at their calibrated pulses per liter, the rest (a zone
+    # in progress) at the nominal one
+    import calib
+    ml = sum(calib.zone_ml(int(k), v) for k, v in zone_pulses.items())
+    return ml + (count - sum(zone_pulses.values())) * 1000 // config.PULSES_PER_LITER
+
+
+def level_l(count):
+    """Remaining liters for the meter count since the last refill."""
+    return config.TANK_SIZE - _used_ml(count) / 1000
+
+
+def sensor_low():
+    return _sensor is not None and _sensor.value() == config.TANK_LEVEL_LOW
+
+
+def available_ml(count):
+    if dry or sensor_low():
+        return 0
+    return max(0, int((level_l(count) - config.TANK_RESERVE_L) * 1000))
+
+
+def fit(program, count):
+    """Return (program, message) adjusted to the water left in the tank.
+
+    Depending on TANK_LOW_ACTION a program that does not fit is either
+    skipped or scaled down proportionally.
+    """
+    need = sum(ml for ml in program.values() if ml)
+    avail = available_ml(count)
+    if need <= avail:
+        return program, ""
+    if avail == 0 or config.TANK_LOW_ACTION != "scale":
+        return {}, f"Tank low: {avail}ml available, {need}ml needed. Program skipped"
+    scaled = {k: ml * avail // need if ml else ml for k, ml in program.items()}
+    return scaled, f"Tank low: program scaled to {avail * 100 // need}%"
+
+
+def record(zone, pulses):
+    key = str(zone)
+    zone_pulses[key] = zone_pulses.get(key, 0) + pulses
+    store.set_blob("zone_use", json.dumps(zone_pulses))
+
+
+def set_dry():
+    global dry
+    dry = indicator.low_tank = True
+    log("ERROR", "Pump is running dry, tank marked empty")
+
+
+def refill(meter):
+    """Tank was filled up: restart consumption accounting."""
+    global dry
+    dry = indicator.low_tank = False
+    meter.value(0)
+    zone_pulses.clear()
+    store.set_i32("cnt", 0)
+    store.set_blob("zone_use", "{}")
+    log("INFO", "Tank refilled")
+
+
+def usage_l():
+    import calib
+    return {k: calib.zone_ml(int(k), v) / 1000 for k, v in zone_pulses.items()}
+
+
+async def monitor(meter):
+    """Detect a refill from the level sensor: low, then not low for a while."""
+    if _sensor is None:
+        return
+    was_low = indicator.low_tank = sensor_low()
+    ok_ms = 0
+    while True:
+        await asyncio.sleep_ms(500)
+        if sensor_low():
+            if not was_low:
+                log("WARN", "Tank level sensor reports low water")
+            was_low = indicator.low_tank = True
+            ok_ms = 0
+        elif was_low:
+            ok_ms += 500
+            if ok_ms >= config.TANK_REFILL_DEBOUNCE_S * 1000:
+                was_low = False
+                refill(meter)
@@ -0,0 +1,12 @@
+# Host test setup: the application is written for MicroPython, so the
+# missing modules come from tests/shims and the MicroPython extensions of
+# time, asyncio, gc and sys are added by tests/shims/host.py.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for p in (os.path.join(ROOT, "tests", "shims"), os.path.join(ROOT, "lib"), ROOT):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import host  # noqa: E402,F401
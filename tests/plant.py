@@ -0,0 +1,59 @@
+# Stand-in for the hydraulics: a flow meter that counts while the pump runs
+# and a valve is open, wired into logic and dispense.
+import time
+
+import dispense
+import logic
+
+
+class FlowMeter:
+    """Counter stand-in, pulses at `rate` per second while flowing() is true."""
+
+    def __init__(self, rate, flowing):
+        self.rate = rate
+        self.flowing = flowing
+        self.count = 0.0
+        self.last = time.monotonic()
+
+    def value(self, v=None):
+        now = time.monotonic()
+        if self.flowing():
+            self.count += (now - self.last) * self.rate
+        self.last = now
+        old = int(self.count)
+        if v is not None:
+            self.count = v
+        return old
+
+
+class Plant:
+    def __init__(self, monkeypatch, tmp_path, rate=5000):
+        self.valve = 0
+        self.valves = []        # every valve opened, in order
+        self.pump_starts = 0
+        set_valve = logic.valve_driver.set
+
+        def drive(v):
+            self.valve = v
+            if v:
+                self.valves.append(v)
+            set_valve(v)
+        pump_start = logic.pump_start
+
+        def start():
+            self.pump_starts += 1
+            pump_start()
+        monkeypatch.setattr(logic.valve_driver, "set", drive)
+        monkeypatch.setattr(logic, "pump_start", start)
+        self.meter = FlowMeter(rate, lambda: bool(logic.pump.duty() and self.valve))
+        monkeypatch.setattr(logic, "meter", self.meter)
+        monkeypatch.setattr(logic.config, "PUMP_RAMP_UP_TIME_S", 0)
+        monkeypatch.setattr(logic.config, "DISPENSE_MODE", "async")
+        monkeypatch.setattr(logic.history, "_FILE", str(tmp_path / "history.bin"))
+        monkeypatch.setattr(logic.history, "_OLD", str(tmp_path / "history.bin.1"))
+        monkeypatch.setattr(logic.history, "pending", [])
+        monkeypatch.setattr(logic, "queue", [])
+        monkeypatch.setattr(logic, "task_cycle", None)
+        monkeypatch.setattr(logic, "current_item", None)
+        dispense.init([self.meter], logic.set_valve, logic.pump)
+        logic.current_state.set(logic.State.IDLE)
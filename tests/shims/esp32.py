@@ -0,0 +1,39 @@
+# Host stand-in for esp32.NVS, backed by a dict.
+
+
+class NVS:
+    data = {}
+
+    def __init__(self, namespace):
+        self.ns = namespace
+
+    def set_i32(self, key, value):
+        self.data[key] = int(value)
+
+    def get_i32(self, key):
+        try:
+            return self.data[key]
+        except KeyError:
+            raise OSError(-4354)
+
+    def set_blob(self, key, value):
+        self.data[key] = value.encode() if isinstance(value, str) else bytes(value)
+
+    def get_blob(self, key, buf):
+        try:
+            v = self.data[key]
+        except KeyError:
+            raise OSError(-4354)
+        if len(v) > len(buf):
+            raise OSError(-4364)
+        buf[:len(v)] = v
+        return len(v)
+
+    def erase_key(self, key):
+        try:
+            del self.data[key]
+        except KeyError:
+            raise OSError(-4354)
+
+    def commit(self):
+        pass
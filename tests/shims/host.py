@@ -0,0 +1,68 @@
+# MicroPython extensions of time, asyncio, gc, os and sys for running the
+# application on a Linux host. Imported by the tests and tools/fleet_sim.py
+# before any application module.
+import asyncio
+import gc
+import os
+import sys
+import time
+
+_T0 = time.monotonic_ns()
+
+
+def _ticks_ms():
+    return (time.monotonic_ns() - _T0) // 1_000_000
+
+
+time.ticks_ms = _ticks_ms
+time.ticks_us = lambda: (time.monotonic_ns() - _T0) // 1000
+time.ticks_diff = lambda a, b: a - b
+time.ticks_add = lambda a, b: a + b
+time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+_time = time.time
+time.time = lambda: int(_time())
+
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+asyncio.sleep_ms = _sleep_ms
+sys.modules["uasyncio"] = asyncio
+
+gc.mem_free = lambda: 100_000
+gc.mem_alloc = lambda: 50_000
+gc.threshold = lambda *a: None
+sys.implementation._machine = "Linux host"
+sys.print_exception = lambda e, f=None: None
+os.ilistdir = lambda d=".": ((e.name, 0x4000 if e.is_dir() else 0x8000, e.inode())
+                             for e in os.scandir(d))
+
+
+async def _awrite(self, buf, off=0, sz=-1):
+    self.write(bytes(buf[off:] if sz < 0 else buf[off:off + sz]))
+    await self.drain()
+
+
+async def _readinto(self, buf):
+    b = await self.read(len(buf))
+    buf[:len(b)] = b
+    return len(b)
+
+
+asyncio.StreamWriter.awrite = _awrite
+asyncio.StreamReader.readinto = _readinto
+
+_wait_closed = asyncio.StreamWriter.wait_closed
+
+
+async def _mp_wait_closed(self):
+    # uasyncio closes the socket here, CPython only waits for it
+    self.close()
+    try:
+        await _wait_closed(self)
+    except OSError:
+        pass
+
+
+asyncio.StreamWriter.wait_closed = _mp_wait_closed
@@ -0,0 +1,136 @@
+# Host stand-in for the MicroPython machine module, just enough to import
+# the application modules and drive them from tests.
+import threading
+import time
+
+
+class Pin:
+    IN, OUT, OPEN_DRAIN = 0, 1, 2
+    PULL_UP, PULL_DOWN = 1, 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+
+    def init(self, mode=-1, pull=-1, value=None):
+        self.mode = mode
+        if value is not None:
+            self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = int(bool(v))
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class PWM:
+    def __init__(self, pin, freq=1000, duty=0, duty_u16=None):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty
+
+    def duty(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty * 64
+        self._duty = d // 64
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def deinit(self):
+        pass
+
+
+class Counter:
+    def __init__(self, id, src=None, **kwargs):
+        self._value = 0
+
+    def value(self, v=None):
+        old = self._value
+        if v is not None:
+            self._value = v
+        return old
+
+
+class Timer:
+    """Calls the callback from a daemon thread, like the hardware timer
+    interrupting the interpreter between bytecodes."""
+    PERIODIC, ONE_SHOT = 1, 0
+
+    def __init__(self, id=-1):
+        self.callback = None
+        self._stop = None
+
+    def init(self, period=1000, mode=PERIODIC, callback=None):
+        self.deinit()
+        self.callback = callback
+        self._stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(period / 1000):
+                if callback:
+                    callback(self)
+                if mode == Timer.ONE_SHOT:
+                    break
+        threading.Thread(target=run, daemon=True).start()
+
+    def deinit(self):
+        if self._stop:
+            self._stop.set()
+        self.callback = None
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.feeds = 0
+
+    def feed(self):
+        self.feeds += 1
+
+
+class RTC:
+    def datetime(self, dt=None):
+        return dt
+
+
+class ADC:
+    ATTN_11DB = 3
+
+    def __init__(self, pin, atten=None):
+        self.pin = pin
+
+    def atten(self, value):
+        pass
+
+    def read_u16(self):
+        return 0
+
+
+class I2C:
+    def __init__(self, id, sda=None, scl=None, freq=100000):
+        self.writes = []
+
+    def writeto(self, addr, buf):
+        self.writes.append((addr, bytes(buf)))
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def unique_id():
+    return b"\x01\x02\x03\x04\x05\x06"
@@ -0,0 +1,12 @@
+class NeoPixel:
+    def __init__(self, pin, n):
+        self.buf = [(0, 0, 0)] * n
+
+    def __setitem__(self, i, v):
+        self.buf[i] = v
+
+    def __getitem__(self, i):
+        return self.buf[i]
+
+    def write(self):
+        pass
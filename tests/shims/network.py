@@ -0,0 +1,27 @@
+STA_IF, AP_IF = 0, 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._active = False
+
+    def active(self, v=None):
+        if v is None:
+            return self._active
+        self._active = v
+
+    def isconnected(self):
+        return False
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def ifconfig(self):
+        return ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
+
+    def config(self, *args, **kwargs):
+        if kwargs:
+            self.settings = kwargs
@@ -0,0 +1,55 @@
+# Stand-ins for the uasyncio streams the web handlers get.
+import asyncio
+
+
+class Request:
+    def __init__(self, body=b"", method="POST", path="/", query=None, headers=None):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers or {}
+        if body and "content-length" not in self.headers:
+            self.headers["content-length"] = str(len(body))
+        self.body = body
+
+    async def read(self, n=-1):
+        if n < 0:
+            n = len(self.body)
+        data, self.body = self.body[:n], self.body[n:]
+        return data
+
+    async def readexactly(self, n):
+        return await self.read(n)
+
+    async def readinto(self, buf):
+        b = await self.read(len(buf))
+        buf[:len(b)] = b
+        return len(b)
+
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+
+    async def awrite(self, b):
+        self.data += b
+
+    def write(self, b):
+        self.data += b
+
+    async def drain(self):
+        pass
+
+    @property
+    def status(self):
+        return int(self.data.split(b" ", 2)[1])
+
+    @property
+    def body(self):
+        return bytes(self.data.split(b"\r\n\r\n", 1)[1])
+
+
+def call(handler, *args):
+    w = Writer()
+    asyncio.run(handler(*args, w))
+    return w
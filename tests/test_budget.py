@@ -0,0 +1,93 @@
+import json
+import time
+
+import pytest
+
+import budget
+import webadmin
+from esp32 import NVS
+from streams import Request, call
+
+JULY = (2026, 7, 1, 12, 0, 0, 2, 182)
+JANUARY = (2026, 1, 15, 12, 0, 0, 3, 15)
+
+
+class Station:
+    """Stand-in weather station that posts its daily observation."""
+
+    def __init__(self, **obs):
+        self.obs = obs
+
+    def push(self):
+        return call(webadmin.post_weather, Request(json.dumps(self.obs).encode()))
+
+
+@pytest.fixture(autouse=True)
+def reset(monkeypatch):
+    NVS.data.clear()
+    monkeypatch.setattr(budget, "factor", 1.0)
+    monkeypatch.setattr(budget, "updated", 0)
+    monkeypatch.setattr(budget, "localtime", lambda *a: JULY)
+
+
+def test_hot_dry_day_waters_more():
+    assert Station(tmin=20, tmax=34, rain=0).push().status == 200
+    assert budget.observation["et0"] > budget.config.BUDGET_REF_ET_MM
+    assert budget.current() > 1.0
+    program = budget.scale({1: 1000, 2: 0})
+    assert program[1] > 1000 and program[2] == 0
+
+
+def test_rain_cancels_watering():
+    Station(tmin=15, tmax=22, rain=25).push()
+    assert budget.current() == budget.config.BUDGET_MIN
+    assert budget.scale({1: 1000}) == {1: 0}
+
+
+def test_winter_waters_less(monkeypatch):
+    monkeypatch.setattr(budget, "localtime", lambda *a: JANUARY)
+    Station(tmin=-2, tmax=6).push()
+    assert 0 < budget.current() < 1.0
+
+
+def test_sensor_reading_fills_missing_value():
+    Station(tmin=14, temp=29).push()
+    assert budget.observation["tmin"] == 14 and budget.observation["tmax"] == 29
+
+
+@pytest.mark.parametrize("obs", [{}, {"tmin": 30, "tmax": 10}, {"tmin": 10, "tmax": 20, "rain": -1}])
+def test_bad_observation_keeps_factor(obs):
+    assert Station(**obs).push().status == 400
+    assert budget.current() == 1.0
+
+
+def test_stale_observation_is_ignored(monkeypatch):
+    Station(tmin=20, tmax=34).push()
+    assert budget.current() != 1.0
+    later = time.time() + budget.config.BUDGET_MAX_AGE_S + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert budget.current() == 1.0
+    assert budget.scale({1: 1000}) == {1: 1000}
+
+
+def test_factor_survives_reboot(monkeypatch):
+    Station(tmin=20, tmax=34).push()
+    f = budget.factor
+    budget.store.flush()
+    monkeypatch.setattr(budget, "factor", 1.0)
+    monkeypatch.setattr(budget, "updated", 0)
+    budget.load()
+    assert budget.factor == f and budget.updated
+
+
+@pytest.mark.parametrize("body,status", [
+    (b"[20, 30]", 400),
+    (b"42", 400),
+    (b"not json", 400),
+    (b"", 411),
+    (json.dumps({"tmin": 20, "tmax": 30, "note": "x" * 300}).encode(), 413),
+])
+def test_bad_body(body, status):
+    w = call(webadmin.post_weather, Request(body))
+    assert w.status == status
+    assert budget.current() == 1.0
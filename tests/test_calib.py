@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import calib
+import store
+import tank
+import webadmin
+from calib import config
+from esp32 import NVS
+from streams import Request, Writer
+
+PPL = config.PULSES_PER_LITER
+
+
+@pytest.fixture(autouse=True)
+def clean_curve():
+    calib.clear()
+    calib.rates.clear()
+    tank.zone_pulses.clear()
+    store._pending.clear()
+    NVS.data.clear()
+    yield
+    calib.clear()
+    calib.rates.clear()
+    tank.zone_pulses.clear()
+
+
+def _run(zone=1, pulses=PPL, ms=10000):
+    """A finished calibration run of pulses in ms."""
+    calib.pending = (zone, 50, pulses, ms)
+
+
+def _point(ml):
+    w = Writer()
+    asyncio.run(webadmin.post_calibrate(Request(path="/calibrate/point", query=f"ml={ml}"), w))
+    return w.status
+
+
+@pytest.mark.parametrize("ml", [1, 0, -5, 100000])
+def test_implausible_volume_leaves_the_curve_alone(ml):
+    _run()
+    lut = list(calib.lut)
+    assert _point(ml) == 400
+    assert calib.points == [] and list(calib.lut) == lut
+    assert calib.pending
+    assert "calib" not in store._pending
+
+
+def test_point_changes_the_conversions():
+    _run(pulses=2 * PPL, ms=20000)
+    assert _point(1600) == 202
+    ppl = 2 * PPL * 1000 // 1600
+    assert calib.points == [(PPL // 10, ppl)]
+    assert set(calib.lut) == {ppl}
+    assert calib.pending is None
+
+    calib.observe(3, PPL, 10000)
+    assert calib.zone_ml(3, ppl) == 1000
+    tank.record(3, ppl)
+    assert tank.usage_l() == {"3": 1.0}
+    # plus half a liter at the nominal value for a zone still running
+    assert tank.level_l(ppl + PPL // 2) == config.TANK_SIZE - 1.5
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import logic
+import webadmin
+from streams import Request, call
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(logic, "settings", json.loads(json.dumps(logic.config.DEFAULT_SETTINGS)))
+    monkeypatch.setattr(logic, "load_settings", lambda: None)
+
+
+def _patch(body, **kw):
+    return call(webadmin.patch_config, Request(body, method="PATCH", path="/config", **kw))
+
+
+def test_patch_changes_one_zone():
+    w = _patch(b'{"volumes": {"3": 400}}')
+    assert w.status == 200 and json.loads(w.body) == {"changed": True}
+    assert logic.settings["volumes"]["3"] == 400 and logic.settings["volumes"]["1"] == 750
+
+
+def test_missing_content_length():
+    w = _patch(b"")
+    assert w.status == 411
+    assert json.loads(w.body)["field"] == "content-length"
+
+
+def test_body_too_large():
+    w = _patch(b"{}", headers={"content-length": str(logic.config.SETTINGS_MAX_BYTES + 1)})
+    assert w.status == 413
+    assert json.loads(w.body)["field"] == "content-length"
+
+
+def test_truncated_body():
+    w = _patch(b'{"volumes"', headers={"content-length": "100"})
+    assert w.status == 400
+    assert json.loads(w.body) == {"field": "content-length", "error": "truncated body"}
+
+
+def test_not_an_object():
+    w = _patch(b"[1, 2]")
+    assert w.status == 400 and json.loads(w.body)["field"] is None
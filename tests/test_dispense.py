@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import dispense
+from dispense import config
+from machine import PWM, Pin
+
+
+class Meter:
+    """Counts 5 pulses per read while flowing."""
+
+    def __init__(self, flowing=True):
+        self.flowing = flowing
+        self.count = 0
+
+    def value(self, v=None):
+        if self.flowing:
+            self.count += 5
+        return self.count
+
+
+@pytest.fixture(params=["timer", "thread"])
+def executor(request, monkeypatch):
+    monkeypatch.setattr(config, "DISPENSE_MODE", request.param)
+    monkeypatch.setattr(config, "DISPENSE_TICK_MS", 2)
+    monkeypatch.setattr(config, "DRY_RUN_MS", 50)
+    valves = []
+    pump = PWM(Pin(0), duty=1023)
+    meter = Meter()
+    assert dispense.init([meter], valves.append, pump) == request.param
+    yield meter, valves, pump
+    dispense.deinit()
+    # let the old thread see _running go false before the next init
+    time.sleep(0.02)
+
+
+def _wait():
+    deadline = time.monotonic() + 2
+    while dispense.busy():
+        assert time.monotonic() < deadline, "executor did not finish"
+        time.sleep(0.005)
+    return dispense.st[dispense.RESULT]
+
+
+def test_done_on_target(executor):
+    meter, valves, pump = executor
+    dispense.start(3, 200, 2000)
+    assert _wait() == dispense.DONE
+    assert dispense.st[dispense.PULSES] >= 200
+    assert valves == [3, 0]
+    assert pump.duty() == 1023
+
+
+def test_timeout_while_flowing(executor):
+    meter, valves, pump = executor
+    dispense.start(2, 10 ** 8, 100)
+    assert _wait() == dispense.TIMEOUT
+    assert dispense.st[dispense.DURATION] >= 100
+    assert valves == [2, 0]
+    assert pump.duty() == 1023
+
+
+def test_dry_cuts_the_pump(executor):
+    meter, valves, pump = executor
+    meter.flowing = False
+    dispense.start(1, 200, 2000)
+    assert _wait() == dispense.DRY
+    assert valves == [1, 0]
+    assert pump.duty() == 0
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import fleet
+from fleet import config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Coordinator:
+    """Stand-in coordinator that answers every request with one status,
+    or never answers at all with status None."""
+
+    def __init__(self, status):
+        self.status = status
+        self.requests = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _serve(self, r, w):
+        self.requests.append((await r.readline()).decode().split()[1])
+        if self.status is None:
+            await asyncio.sleep(10)
+        w.write(f"HTTP/1.0 {self.status} X\r\n\r\n".encode())
+        await w.drain()
+        w.close()
+
+
+@pytest.fixture
+def fleet_config(monkeypatch):
+    monkeypatch.setattr(fleet, "role", "satellite")
+    monkeypatch.setattr(config, "FLEET_RETRY_S", 0.05)
+    monkeypatch.setattr(config, "FLEET_UNREACHABLE_S", 0.3)
+    monkeypatch.setattr(config, "FLEET_TIMEOUT_S", 0.3)
+    logs = []
+    monkeypatch.setattr(fleet, "log", lambda level, msg: logs.append((level, msg)))
+    yield logs
+    fleet._holding = False
+    if fleet._renew_task:
+        fleet._renew_task.cancel()
+        fleet._renew_task = None
+
+
+def _with_coordinator(monkeypatch, status, coro):
+    async def run():
+        c = Coordinator(status)
+        port = await c.start()
+        monkeypatch.setattr(config, "FLEET_COORDINATOR", f"127.0.0.1:{port}")
+        try:
+            return await coro(c, port)
+        finally:
+            c.server.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("status,result", [(200, True), (409, False)])
+def test_lease_answers(monkeypatch, fleet_config, status, result):
+    async def lease(c, port):
+        return await fleet._lease("lease")
+    assert _with_coordinator(monkeypatch, status, lease) is result
+
+
+@pytest.mark.parametrize("status", [401, 500])
+def test_lease_error_counts_as_unreachable(monkeypatch, fleet_config, status):
+    async def acquire(c, port):
+        with pytest.raises(OSError):
+            await fleet._lease("lease")
+        await asyncio.wait_for(fleet.acquire(), 3)
+        return c
+
+    c = _with_coordinator(monkeypatch, status, acquire)
+    assert len(c.requests) > 2
+    warnings = [m for level, m in fleet_config if level == "WARN"]
+    assert any(f"HTTP {status}" in m for m in warnings)
+    assert "running without a lease" in warnings[-1]
+    assert not fleet._holding
+
+
+def test_busy_slot_keeps_waiting(monkeypatch, fleet_config):
+    async def acquire(c, port):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(fleet.acquire(), 0.6)
+    _with_coordinator(monkeypatch, 409, acquire)
+    assert not any(level == "WARN" for level, m in fleet_config)
+
+
+def test_trigger_times_out(monkeypatch, fleet_config):
+    async def trigger(c, port):
+        monkeypatch.setattr(fleet, "nodes", {"sat1": {"ip": "127.0.0.1", "port": port}})
+        await asyncio.wait_for(fleet.trigger_satellites(), 2)
+    _with_coordinator(monkeypatch, None, trigger)
+    assert [level for level, m in fleet_config] == ["WARN"]
+
+
+def test_simulated_fleet():
+    p = subprocess.run([sys.executable, os.path.join(ROOT, "tools", "fleet_sim.py"), "--satellites", "2"],
+                       capture_output=True, text=True, timeout=120)
+    assert p.returncode == 0, p.stdout
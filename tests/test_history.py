@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+import history
+from history import config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+import read_history  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "_FILE", str(tmp_path / "h.bin"))
+    monkeypatch.setattr(history, "_OLD", str(tmp_path / "h.bin.1"))
+    monkeypatch.setattr(config, "HISTORY_MAX_RECORDS", 5)
+    monkeypatch.setattr(config, "HISTORY_BLOCK", 3)
+    monkeypatch.setattr(history, "next_seq", 0)
+    history.pending.clear()
+    # runs go back and forth to exercise the negative deltas
+    for i in range(7):
+        history.add(1000 - i % 2 * 500, i % 3 + 1, 250, 400 + i, 1700, 9000, 1)
+        if i in (3, 6):
+            history.flush()
+    history.add(1000, 12, 3000, 5100, 1650, 60000, 2)
+    yield
+    history.pending.clear()
+
+
+def _export(start):
+    return bytes(history.header(start) + b"".join(history.blocks(start)) + b"E")
+
+
+def _rows(cols):
+    return list(zip(*(cols[n] for n in ["seq"] + list(history.COLUMNS))))
+
+
+def test_export_round_trip():
+    # the first file rotated out after 4 records, one record is still in RAM
+    assert history.oldest() == 0
+    header, cols, nxt, complete = read_history.parse(_export(0))
+    assert complete and nxt == history.next_seq == 8
+    assert header == {"columns": list(history.COLUMNS), "first": 0, "next": 8, "epoch": 1970}
+    assert _rows(cols) == [(seq,) + rec for seq, rec in history.records()]
+
+
+def test_truncated_block_resumes_from_the_last_complete_one():
+    data = _export(2)
+    header, cols, nxt, complete = read_history.parse(data[:-3])
+    assert not complete
+    # blocks of 3 from record 2: 2..4 and 5..7, the second is cut off
+    assert cols["seq"] == [2, 3, 4] and nxt == 5
+    header, rest, nxt, complete = read_history.parse(_export(nxt))
+    assert complete and nxt == 8
+    assert _rows(cols) + _rows(rest) == [(seq,) + rec for seq, rec in history.records(2)]
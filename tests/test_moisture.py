@@ -0,0 +1,88 @@
+import asyncio
+import random
+
+import pytest
+
+import moisture
+from moisture import config
+
+
+class SimADC:
+    """Simulated probe: a soil moisture level plus ADC noise and spikes."""
+
+    def __init__(self, pct, noise=300, spikes=0.0, seed=1):
+        self.pct = pct
+        self.noise = noise
+        self.spikes = spikes
+        self.rnd = random.Random(seed)
+        self.fail = False
+
+    def read_u16(self):
+        if self.fail:
+            raise OSError(116)
+        if self.rnd.random() < self.spikes:
+            return self.rnd.choice((0, 65535))
+        raw = config.MOISTURE_DRY - self.pct * (config.MOISTURE_DRY - config.MOISTURE_WET) // 100
+        return max(0, min(65535, raw + self.rnd.randint(-self.noise, self.noise)))
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    moisture.probes.clear()
+    yield
+    moisture.probes.clear()
+
+
+def _sample(n=config.MOISTURE_WINDOW):
+    for _ in range(n):
+        for p in moisture.probes.values():
+            p.sample()
+
+
+def test_percent_tracks_the_soil():
+    moisture.init({"1": SimADC(10), "2": SimADC(55), 3: SimADC(95)})
+    assert moisture.percent("1") is None
+    _sample()
+    st = moisture.status()
+    assert abs(st["1"] - 10) <= 1 and abs(st["2"] - 55) <= 1 and abs(st["3"] - 95) <= 1
+    assert moisture.percent(4) is None
+
+
+def test_median_rejects_spikes():
+    moisture.init({"1": SimADC(40, spikes=0.02, seed=3)})
+    for _ in range(20):
+        _sample(1)
+        if moisture.probes["1"].n == config.MOISTURE_WINDOW:
+            assert abs(moisture.percent("1") - 40) <= 1
+
+
+def test_percent_is_clamped():
+    moisture.init({"1": SimADC(-20), "2": SimADC(130)})
+    _sample()
+    assert moisture.status() == {"1": 0, "2": 100}
+
+
+def test_adjust_skips_and_trims():
+    mid = (config.MOISTURE_TRIM + config.MOISTURE_SKIP) // 2
+    moisture.init({"1": SimADC(20, noise=0), "2": SimADC(mid, noise=0), "3": SimADC(config.MOISTURE_SKIP + 5, noise=0)})
+    _sample()
+    out = moisture.adjust({"1": 1000, "2": 1000, "3": 1000, "4": 1000, "5": 0})
+    assert out["1"] == 1000 and out["4"] == 1000 and out["5"] == 0
+    assert 0 < out["2"] < 1000
+    assert out["3"] == 0
+
+
+def test_sampler_survives_a_failing_probe(monkeypatch):
+    monkeypatch.setattr(config, "MOISTURE_PERIOD_S", 0)
+    bad = SimADC(50)
+    bad.fail = True
+    moisture.init({"1": bad, "2": SimADC(50)})
+
+    async def run():
+        t = asyncio.create_task(moisture.sampler())
+        await asyncio.sleep(0.05)
+        t.cancel()
+
+    asyncio.run(run())
+    assert moisture.percent("1") is None
+    assert abs(moisture.percent("2") - 50) <= 1
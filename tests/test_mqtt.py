@@ -0,0 +1,157 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+import logic
+import mqtt
+import net
+from mqtt import config
+
+wait_for = asyncio.wait_for
+
+
+class Broker:
+    """Stand-in MQTT broker: CONNACK with a set return code, SUBACK, PUBACK
+    for QoS 1, and it records what the client publishes."""
+
+    def __init__(self, rc=0, connack=True):
+        self.rc = rc
+        self.connack = connack
+        self.published = {}
+        self.subscribed = []
+        self.closed = asyncio.Event()
+        self.clients = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for w in self.clients:
+            w.close()
+        self.server.close()
+
+    async def send(self, topic, payload):
+        w = self.clients[-1]
+        w.write(mqtt._packet(0x30, mqtt._str(topic) + payload.encode()))
+        await w.drain()
+
+    async def _serve(self, r, w):
+        self.clients.append(w)
+        try:
+            while True:
+                ptype, body = await mqtt._read_packet(r)
+                kind = ptype & 0xF0
+                if kind == 0x10:
+                    if self.connack:
+                        w.write(mqtt._packet(0x20, bytes([0, self.rc])))
+                elif kind == 0x80:
+                    n = struct.unpack_from("!H", body, 2)[0]
+                    self.subscribed.append(body[4:4 + n].decode())
+                    w.write(mqtt._packet(0x90, body[:2] + b"\x01"))
+                elif kind == 0x30:
+                    n = struct.unpack_from("!H", body)[0]
+                    ofs = 2 + n
+                    if ptype & 0x06:
+                        w.write(mqtt._packet(0x40, body[ofs:ofs + 2]))
+                        ofs += 2
+                    self.published[body[2:2 + n].decode()] = body[ofs:].decode()
+                await w.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.closed.set()
+
+
+@pytest.fixture(autouse=True)
+def client_state(monkeypatch):
+    monkeypatch.setattr(config, "MQTT_BROKER", "127.0.0.1")
+    monkeypatch.setattr(config, "MQTT_USER", None)
+    monkeypatch.setattr(net, "wifi_connected", True)
+    yield
+    mqtt.connected = False
+    mqtt._w = None
+    mqtt._unacked.clear()
+
+
+def _run(coro):
+    asyncio.run(wait_for(coro, 5))
+
+
+async def _wait_for(cond):
+    while not cond():
+        await asyncio.sleep(0.01)
+
+
+def test_publishes_state_and_accepts_commands(monkeypatch):
+    queued = []
+    monkeypatch.setattr(logic, "enqueue", lambda *a: queued.append(a))
+    monkeypatch.setattr(config, "MQTT_PUBLISH_MS", 10)
+
+    async def run():
+        broker = Broker()
+        monkeypatch.setattr(config, "MQTT_PORT", await broker.start())
+        mqtt._wake = asyncio.Event()
+        client = asyncio.create_task(mqtt.client())
+        await _wait_for(lambda: mqtt.T_STATE in broker.published)
+        assert broker.subscribed == [mqtt.T_CMD + "#"]
+        assert broker.published[mqtt.T_AVAIL] == "online"
+        assert json.loads(broker.published[mqtt.T_STATE]) == logic.summary()
+        disc = [t for t in broker.published if t.startswith(config.MQTT_DISCOVERY_PREFIX)]
+        assert len(disc) == 8
+
+        await broker.send(mqtt.T_CMD + "zone/2", "750")
+        await _wait_for(lambda: queued)
+        assert queued == [(2, 750, logic.PRIO_HIGH, "mqtt")]
+        client.cancel()
+        await broker.stop()
+
+    _run(run())
+
+
+@pytest.mark.parametrize("broker", [Broker(rc=5), Broker(connack=False)], ids=["refused", "timeout"])
+def test_failed_handshake_closes_the_socket(monkeypatch, broker):
+    async def short_wait_for(aw, timeout):
+        return await wait_for(aw, 0.1)
+
+    monkeypatch.setattr(mqtt.asyncio, "wait_for", short_wait_for)
+    writers = []
+    open_connection = asyncio.open_connection
+
+    async def recording_open_connection(*a):
+        r, w = await open_connection(*a)
+        writers.append(w)
+        return r, w
+
+    monkeypatch.setattr(mqtt.asyncio, "open_connection", recording_open_connection)
+
+    async def run():
+        broker.closed = asyncio.Event()
+        monkeypatch.setattr(config, "MQTT_PORT", await broker.start())
+        with pytest.raises((OSError, asyncio.TimeoutError)):
+            await mqtt._connect()
+        assert not mqtt.connected
+        assert writers[0].is_closing()
+        # the broker sees the client hang up
+        await wait_for(broker.closed.wait(), 1)
+        await broker.stop()
+
+    _run(run())
+
+
+@pytest.mark.parametrize("cmd,payload", [
+    ("zone/1", "-500"),
+    ("zone/1", "5"),
+    ("zone/1", "100000"),
+    ("zone/0", "500"),
+    (f"zone/{logic.ZONES + 1}", "500"),
+    ("zone/x", "500"),
+    ("zone/1", "lots"),
+])
+def test_rejects_out_of_range_zone_commands(monkeypatch, cmd, payload):
+    queued = []
+    monkeypatch.setattr(logic, "enqueue", lambda *a: queued.append(a))
+    mqtt._command(mqtt.T_CMD + cmd, payload)
+    assert queued == []
+    mqtt._command(mqtt.T_CMD + "zone/1", "500")
+    assert queued == [(1, 500, logic.PRIO_HIGH, "mqtt")]
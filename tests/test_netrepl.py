@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import netrepl
+from netrepl import config
+
+
+@pytest.fixture(autouse=True)
+def password(monkeypatch):
+    monkeypatch.setattr(config, "REPL_PASSWORD", "secret")
+    monkeypatch.setattr(config, "REPL_THROTTLE_MS", 0)
+    # no second of back-off after a wrong password
+    sleep = asyncio.sleep
+    monkeypatch.setattr(netrepl.asyncio, "sleep", lambda s: sleep(0))
+
+
+def _session(*lines):
+    """Send lines to a REPL session, return everything it answered."""
+    async def run():
+        server = await asyncio.start_server(netrepl._serve, "127.0.0.1", 0)
+        r, w = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+        for line in lines:
+            w.write(line)
+        await w.drain()
+        out = await asyncio.wait_for(r.read(), 2)
+        w.close()
+        server.close()
+        return out
+    return asyncio.run(run())
+
+
+def test_login_and_execute():
+    out = _session(b"secret\n", b"6 * 7\n", b"\x04\n")
+    assert b"asyncio REPL" in out and b"42" in out
+
+
+def test_wrong_password():
+    out = _session(b"secrex\n", b"secret1\n", b"x\n")
+    assert out.count(b"Password: ") == 3 and b"REPL" not in out
+
+
+def test_long_password_line_closes(monkeypatch):
+    logs = []
+    monkeypatch.setattr(netrepl, "log", lambda level, msg: logs.append(msg))
+    out = _session(b"x" * 1000)
+    assert out == b"Password: "
+    assert any("too long" in m for m in logs)
+    assert not netrepl.sessions
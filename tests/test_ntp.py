@@ -0,0 +1,117 @@
+# SNTP client against a local UDP stand-in server.
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import config
+import net
+
+
+class StandIn:
+    """SNTP server on localhost whose clock is `offset_ms` ahead of ours."""
+
+    def __init__(self, offset_ms=0, delay_ms=0, stratum=2, reply=True):
+        self.offset_ms = offset_ms
+        self.delay_ms = delay_ms
+        self.stratum = stratum
+        self.reply = reply
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.addr = "127.0.0.1:%d" % self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _ts(self):
+        ms = net._now_ms() + self.offset_ms
+        sec, rem = divmod(ms, 1000)
+        return struct.pack("!II", sec + net.NTP_DELTA, (rem << 32) // 1000)
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, peer = self.sock.recvfrom(48)
+            except OSError:
+                continue
+            if not self.reply:
+                continue
+            # the delay is spent "on the network", outside t2..t3
+            time.sleep(self.delay_ms / 1000)
+            t2 = self._ts()
+            pkt = bytearray(48)
+            pkt[0] = 0x1C  # LI=0, VN=3, Mode=4 (server)
+            pkt[1] = self.stratum
+            pkt[32:40] = t2
+            pkt[40:48] = self._ts()
+            self.sock.sendto(pkt, peer)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def standin():
+    servers = []
+
+    def make(**kw):
+        s = StandIn(**kw)
+        servers.append(s)
+        return s
+
+    yield make
+    for s in servers:
+        s.close()
+
+
+def test_query_offset(standin):
+    s = standin(offset_ms=5000)
+    offset, delay = asyncio.run(net.ntp_query(s.addr))
+    assert abs(offset - 5000) < 50
+    assert 0 <= delay < 100
+
+
+def test_query_timeout(standin):
+    s = standin(reply=False)
+    with pytest.raises(OSError):
+        asyncio.run(net.ntp_query(s.addr, timeout_ms=200))
+
+
+def test_query_rejects_unsynchronised_server(standin):
+    s = standin(stratum=0)
+    with pytest.raises(ValueError):
+        asyncio.run(net.ntp_query(s.addr))
+
+
+def test_sync_picks_lowest_delay_and_steps(standin, monkeypatch):
+    slow = standin(offset_ms=9000, delay_ms=150)
+    fast = standin(offset_ms=3000)
+    monkeypatch.setattr(config, "NTP_SERVERS", (slow.addr, fast.addr))
+    stepped = []
+    monkeypatch.setattr(net, "_set_rtc", stepped.append)
+    net.logic.time_changed.clear()
+    assert asyncio.run(net.ntp_sync())
+    assert abs(net.ntp_offset_ms - 3000) < 50
+    assert len(stepped) == 1
+    assert net.logic.time_changed.is_set()
+
+
+def test_interval_follows_drift(monkeypatch):
+    monkeypatch.setattr(config, "NTP_MIN_INTERVAL", 900)
+    monkeypatch.setattr(config, "NTP_MAX_INTERVAL", 14400)
+    monkeypatch.setattr(config, "NTP_DRIFT_MAX_MS", 250)
+    # stable clock: the interval doubles
+    assert net.next_interval(900, 10, 0) == 1800
+    # 50 ppm reaches 250 ms after 5000 s
+    assert net.next_interval(3600, 10, 50) == 5000
+    assert net.next_interval(3600, 10, -50) == 5000
+    # large drift, but never below the minimum
+    assert net.next_interval(3600, 10, 1000) == 900
+    # a large offset starts over
+    assert net.next_interval(14400, 400, 0) == 900
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import dispense
+import logic
+from plant import Plant
+
+LOW, NORMAL, HIGH = logic.PRIO_LOW, logic.PRIO_NORMAL, logic.PRIO_HIGH
+
+
+@pytest.fixture
+def plant(monkeypatch, tmp_path):
+    return Plant(monkeypatch, tmp_path)
+
+
+@pytest.fixture
+def held(plant, monkeypatch):
+    # a run is in progress, so enqueue() only queues
+    monkeypatch.setattr(logic, "task_cycle", object())
+    return plant
+
+
+def _zones():
+    return [(i["zone"], i["ml"], i["prio"]) for i in logic.queue]
+
+
+def test_repeat_request_is_coalesced(held):
+    a = logic.enqueue(3, 200, LOW, "schedule")
+    logic.enqueue(5, 100, NORMAL)
+    b = logic.enqueue(3, 150, HIGH, "mqtt")
+    assert a == b
+    # the larger volume and the higher priority are kept
+    assert _zones() == [(3, 200, HIGH), (5, 100, NORMAL)]
+
+
+def test_priority_then_fifo(held):
+    logic.enqueue(1, 100, LOW)
+    logic.enqueue(2, 100, HIGH)
+    logic.enqueue(3, 100, LOW)
+    logic.enqueue(4, 100, NORMAL)
+    logic.enqueue(5, 100, HIGH)
+    assert [z for z, _, _ in _zones()] == [2, 5, 4, 1, 3]
+
+
+def test_cancel_queued_item(held):
+    logic.enqueue(1, 100)
+    b = logic.enqueue(2, 100)
+    assert logic.cancel(b)
+    assert [z for z, _, _ in _zones()] == [1]
+    assert not logic.cancel(b)
+
+
+def _run(coro):
+    asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def _until(cond):
+    while not cond():
+        await asyncio.sleep(0.005)
+
+
+def test_cancel_running_item(plant):
+    async def run():
+        a = logic.enqueue(1, 3000)
+        logic.enqueue(2, 100)
+        await _until(lambda: logic.current_item and plant.valve == 1)
+        assert logic.cancel(a)
+        await _until(lambda: logic.task_cycle is None)
+
+    _run(run())
+    results = {rec[2]: rec[7] for _, rec in logic.history.records()}
+    # only the running zone stops, the rest of the queue still runs
+    assert results == {1: dispense.ABORTED, 2: dispense.DONE}
+
+
+def test_item_queued_during_cleanup_starts_a_new_run(plant):
+    async def run():
+        logic.enqueue(1, 100)
+        await _until(lambda: logic.cycle_phase == logic.Phase.SHUTDOWN)
+        logic.enqueue(2, 100)
+        await _until(lambda: plant.pump_starts == 2 and logic.task_cycle is None)
+
+    _run(run())
+    assert plant.valves == [1, 2]
+    assert not logic.queue
+    assert logic.current_state.get() == logic.State.IDLE
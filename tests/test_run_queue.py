@@ -0,0 +1,44 @@
+import asyncio
+
+import fleet
+import logic
+from logic import config
+
+
+def test_cleanup_failures_do_not_leave_the_run_busy(monkeypatch):
+    logs = []
+    monkeypatch.setattr(logic, "log", lambda level, msg: logs.append((level, msg)))
+    monkeypatch.setattr(config, "PUMP_RAMP_UP_TIME_S", 0)
+    monkeypatch.setattr(config, "FLEET_ROLE", "satellite")
+
+    async def acquire():
+        pass
+
+    during_release = []
+
+    async def release():
+        during_release.append((logic.current_state.get(), logic.task_cycle))
+        raise OSError("coordinator gone")
+
+    def flush():
+        raise OSError("flash full")
+
+    monkeypatch.setattr(fleet, "acquire", acquire)
+    monkeypatch.setattr(fleet, "release", release)
+    monkeypatch.setattr(logic.history, "flush", flush)
+    logic.current_state.set(logic.State.IDLE)
+    logic.queue.clear()
+
+    async def run():
+        logic.task_cycle = asyncio.current_task()
+        await logic.run_queue()
+
+    asyncio.run(run())
+    # an enqueue during the release must not start a run yet
+    [(state, task)] = during_release
+    assert state == logic.State.RUNNING and task is not None
+    assert logic.current_state.get() == logic.State.IDLE
+    assert logic.cycle_phase == logic.Phase.IDLE
+    assert logic.task_cycle is None
+    errors = [m for level, m in logs if level == "ERROR"]
+    assert any("flash full" in m for m in errors) and any("coordinator gone" in m for m in errors)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import dispense
+import logic
+import selftest
+
+
+class Plumbing:
+    """Stand-in for the executor: every probe ends with a preset result."""
+
+    def __init__(self, results):
+        self.results = results      # valve -> (result, pulses, duration ms)
+
+    def start(self, valve, target, timeout_ms, meter=0):
+        res, pulses, ms = self.results[valve]
+        dispense.st[dispense.RESULT] = res
+        dispense.st[dispense.PULSES] = pulses
+        dispense.st[dispense.DURATION] = ms
+
+
+@pytest.fixture
+def plumbing(monkeypatch):
+    p = Plumbing({})
+    monkeypatch.setattr(dispense, "start", p.start)
+    monkeypatch.setattr(dispense, "busy", lambda: False)
+    monkeypatch.setattr(selftest.config, "PUMP_RAMP_UP_TIME_S", 0)
+    monkeypatch.setattr(logic, "_kick", lambda: None)
+    monkeypatch.setattr(selftest, "baselines", {})
+    return p
+
+
+def _run(save=False):
+    asyncio.run(selftest.run(save))
+    return selftest.report
+
+
+def test_timeout_still_gives_a_rate(plumbing):
+    zones = {z: (dispense.DONE, 30, 1000) for z in range(1, logic.ZONES + 1)}
+    zones[2] = (dispense.TIMEOUT, 10, 5000)
+    zones[3] = (dispense.DRY, 2, 800)
+    plumbing.results = {0: (dispense.DRY, 0, 800), **zones}
+    rep = _run()
+    assert rep["zones"]["1"]["rate"] == 30
+    assert rep["zones"]["2"]["rate"] == 2
+    assert rep["zones"]["3"]["rate"] == 0 and rep["zones"]["3"]["result"] == "blocked"
+    assert not rep["stuck-open"]
+
+
+def test_any_pulse_with_valves_closed_is_stuck_open(plumbing):
+    zones = {z: (dispense.DONE, 30, 1000) for z in range(1, logic.ZONES + 1)}
+    # a slow leak: a few pulses, then the executor sees a dry pump
+    plumbing.results = {0: (dispense.DRY, 3, 800), **zones}
+    assert _run()["stuck-open"]
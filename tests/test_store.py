@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import store
+from esp32 import NVS
+
+
+@pytest.fixture(autouse=True)
+def clean_nvs():
+    NVS.data.clear()
+    store._pending.clear()
+    yield
+    NVS.data.clear()
+
+
+def _crash_after_journal(monkeypatch):
+    # power loss after the journal is committed, before the first key
+    def write(key, value):
+        raise OSError("power lost")
+    monkeypatch.setattr(store, "_write", write)
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.undo()
+    store._pending.clear()
+
+
+def test_journal_keeps_text_as_text(monkeypatch):
+    settings = json.dumps({"zones": ["x" * 40] * 30})
+    store.set_blob("settings", settings.encode())
+    store.set_blob("bssid", b"\xff\x00\x12\x34\x56\x78")
+    store.set_i32("cnt", 7)
+    _crash_after_journal(monkeypatch)
+
+    # only JSON escaping on top, no hex doubling
+    assert NVS.data["jrnl_n"] == len(NVS.data["jrnl"])
+    assert len(NVS.data["jrnl"]) < len(settings) * 3 // 2
+
+    store.recover()
+    assert NVS.data["settings"] == settings.encode()
+    assert NVS.data["bssid"] == b"\xff\x00\x12\x34\x56\x78"
+    assert NVS.data["cnt"] == 7
+    assert "jrnl" not in NVS.data and "jrnl_n" not in NVS.data
+
+
+def test_journal_larger_than_default_buffer(monkeypatch):
+    big = "m" * (store.config.STORE_JOURNAL_SIZE * 2)
+    store.set_blob("settings", big)
+    store.set_blob("last_msg", "ok")
+    _crash_after_journal(monkeypatch)
+
+    store.recover()
+    assert NVS.data["settings"] == big.encode()
+    assert NVS.data["last_msg"] == b"ok"
+
+
+def test_unreadable_journal_is_dropped(monkeypatch):
+    messages = []
+    monkeypatch.setattr(store, "log", lambda level, msg: messages.append(level))
+    # a journal from before jrnl_n existed that does not fit the default buffer
+    NVS.data["jrnl"] = b"{" + b" " * store.config.STORE_JOURNAL_SIZE + b"}"
+
+    store.recover()
+    assert "jrnl" not in NVS.data
+    assert messages == ["ERROR"]
+
+
+def test_no_journal():
+    store.recover()
+    assert NVS.data == {}
+
+
+def test_zone_blobs_grow_with_zones():
+    import tank
+    zones = 64
+    use = {str(z): 2 ** 31 - 1 for z in range(1, zones + 1)}
+    NVS.data["zone_use"] = json.dumps(use).encode()
+    tank.load(zones)
+    assert tank.zone_pulses == use
+    run = {"ts": 2 ** 31 - 1, "cur": True,
+           "items": [(z, 3000, 2, "s" * 16) for z in range(1, zones + 2)]}
+    assert len(json.dumps(run)) <= len(store.zone_buf(zones + 1, 48))
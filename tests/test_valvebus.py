@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+import valvebus
+
+
+@pytest.mark.parametrize("machine,base", [
+    ("ESP32 module with ESP32", 0x3FF44000),
+    ("Generic ESP32 module with ESP32", 0x3FF44000),
+    ("ESP32C3 module with ESP32C3", 0x60004000),
+    ("ESP32S3 module (spiram octal) with ESP32S3", 0x60004000),
+    ("ESP32C6 module with ESP32C6", 0x60091000),
+    # the ESP32 name is part of these, but their registers are elsewhere
+    ("ESP32S2 module with ESP32S2", None),
+    ("ESP32 based board with ESP32H2", None),
+    ("ESP32C3 devkit with ESP32P4", None),
+    ("Linux host", None),
+])
+def test_gpio_base(monkeypatch, machine, base):
+    monkeypatch.setattr(sys.implementation, "_machine", machine)
+    assert valvebus._gpio_base() == base
+
+
+def test_unknown_chip_uses_pins(monkeypatch):
+    monkeypatch.setattr(sys.implementation, "_machine", "ESP32S2 module with ESP32S2")
+    m = valvebus.DiodeMatrix([1, 2, 3, 4])
+    assert m.masks is None and m.zones == 12
+    m.set(1)
+    assert [p.value() for p in m.pins[:2]] == [1, 0]
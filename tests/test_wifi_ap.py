@@ -0,0 +1,45 @@
+import pytest
+
+import net
+import network
+from net import config
+
+
+@pytest.fixture(autouse=True)
+def ap(monkeypatch):
+    made = []
+
+    class WLAN(network.WLAN):
+        def __init__(self, interface=network.STA_IF):
+            super().__init__(interface)
+            made.append(self)
+
+    monkeypatch.setattr(network, "WLAN", WLAN)
+    monkeypatch.setattr(net, "wifi_ap_active", False)
+    monkeypatch.setattr(net, "_ap_refused", False)
+    monkeypatch.setattr(config, "WIFI_AP_SSID", "irrigation")
+    return made
+
+
+def test_disabled_without_ssid(ap, monkeypatch):
+    monkeypatch.setattr(config, "WIFI_AP_SSID", "")
+    net._set_ap(True)
+    assert not net.wifi_ap_active and not ap
+
+
+@pytest.mark.parametrize("key", ["", "short"])
+def test_no_open_ap(ap, monkeypatch, key):
+    monkeypatch.setattr(config, "WIFI_AP_KEY", key)
+    logs = []
+    monkeypatch.setattr(net, "log", lambda level, msg: logs.append(level))
+    net._set_ap(True)
+    net._set_ap(True)
+    assert not net.wifi_ap_active and not ap
+    assert logs == ["ERROR"]
+
+
+def test_wpa2_ap(ap, monkeypatch):
+    monkeypatch.setattr(config, "WIFI_AP_KEY", "plants-need-water")
+    net._set_ap(True)
+    assert net.wifi_ap_active
+    assert ap[0].settings["security"] == 3 and ap[0].settings["key"] == "plants-need-water"
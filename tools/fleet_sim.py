@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Fleet simulator: a coordinator and a few satellites, each the real
+application in its own Linux process, talking HTTP over localhost.
+
+    python3 tools/fleet_sim.py --satellites 3 --slots 1
+
+The MicroPython modules come from tests/shims. Every node gets a simulated
+flow meter that counts pulses while its pump runs and a valve is open. The
+coordinator waits for the satellite reports, starts the global schedule,
+waits until every node has run and then reads the satellites' history
+through GET /fleet/<node>/export. The parent checks that at most `slots`
+pumps ran at the same time and that every zone is in the history.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _event(**kw):
+    kw["t"] = time.monotonic()
+    print("SIM " + json.dumps(kw), flush=True)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- One node, runs in a child process ---
+
+def node(args):
+    for p in (os.path.join(ROOT, "tests", "shims"), os.path.join(ROOT, "lib"), ROOT):
+        sys.path.insert(0, p)
+    import host  # noqa: F401
+
+    import config
+    config.FLEET_ROLE = args.role
+    config.FLEET_NODE = args.name
+    config.FLEET_COORDINATOR = f"127.0.0.1:{args.coordinator}"
+    config.FLEET_PUMP_SLOTS = args.slots
+    config.FLEET_LEASE_S = 6
+    config.FLEET_RETRY_S = 0.5
+    config.FLEET_REPORT_S = 0.5
+    config.WEB_SERVER_PORT = args.port
+    # all nodes share 127.0.0.1 and report much faster than on a real LAN
+    config.WEB_RATE = 0
+    config.DISPENSE_MODE = "async"
+    config.PUMP_RAMP_UP_TIME_S = 0.2
+    config.HISTORY_FILE = os.path.join(args.dir, args.name + ".bin")
+
+    import uasyncio as asyncio
+    import logic
+    import dispense
+    import fleet
+    import history
+    import store
+    import webapp
+
+    valve = [0]
+    set_valve = logic.valve_driver.set
+
+    def drive_valve(v):
+        valve[0] = v
+        set_valve(v)
+    logic.valve_driver.set = drive_valve
+
+    class FlowMeter:
+        """Pulses at args.flow per second while the pump runs and a valve is open."""
+
+        def __init__(self):
+            self.count = 0.0
+            self.last = time.monotonic()
+
+        def value(self, v=None):
+            now = time.monotonic()
+            if logic.pump.duty() and valve[0]:
+                self.count += (now - self.last) * args.flow
+            self.last = now
+            old = int(self.count)
+            if v is not None:
+                self.count = v
+            return old
+
+    logic.meter = FlowMeter()
+
+    pump_start, pump_stop = logic.pump_start, logic.pump_stop
+
+    def sim_pump_start():
+        pump_start()
+        _event(node=args.name, pump=True)
+
+    def sim_pump_stop():
+        if logic.pump.duty():
+            _event(node=args.name, pump=False)
+        pump_stop()
+    logic.pump_start, logic.pump_stop = sim_pump_start, sim_pump_stop
+
+    logic.load_settings()
+    dispense.init([logic.meter] + logic.branch_meters, logic.set_valve, logic.pump)
+    logic.current_state.set(logic.State.IDLE)
+    zones = sum(1 for ml in logic.settings["volumes"].values() if ml)
+
+    async def http_get(path):
+        r, w = await asyncio.open_connection("127.0.0.1", args.port)
+        w.write(f"GET {path} HTTP/1.0\r\n\r\n".encode())
+        await w.drain()
+        data = await r.read()
+        w.close()
+        return data
+
+    async def coordinator(satellites):
+        while len(fleet.nodes) < satellites:
+            await asyncio.sleep(0.2)
+        # the global schedule
+        asyncio.create_task(fleet.trigger_satellites())
+        logic.start_cycle_task(logic.PRIO_LOW, "schedule")
+
+        def done(st):
+            return st["state"] == "IDLE" and st["last_run"]
+        while not (done(logic.summary()) and all(done(st) for st in fleet.nodes.values())):
+            await asyncio.sleep(0.2)
+        for name in fleet.nodes:
+            csv = (await http_get(f"/fleet/{name}/export?fmt=csv")).decode()
+            rows = csv.split("\r\n\r\n", 1)[1].strip().split("\n")[1:]
+            _event(node=name, history=len(rows), zones=zones)
+        _event(node=args.name, history=history.next_seq, zones=zones)
+
+    async def run():
+        asyncio.create_task(webapp.app.serve())
+        asyncio.create_task(store.commit_task())
+        if args.role == "satellite":
+            asyncio.create_task(fleet.reporter(logic.summary))
+            await asyncio.Event().wait()
+        await coordinator(args.satellites)
+
+    asyncio.run(run())
+
+
+# --- Parent: start the nodes and check what they did ---
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--satellites", type=int, default=2)
+    ap.add_argument("--slots", type=int, default=1, help="FLEET_PUMP_SLOTS")
+    ap.add_argument("--flow", type=int, default=5000, help="simulated flow, pulses/s")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("-v", "--verbose", action="store_true", help="show the node logs")
+    ap.add_argument("--role", help=argparse.SUPPRESS)
+    ap.add_argument("--name", help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--coordinator", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.role:
+        return node(args)
+
+    events = []
+    lock = threading.Lock()
+
+    def read(name, proc):
+        for line in proc.stdout:
+            if line.startswith("SIM "):
+                with lock:
+                    events.append(json.loads(line[4:]))
+            elif args.verbose:
+                print(f"{name:>6}: {line}", end="")
+
+    tmp = tempfile.mkdtemp(prefix="fleet_sim_")
+    coord_port = _free_port()
+    nodes = [("coord", "coordinator", coord_port)]
+    nodes += [(f"sat{i}", "satellite", _free_port()) for i in range(1, args.satellites + 1)]
+    procs = []
+    for name, role, port in nodes:
+        cmd = [sys.executable, __file__, "--role", role, "--name", name, "--port", str(port),
+               "--coordinator", str(coord_port), "--dir", tmp, "--slots", str(args.slots),
+               "--satellites", str(args.satellites), "--flow", str(args.flow)]
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        threading.Thread(target=read, args=(name, p), daemon=True).start()
+        procs.append(p)
+    try:
+        procs[0].wait(args.timeout)
+    except subprocess.TimeoutExpired:
+        print(f"coordinator did not finish within {args.timeout}s")
+    for p in procs:
+        p.kill()
+        p.wait()
+    time.sleep(0.1)
+
+    ok = True
+    running = set()
+    peak = 0
+    runs = {}
+    for e in sorted((e for e in events if "pump" in e), key=lambda e: e["t"]):
+        if e["pump"]:
+            running.add(e["node"])
+            runs[e["node"]] = runs.get(e["node"], 0) + 1
+            peak = max(peak, len(running))
+        else:
+            running.discard(e["node"])
+    print(f"pump runs: {runs}, most at once: {peak} (slots {args.slots})")
+    if peak > args.slots or sorted(runs) != sorted(n for n, _, _ in nodes):
+        ok = False
+    hist = {e["node"]: (e["history"], e["zones"]) for e in events if "history" in e}
+    print(f"history records / zones per node: {hist}")
+    if len(hist) != len(nodes) or any(h != z for h, z in hist.values()):
+        ok = False
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Download the zone history of a controller (GET /export) and load it into
+NumPy arrays, or write it as CSV when NumPy is not installed.
+
+    python3 tools/read_history.py http://192.168.1.50 history.npz
+    python3 tools/read_history.py http://192.168.1.50 history.csv --from 1200
+    python3 tools/read_history.py http://192.168.1.10/fleet/node2 node2.csv
+
+The last form reads a fleet satellite through its coordinator.
+
+A download that breaks off is resumed from the last complete block.
+The format is described in history.py.
+"""
+
+import argparse
+import base64
+import csv
+import sys
+import time
+import urllib.request
+
+EPOCH_2000 = 946684800  # seconds between 1970 and 2000
+
+
+class Truncated(Exception):
+    pass
+
+
+def _varint(data, pos):
+    n = shift = 0
+    while True:
+        if pos >= len(data):
+            raise Truncated
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def parse(data):
+    """Parse an export. Returns (header, columns, next seq, complete).
+
+    columns maps each column name to a list of values, including only the
+    blocks that arrived completely.
+    """
+    if data[:4] != b"IRH1":
+        raise ValueError("not a history export")
+    pos = 4
+    ncols, pos = _varint(data, pos)
+    names = []
+    for _ in range(ncols):
+        n, pos = _varint(data, pos)
+        names.append(data[pos:pos + n].decode())
+        pos += n
+    first, pos = _varint(data, pos)
+    last, pos = _varint(data, pos)
+    epoch, pos = _varint(data, pos)
+    header = {"columns": names, "first": first, "next": last, "epoch": epoch}
+    cols = {name: [] for name in ["seq"] + names}
+    seq = first
+    try:
+        while True:
+            if pos >= len(data):
+                raise Truncated
+            tag = data[pos]
+            if tag == ord("E"):
+                return header, cols, seq, True
+            if tag != ord("B"):
+                raise ValueError(f"bad block tag at {pos}")
+            count, p = _varint(data, pos + 1)
+            start, p = _varint(data, p)
+            block = []
+            for name in names:
+                size, p = _varint(data, p)
+                if p + size > len(data):
+                    raise Truncated
+                end = p + size
+                values = []
+                while p < end:
+                    v, p = _varint(data, p)
+                    values.append(v)
+                if name in ("t", "run"):
+                    acc = 0
+                    for i, v in enumerate(values):
+                        acc += _unzigzag(v)
+                        values[i] = acc
+                block.append(values)
+            cols["seq"].extend(range(start, start + count))
+            for name, values in zip(names, block):
+                cols[name].extend(values)
+            seq = start + count
+            pos = p
+    except Truncated:
+        return header, cols, seq, False
+
+
+def download(url, start=0, auth=None, tries=5):
+    """Fetch the history from record start on, resuming after broken transfers."""
+    header, result = None, None
+    while True:
+        req = urllib.request.Request(f"{url.rstrip('/')}/export?from={start}")
+        if auth:
+            req.add_header("Authorization", "Basic " + base64.b64encode(auth.encode()).decode())
+        data = b""
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                while chunk := r.read(4096):
+                    data += chunk
+        except OSError as e:
+            print(f"transfer broke off after {len(data)} bytes: {e}", file=sys.stderr)
+        try:
+            header, cols, start, complete = parse(data)
+        except (Truncated, ValueError):
+            cols, complete = None, False
+        if cols:
+            if result is None:
+                result = cols
+            else:
+                for k, v in cols.items():
+                    result[k].extend(v)
+        if complete:
+            return header, result
+        tries -= 1
+        if tries <= 0:
+            raise OSError(f"giving up, resume with --from {start}")
+        time.sleep(2)
+
+
+def to_numpy(header, cols):
+    import numpy as np
+    arrays = {k: np.asarray(v, dtype=np.int64) for k, v in cols.items()}
+    if header["epoch"] == 2000:
+        arrays["t"] = arrays["t"] + EPOCH_2000
+        arrays["run"] = arrays["run"] + EPOCH_2000
+    # liters from the pulses and the pulses per liter in use at the time
+    arrays["liters"] = arrays["pulses"] / np.maximum(arrays["ppl"], 1)
+    return arrays
+
+
+def write_csv(path, header, cols):
+    offset = EPOCH_2000 if header["epoch"] == 2000 else 0
+    names = list(cols)
+    with open(path, "w", newline="") as f:
+        out = csv.writer(f)
+        out.writerow(names + ["liters"])
+        for row in zip(*(cols[n] for n in names)):
+            rec = dict(zip(names, row))
+            rec["t"] += offset
+            rec["run"] += offset
+            out.writerow([rec[n] for n in names] + [round(rec["pulses"] / max(rec["ppl"], 1), 3)])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("url", help="controller base URL, e.g. http://192.168.1.50")
+    ap.add_argument("out", help="output file, .npz or .csv")
+    ap.add_argument("--from", dest="start", type=int, default=0, help="first record to fetch")
+    ap.add_argument("--auth", help="user:password for HTTP Basic authentication")
+    args = ap.parse_args()
+
+    header, cols = download(args.url, args.start, args.auth)
+    print(f"{len(cols['seq'])} records, next offset {header['next']}")
+    if args.out.endswith(".npz"):
+        try:
+            import numpy as np
+        except ImportError:
+            args.out = args.out[:-4] + ".csv"
+            print(f"NumPy not installed, writing {args.out}")
+        else:
+            np.savez_compressed(args.out, **to_numpy(header, cols))
+            return
+    write_csv(args.out, header, cols)
+
+
+if __name__ == "__main__":
+    main()
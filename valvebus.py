@@ -0,0 +1,144 @@
+# valvebus.py
+# Valve drivers. Each driver precomputes what to write for every zone, so
+# switching a valve is a few register or bus writes. Zone 0 closes all valves.
+
+import sys
+from machine import Pin
+
+import config
+
+# GPIO register block per chip: OUT_W1TS, OUT_W1TC, ENABLE_W1TS, ENABLE_W1TC
+_GPIO_BASE = {
+    "ESP32": 0x3FF44000,
+    "ESP32C3": 0x60004000,
+    "ESP32S3": 0x60004000,
+    "ESP32C6": 0x60091000,
+}
+
+
+def _gpio_base():
+    """Register base for the chip, None (use Pin) for chips not listed.
+
+    sys.implementation._machine ends in "with <chip>", e.g. "Generic ESP32C3
+    module with ESP32C3". Only the chip name is compared, and exactly, so an
+    ESP32-S2 is not taken for an ESP32.
+    """
+    m = sys.implementation._machine
+    if " with " not in m:
+        return None
+    return _GPIO_BASE.get(m.rsplit(" with ", 1)[1].strip().upper().replace("-", ""))
+
+
+class DiodeMatrix:
+    """N pins, every ordered pin pair drives one valve: N * (N - 1) zones.
+
+    Zone order: for each pin driven high, the low pin in index order. For
+    4 pins this is the original 12-zone wiring.
+    """
+    def __init__(self, pins):
+        self.pins = [Pin(p, Pin.IN) for p in pins]
+        n = len(pins)
+        self.table = [(None,) * n]
+        for hi in range(n):
+            for lo in range(n):
+                if lo != hi:
+                    self.table.append(tuple(1 if i == hi else 0 if i == lo else None for i in range(n)))
+        self.zones = len(self.table) - 1
+        base = _gpio_base()
+        if base is None or max(pins) > 31:
+            self.masks = None
+            return
+        from machine import mem32
+        self.mem32 = mem32
+        self.base = base
+        self.all = sum(1 << p for p in pins)
+        # zone -> (enable mask, high mask, low mask)
+        self.masks = []
+        for levels in self.table:
+            en = hi = lo = 0
+            for p, lvl in zip(pins, levels):
+                if lvl is not None:
+                    en |= 1 << p
+                    if lvl:
+                        hi |= 1 << p
+                    else:
+                        lo |= 1 << p
+            self.masks.append((en, hi, lo))
+
+    def set(self, zone):
+        if self.masks is None:
+            for pin, lvl in zip(self.pins, self.table[zone]):
+                if lvl is None:
+                    pin.init(mode=Pin.IN)
+                else:
+                    pin.init(mode=Pin.OUT, value=lvl)
+            return
+        # break before make: release the bus, set the levels, then drive
+        en, hi, lo = self.masks[zone]
+        b = self.base
+        self.mem32[b + 0x28] = self.all
+        self.mem32[b + 0x08] = hi
+        self.mem32[b + 0x0C] = lo
+        self.mem32[b + 0x24] = en
+
+
+class DirectGPIO:
+    """One pin per valve."""
+    def __init__(self, pins, active=1):
+        self.pins = [Pin(p, Pin.OUT, value=1 - active) for p in pins]
+        self.active = active
+        self.zones = len(pins)
+        self.open = 0
+
+    def set(self, zone):
+        if self.open:
+            self.pins[self.open - 1].value(1 - self.active)
+        if zone:
+            self.pins[zone - 1].value(self.active)
+        self.open = zone
+
+
+class ShiftRegister:
+    """Chained 74HC595, one output bit per valve."""
+    def __init__(self, data, clock, latch, count):
+        self.data = Pin(data, Pin.OUT, value=0)
+        self.clock = Pin(clock, Pin.OUT, value=0)
+        self.latch = Pin(latch, Pin.OUT, value=0)
+        self.zones = count * 8
+        self.set(0)
+
+    def set(self, zone):
+        bit = zone - 1
+        for i in range(self.zones - 1, -1, -1):
+            self.data.value(i == bit)
+            self.clock.value(1)
+            self.clock.value(0)
+        self.latch.value(1)
+        self.latch.value(0)
+
+
+class PCF8574:
+    """I2C port expander, active low outputs, 8 valves per chip."""
+    def __init__(self, sda, scl, addr=0x20, freq=100000):
+        from machine import I2C
+        self.i2c = I2C(0, sda=Pin(sda), scl=Pin(scl), freq=freq)
+        self.addr = addr
+        self.zones = 8
+        # zone -> byte to write
+        self.bytes = [bytes([0xFF])] + [bytes([0xFF & ~(1 << i)]) for i in range(8)]
+        self.set(0)
+
+    def set(self, zone):
+        self.i2c.writeto(self.addr, self.bytes[zone])
+
+
+def create():
+    """Build the driver selected by VALVE_DRIVER."""
+    kind = getattr(config, "VALVE_DRIVER", "matrix")
+    if kind == "gpio":
+        return DirectGPIO(config.VALVE_PINS, config.VALVE_ACTIVE)
+    if kind == "595":
+        return ShiftRegister(*config.VALVE_595)
+    if kind == "pcf8574":
+        return PCF8574(*config.VALVE_I2C)
+    return DiodeMatrix(config.VALVE_BUS_PINS)
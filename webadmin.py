@@ -0,0 +1,233 @@
+# webadmin.py
+# Config UI and maintenance handlers. Loaded by webapp on first use.
+
+import json
+import machine
+
+from tz import localtime
+
+import web
+import logic
+import config
+import store
+import tank
+import budget
+import ota
+import history
+import utils
+
+
+async def get_config(r, w):
+    logic.load_settings()
+    await web.send_json(w, logic.settings)
+
+
+async def _read_object(r, w, limit):
+    """Read a JSON object body of at most limit bytes. On a bad body the error
+    response is sent and None returned."""
+    try:
+        buf = await web.read_body(r, limit)
+    except ValueError as e:
+        if 'content-length' not in r.headers:
+            status, err = '411 Length Required', "required"
+        elif str(e) == 'content-length':
+            status, err = '413 Payload Too Large', f"body over {limit} bytes"
+        else:
+            status, err = '400 Bad Request', str(e)
+        await web.send_json(w, {"field": "content-length", "error": err}, status)
+        return None
+    try:
+        s = json.loads(buf)
+        if isinstance(s, dict):
+            return s
+    except ValueError:
+        pass
+    await web.send_json(w, {"field": None, "error": "body must be a JSON object"}, '400 Bad Request')
+    return None
+
+
+async def _update_config(r, w, patch):
+    s = await _read_object(r, w, config.SETTINGS_MAX_BYTES)
+    if s is None:
+        return
+    if patch:
+        # work on a copy, the settings stay untouched if the result is invalid
+        s = web.merge_patch(json.loads(json.dumps(logic.settings)), s)
+    err = logic.settings_error(s)
+    if err:
+        utils.log("WARNING", f"Settings update rejected, {err[0]}: {err[1]}")
+        await web.send_json(w, {"field": err[0], "error": err[1]}, '400 Bad Request')
+        return
+    changed = logic.update_settings(s)
+    if changed:
+        utils.log("INFO", "Settings updated from web")
+    await web.send_json(w, {"changed": changed})
+
+
+async def post_config(r, w):
+    """POST /config replaces all settings."""
+    await _update_config(r, w, False)
+
+
+async def patch_config(r, w):
+    """PATCH /config merges a JSON merge patch into the settings, null removes a key."""
+    await _update_config(r, w, True)
+
+
+async def get_weather(r, w):
+    st = {
+        "factor": budget.current(),
+        "observation": budget.observation,
+        "updated": utils.fmt_time(localtime(budget.updated)) if budget.updated else None,
+    }
+    await web.send_json(w, st)
+
+
+async def post_weather(r, w):
+    obs = await _read_object(r, w, 256)
+    if obs is None:
+        utils.log("ERROR", "Bad weather observation from web")
+        return
+    try:
+        budget.update(obs)
+        await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+    except ValueError:
+        utils.log("ERROR", f"Bad weather observation from web {obs}")
+        await w.awrite(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+
+
+async def reset_tank(r, w):
+    utils.log("INFO", "Tank level reset from web")
+    tank.refill(logic.meter)
+    await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+
+
+async def post_restart(r, w):
+    store.flush()
+    history.flush()
+    machine.reset()
+
+
+async def post_selftest(r, w):
+    """POST /selftest[?save=1], save stores the measured rates as baselines."""
+    import selftest
+    q = web.parse_qs(r.query or '')
+    if selftest.start(save='save' in q):
+        await w.awrite(b"HTTP/1.0 202 Accepted\r\n\r\n")
+    else:
+        await w.awrite(b"HTTP/1.0 409 Conflict\r\n\r\n")
+
+
+async def get_selftest(r, w):
+    import selftest
+    await web.send_json(w, selftest.report)
+
+
+async def get_calibrate(r, w):
+    import calib
+    await web.send_json(w, calib.status())
+
+
+async def post_calibrate(r, w):
+    """POST /calibrate/run?zone=<n>&power=<%>&ml=<ml> dispenses a calibration
+    volume, POST /calibrate/point?ml=<measured ml> stores the result."""
+    import calib
+    try:
+        q = web.parse_qs(r.query or '')
+        action = r.path[len('/calibrate/'):]
+        ml = int(q['ml'])
+        if action == 'run':
+            zone, power = int(q['zone']), int(q['power'])
+            if zone < 1 or zone > logic.ZONES or not 10 <= power <= 100 or not 100 <= ml <= 5000:
+                raise ValueError
+            ok = calib.start(zone, power, ml)
+        elif action == 'point':
+            ok = calib.add_point(ml)
+        else:
+            raise ValueError
+    except (KeyError, ValueError):
+        await w.awrite(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        return
+    if ok:
+        await w.awrite(b"HTTP/1.0 202 Accepted\r\n\r\n")
+    else:
+        await w.awrite(b"HTTP/1.0 409 Conflict\r\n\r\n")
+
+
+async def delete_calibrate(r, w):
+    import calib
+    calib.clear()
+    utils.log("INFO", "Flow meter calibration cleared")
+    await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+
+
+async def put_ota_file(r, w):
+    """PUT /ota/<path>?sha256=<hex>, body streamed into the staging directory."""
+    if logic.current_state.get() == logic.State.RUNNING:
+        await w.awrite(b"HTTP/1.0 409 Conflict\r\n\r\nBusy")
+        return
+    path = r.path[len('/ota/'):]
+    try:
+        q = web.parse_qs(r.query or '')
+        size = int(r.headers['content-length'])
+        await ota.receive(r, path, size, q['sha256'])
+        utils.log("INFO", f"OTA: staged {path}, {size} bytes")
+        await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+    except (KeyError, ValueError) as e:
+        utils.log("ERROR", f"OTA: upload failed: {e}")
+        await w.awrite(f"HTTP/1.0 400 Bad Request\r\n\r\n{e}".encode())
+    except OSError as e:
+        # e.g. the filesystem is full, or the client went away mid-upload
+        utils.log("ERROR", f"OTA: upload of {path} failed: {e}")
+        await w.awrite(f"HTTP/1.0 500 Internal Server Error\r\n\r\n{e}".encode())
+
+
+async def post_ota(r, w):
+    """POST /ota/apply[?reboot=1] or /ota/discard."""
+    action = r.path[len('/ota/'):]
+    try:
+        if action == 'apply':
+            files = ota.prepare()
+            utils.log("INFO", f"OTA: {len(files)} files ready, installed at next boot")
+            await web.send_json(w, files)
+            if 'reboot' in web.parse_qs(r.query or ''):
+                await post_restart(r, w)
+        elif action == 'discard':
+            ota.discard()
+            await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+        else:
+            await w.awrite(b"HTTP/1.0 404 Not Found\r\n\r\n")
+    except (OSError, ValueError) as e:
+        await w.awrite(f"HTTP/1.0 400 Bad Request\r\n\r\n{e}".encode())
+
+
+async def get_ota(r, w):
+    await web.send_json(w, ota.staged())
+
+
+async def get_export(r, w):
+    """GET /export[?from=<seq>][&fmt=csv], zone history from record seq on."""
+    q = web.parse_qs(r.query or '')
+    try:
+        start = int(q.get('from', 0))
+    except ValueError:
+        await w.awrite(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        return
+    if q.get('fmt') == 'csv':
+        await w.awrite(b"HTTP/1.0 200 OK\r\nContent-Type: text/csv\r\n\r\n")
+        buf = []
+        n = 0
+        for line in history.csv_lines(start):
+            buf.append(line)
+            n += len(line)
+            if n >= 512:
+                await w.awrite("".join(buf).encode())
+                buf.clear()
+                n = 0
+        await w.awrite("".join(buf).encode())
+        return
+    await w.awrite(f"HTTP/1.0 200 OK\r\nContent-Type: application/octet-stream\r\nX-Next-Offset: {history.next_seq}\r\n\r\n".encode())
+    await w.awrite(history.header(start))
+    for block in history.blocks(start):
+        await w.awrite(block)
+    await w.awrite(b"E")
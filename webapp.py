@@ -1,46 +1,66 @@
 import uasyncio as asyncio
-import json
-import machine
 
 from tz import localtime
 
 import web
 import logic
 import config
+import tank
+import moisture
+import meters
+import mem
+import supervisor
 import utils
 
 
 app = web.App(host='0.0.0.0', port=config.WEB_SERVER_PORT)
 
 
+def _before_request(r):
+    r.mem = mem.section("web").begin()
+
+
+def _after_request(r):
+    r.mem.end()
+    mem.safe_point("http")
+
+
+app.before_request = _before_request
+app.after_request = _after_request
+if config.WEB_AUTH_PASSWORD or config.WEB_AUTH_TOKEN:
+    app.auth = web.Auth(config.WEB_AUTH_USER, config.WEB_AUTH_PASSWORD, config.WEB_AUTH_TOKEN)
+if config.WEB_RATE:
+    app.limiter = web.RateLimit(config.WEB_RATE, config.WEB_BURST)
+    app.write_cost = config.WEB_WRITE_COST
+
+
 app.static("/static/", "/static")
 app.static("/", "/static/index.html")
 
 @app.route("/status")
 async def status(r, w):
-    tank = config.TANK_SIZE - logic.meter.value() / config.PULSES_PER_LITER
+    level = tank.level_l(logic.meter.value())
     hour = logic.settings["schedule"]["hour"]
     minute = logic.settings["schedule"]["minute"]
     st = {
         "current-time": utils.fmt_time(localtime()),
         "state": logic.current_state.text(),
-        "tank": f"{tank:.1f} L",
+        "tank": "EMPTY" if tank.dry or tank.sensor_low() else f"{level:.1f} L",
         "last-run": utils.fmt_time(localtime(logic.last_run)),
         "next-run": f"{hour:02d}:{minute:02d}" if logic.settings.get("autorun", True) else "Disabled",
         "last-msg": logic.last_run_msg,
         "log": [logic.error_message],
     }
-    await w.awrite(b"HTTP/1.0 200 OK\r\nContent-type: application/json\r\n\r\n")
-    await w.awrite(json.dumps(st).encode())
+    await web.send_json(w, st)
 
 
 @app.route('/run', methods=['POST'])
 async def run_cycle_request(r, w):
     utils.log("INFO", "Run cycle triggered via web interface.")
     if logic.start_cycle_task():
-        msg, code = "<div class='status-success'>Cycle started</div>", 200
+        msg, code = "<div class='status-success'>Cycle queued</div>", 200
     else:
-        msg, code = "<div class='status-error'>System is not idle, cannot start cycle.</div>", 409
+        msg, code = "<div class='status-error'>Cycle rejected, check the state and tank level.</div>", 409
     await w.awrite(f"HTTP/1.0 {code} OK\r\nRefresh: 3;url=/\r\nContent-Type: text/html\r\n\r\n".encode("utf8"))
     await w.awrite(msg.encode("utf8"))
 
@@ -56,43 +76,101 @@ async def stop_cycle_request(r, w):
     await w.awrite(msg.encode("utf8"))
 
 
-@app.route('/config', methods=['GET'])
-async def get_config(r, w):
-    logic.load_settings()
-    await w.awrite(b"HTTP/1.0 200 OK\r\nContent-type: application/json\r\n\r\n")
-    await w.awrite(json.dumps(logic.settings).encode())
-
-
-@app.route('/config', methods=['POST'])
-async def post_config(r, w):
-    buf = await r.read(1024)
+@app.route('/zone/', methods=['POST'])
+async def run_zone_request(r, w):
+    """POST /zone/<n>/run?ml=<ml>[&prio=0..2]"""
     try:
-        s = json.loads(buf)
-        if not logic.validate_settings(s):
-            utils.log("WARNING", f"Settings updated with bad value - {s}. Ignore")
+        parts = r.path.split('/')
+        if len(parts) != 4 or parts[3] != 'run':
             raise ValueError
-        # mutate settings in-place to keep references
-        logic.settings.clear()
-        logic.settings.update(s)
-        utils.log("INFO", "Settings updated from web")
-        logic.save_settings()
-        await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+        zone = int(parts[2])
+        q = web.parse_qs(r.query or '')
+        ml = int(q.get('ml', 0))
+        prio = int(q.get('prio', logic.PRIO_HIGH))
+        logic.check_request(zone, ml, prio)
     except ValueError:
-        utils.log("ERROR", f"Bad settings request from web {buf}")
         await w.awrite(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        return
+    item_id = logic.enqueue(zone, ml, prio, q.get('source', 'web'))
+    if item_id is None:
+        await w.awrite(b"HTTP/1.0 409 Conflict\r\n\r\n")
+        return
+    utils.log("INFO", f"Zone {zone} queued via web interface: {ml}ml")
+    await web.send_json(w, {"id": item_id})
 
 
-@app.route("/reset-tank", methods=['POST'])
-async def reset_tank(r, w):
-    utils.log("INFO", "Tank level reset from web")
-    logic.meter.value(0)
-    logic.nvs.set_i32("cnt", 0)
-    logic.nvs.commit()
-    await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+@app.route('/queue', methods=['GET'])
+async def get_queue(r, w):
+    st = {"current": logic.current_item, "queue": logic.queue}
+    await web.send_json(w, st)
 
 
-@app.route('/restart', methods=['POST'])
-async def post_restart(r, w):
-    machine.reset()
+@app.route('/queue/', methods=['DELETE'])
+async def cancel_queue_item(r, w):
+    try:
+        item_id = int(r.path.split('/')[2])
+    except (ValueError, IndexError):
+        await w.awrite(b"HTTP/1.0 400 Bad Request\r\n\r\n")
+        return
+    if logic.cancel(item_id):
+        await w.awrite(b"HTTP/1.0 200 OK\r\n\r\n")
+    else:
+        await w.awrite(b"HTTP/1.0 404 Not Found\r\n\r\n")
+
+
+@app.route("/moisture")
+async def get_moisture(r, w):
+    await web.send_json(w, moisture.status())
+
+
+@app.route("/meters")
+async def get_meters(r, w):
+    st = {"main": round(logic.meter.value() / config.PULSES_PER_LITER, 2), "branches": meters.status()}
+    await web.send_json(w, st)
+
 
+@app.route("/mem")
+async def get_mem(r, w):
+    # the largest block probe costs several full collections, not during a run
+    idle = logic.current_state.get() == logic.State.IDLE
+    await web.send_json(w, mem.report(probe=idle))
 
+
+@app.route("/tasks")
+async def get_tasks(r, w):
+    await web.send_json(w, supervisor.status())
+
+
+@app.route("/tank")
+async def get_tank(r, w):
+    st = {
+        "level": tank.level_l(logic.meter.value()),
+        "available-ml": tank.available_ml(logic.meter.value()),
+        "dry": tank.dry,
+        "sensor-low": tank.sensor_low(),
+        "zones": tank.usage_l(),
+    }
+    await web.send_json(w, st)
+
+
+# Config UI and maintenance handlers are rarely used, load them on first request
+app.lazy('/config', 'webadmin', 'get_config')
+app.lazy('/config', 'webadmin', 'post_config', methods=['POST'])
+app.lazy('/config', 'webadmin', 'patch_config', methods=['PATCH'])
+app.lazy('/weather', 'webadmin', 'get_weather')
+app.lazy('/weather', 'webadmin', 'post_weather', methods=['POST'])
+app.lazy('/reset-tank', 'webadmin', 'reset_tank', methods=['POST'])
+app.lazy('/restart', 'webadmin', 'post_restart', methods=['POST'])
+app.lazy('/selftest', 'webadmin', 'get_selftest')
+app.lazy('/selftest', 'webadmin', 'post_selftest', methods=['POST'])
+app.lazy('/calibrate', 'webadmin', 'get_calibrate')
+app.lazy('/calibrate/', 'webadmin', 'post_calibrate', methods=['POST'])
+app.lazy('/calibrate', 'webadmin', 'delete_calibrate', methods=['DELETE'])
+app.lazy('/export', 'webadmin', 'get_export')
+app.lazy('/ota', 'webadmin', 'get_ota')
+app.lazy('/ota/', 'webadmin', 'put_ota_file', methods=['PUT'])
+app.lazy('/ota/', 'webadmin', 'post_ota', methods=['POST'])
+
+if config.FLEET_ROLE == "coordinator":
+    import fleet
+    fleet.routes(app)